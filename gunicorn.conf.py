@@ -1,3 +1,4 @@
+import gc
 import multiprocessing
 from enum import StrEnum, auto
 
@@ -35,6 +36,9 @@ class GunicornSettings(BaseSettings):
     GRACEFUL_TIMEOUT: PositiveInt = 120
     TIMEOUT: PositiveInt = 120
     KEEP_ALIVE: PositiveInt = 5
+    # 在 master 中导入应用后再 fork 出 worker, worker 共享已导入的模块,
+    # 重启 worker 时也不用重新导入
+    PRELOAD_APP: bool = True
 
 
 gunicorn_settings = GunicornSettings()  # type: ignore
@@ -51,3 +55,26 @@ accesslog = gunicorn_settings.ACCESS_LOG
 graceful_timeout = gunicorn_settings.GRACEFUL_TIMEOUT
 timeout = gunicorn_settings.TIMEOUT
 keepalive = gunicorn_settings.KEEP_ALIVE
+preload_app = gunicorn_settings.PRELOAD_APP and not gunicorn_settings.RELOAD
+
+
+# See https://docs.python.org/3/library/gc.html#gc.freeze
+if preload_app:
+    # 导入应用时不回收, 避免在 worker 共享的内存页中留下空洞
+    gc.disable()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    from src.main import preload
+
+    preload()
+    # worker 中的回收不再触碰 master 中的对象, 它们所在的页保持共享
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
@@ -1,14 +1,30 @@
 import asyncio
 
-from telegram import Update
+from telegram import Bot, Update
 
+from src.config import settings
 from src.ptb import tgbot
-from src.ptb.constants import WEBHOOK_URL
+from src.ptb.bots import bots
+from src.ptb.constants import TELEGRAM_WEBHOOK_SECRET, WEBHOOK_URL
 
 
-asyncio.run(
-    tgbot.bot.set_webhook(
-        url=f'{WEBHOOK_URL}/telegram',
-        allowed_updates=Update.ALL_TYPES,
-    )
-)
+async def main():
+    # 轮询模式下由 src.ptb.polling 在启动时删除 webhook
+    if settings.TELEGRAM_UPDATE_MODE == 'webhook':
+        await tgbot.bot.set_webhook(
+            url=f'{WEBHOOK_URL}/telegram',
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+        )
+
+    # 其他 bot 总是通过 webhook 接收更新
+    for name, config in bots.configs.items():
+        async with Bot(config.token) as bot:
+            await bot.set_webhook(
+                url=f'{WEBHOOK_URL}/{name}/telegram',
+                allowed_updates=Update.ALL_TYPES,
+                secret_token=bots.secret(name).decode(),
+            )
+
+
+asyncio.run(main())
@@ -0,0 +1,297 @@
+"""Keep the most recent requests for debugging.
+
+`CaptureMiddleware` records a sample of the requests, and every request
+that was answered with an error, into a bounded SQLite table that the
+bot can page through with /recent and /show. The table is shared by all
+gunicorn workers, so every id can be shown whichever worker captured it.
+"""
+
+import hashlib
+import random
+import sqlite3
+import time
+from collections.abc import Collection
+from dataclasses import dataclass
+from http import HTTPStatus
+from pathlib import Path
+
+import orjson
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import settings
+from src.utils.ip import client_ip
+from src.utils.sqlite import connect
+
+
+# 这些头不会被记录, 避免在聊天中泄露密钥
+REDACTED_HEADERS = frozenset(
+    (
+        'authorization',
+        'cookie',
+        'x-hub-signature',
+        'x-hub-signature-256',
+        'x-telegram-bot-api-secret-token',
+    )
+)
+
+
+@dataclass(slots=True)
+class Capture:
+    # 写入前为 None, 除非已经 reserve 了 id
+    id: int | None
+    time: float
+    method: str
+    path: str
+    ip: str | None
+    headers: list[tuple[str, str]]
+    status: int
+    # 从收到请求到开始响应, 以及到响应结束的时间 (秒)
+    response_start: float | None
+    duration: float
+    # 只有被采样的请求才会记录请求体
+    body_size: int | None = None
+    body_digest: str | None = None
+    body_preview: bytes = b''
+
+    @property
+    def verdict(self) -> str:
+        try:
+            return HTTPStatus(self.status).phrase
+        except ValueError:
+            return str(self.status)
+
+
+class RequestCaptures:
+    """Hold the last `size` captures in a SQLite table.
+
+    Ids come from `AUTOINCREMENT`, so they are unique across workers and
+    never reused. Every insert deletes the rows that fell out of the
+    window of the last `size` ids.
+    """
+
+    def __init__(self, path: Path, *, size: int) -> None:
+        self._path = path
+        self._size = size
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            # method 为空的行是 reserve 预留的 id, 请求结束后才会写入
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS capture ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' time REAL,'
+                ' method TEXT,'
+                ' path TEXT,'
+                ' ip TEXT,'
+                ' headers BLOB,'
+                ' status INTEGER,'
+                ' response_start REAL,'
+                ' duration REAL,'
+                ' body_size INTEGER,'
+                ' body_digest TEXT,'
+                ' body_preview BLOB'
+                ')'
+            )
+            self._connection = connection
+        return self._connection
+
+    def __len__(self) -> int:
+        (count,) = self.connection.execute(
+            'SELECT count(*) FROM capture WHERE method IS NOT NULL'
+        ).fetchone()
+        return count
+
+    def reserve(self) -> int:
+        """Take an id before the request is answered."""
+
+        cursor = self.connection.execute('INSERT INTO capture DEFAULT VALUES')
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid
+
+    def add(self, capture: Capture) -> int:
+        """Store `capture`, under its reserved id if it has one."""
+
+        cursor = self.connection.execute(
+            'INSERT OR REPLACE INTO capture (id, time, method, path, ip, '
+            'headers, status, response_start, duration, body_size, '
+            'body_digest, body_preview) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                capture.id,
+                capture.time,
+                capture.method,
+                capture.path,
+                capture.ip,
+                orjson.dumps(capture.headers),
+                capture.status,
+                capture.response_start,
+                capture.duration,
+                capture.body_size,
+                capture.body_digest,
+                capture.body_preview,
+            ),
+        )
+        assert cursor.lastrowid is not None
+        capture.id = cursor.lastrowid
+        self.connection.execute(
+            'DELETE FROM capture WHERE id <= ?', (capture.id - self._size,)
+        )
+        return capture.id
+
+    def get(self, id_: int) -> Capture | None:
+        row = self.connection.execute(
+            f'SELECT {self._columns} FROM capture '
+            'WHERE id = ? AND method IS NOT NULL',
+            (id_,),
+        ).fetchone()
+        return None if row is None else self._capture(row)
+
+    def recent(
+        self, *, before: int | None = None, limit: int = 10
+    ) -> list[Capture]:
+        """Newest first, optionally only those older than `before`."""
+
+        rows = self.connection.execute(
+            f'SELECT {self._columns} FROM capture '
+            'WHERE method IS NOT NULL AND (? IS NULL OR id < ?) '
+            'ORDER BY id DESC LIMIT ?',
+            (before, before, limit),
+        ).fetchall()
+        return [self._capture(i) for i in rows]
+
+    _columns = (
+        'id, time, method, path, ip, headers, status, response_start, '
+        'duration, body_size, body_digest, body_preview'
+    )
+
+    @staticmethod
+    def _capture(row: tuple) -> Capture:
+        id_, time_, method, path, ip, headers, *rest = row
+        return Capture(
+            id_,
+            time_,
+            method,
+            path,
+            ip,
+            [tuple(i) for i in orjson.loads(headers)],
+            *rest,
+        )
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class CaptureMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        captures: RequestCaptures,
+        sample_rate: float,
+        body_preview: int,
+        always: Collection[str] = (),
+        never: Collection[str] = (),
+    ) -> None:
+        self.app = app
+        self.captures = captures
+        self.sample_rate = sample_rate
+        self.body_preview = body_preview
+        # 这些路径的请求总是被记录
+        self.always = frozenset(always)
+        # 这些路径的请求从不被记录, 例如频繁的健康检查
+        self.never = frozenset(never)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or scope['path'] in self.never:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        started = time.perf_counter()
+        # 总是被记录的请求预先拿到 id, 以便在响应中返回
+        always = scope['path'] in self.always
+        id_ = self.captures.reserve() if always else None
+        scope.setdefault('state', {})['capture_id'] = id_
+        sampled = always or random.random() < self.sample_rate
+
+        body_size = 0
+        digest = hashlib.blake2b(digest_size=16)
+        preview = bytearray()
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        response_start = None
+
+        async def receive_body() -> Message:
+            nonlocal body_size
+            message = await receive()
+            if message['type'] == 'http.request':
+                chunk = message.get('body', b'')
+                body_size += len(chunk)
+                digest.update(chunk)
+                if (missing := self.body_preview - len(preview)) > 0:
+                    preview.extend(chunk[:missing])
+            return message
+
+        async def send_status(message: Message) -> None:
+            nonlocal status, response_start
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                response_start = time.perf_counter() - started
+            await send(message)
+
+        try:
+            await self.app(
+                scope, receive_body if sampled else receive, send_status
+            )
+        finally:
+            if sampled or status >= HTTPStatus.BAD_REQUEST:
+                capture = self._capture(
+                    scope,
+                    id_=id_,
+                    started_at=started_at,
+                    status=status,
+                    response_start=response_start,
+                    duration=time.perf_counter() - started,
+                )
+                if sampled:
+                    capture.body_size = body_size
+                    capture.body_digest = digest.hexdigest()
+                    capture.body_preview = bytes(preview)
+                self.captures.add(capture)
+
+    def _capture(
+        self,
+        scope: Scope,
+        *,
+        id_: int | None,
+        started_at: float,
+        status: int,
+        response_start: float | None,
+        duration: float,
+    ) -> Capture:
+        request = Request(scope)
+        headers = [
+            (name, '<redacted>' if name in REDACTED_HEADERS else value)
+            for name, value in request.headers.items()
+        ]
+        return Capture(
+            id=id_,
+            time=started_at,
+            method=scope['method'],
+            path=scope['path'],
+            ip=client_ip(request),
+            headers=headers,
+            status=status,
+            response_start=response_start,
+            duration=duration,
+        )
+
+
+captures = RequestCaptures(
+    settings.DATA_DIR / 'captures.sqlite3', size=settings.CAPTURE_SIZE
+)
@@ -1,9 +1,36 @@
-from typing import Literal
+from datetime import time
+from pathlib import Path
+from typing import Annotated, Literal
 
-from pydantic import HttpUrl
+from pydantic import (
+    BaseModel,
+    Field,
+    HttpUrl,
+    IPvAnyNetwork,
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveFloat,
+    PositiveInt,
+    StringConstraints,
+)
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+WebhookSecret = Annotated[
+    str, StringConstraints(pattern=r'^[A-Za-z0-9_-]{1,256}$')
+]
+BotName = Annotated[str, StringConstraints(pattern=r'^[A-Za-z0-9_-]{1,64}$')]
+Repository = Annotated[str, StringConstraints(pattern=r'^[\w.-]+/[\w.-]+$')]
+# X-GitHub-Hook-Installation-Target-Type 和 -ID 请求头, 例如 repository:123
+WebhookTarget = Annotated[str, StringConstraints(pattern=r'^[a-z_:]+:\d+$')]
+
+
+class BotSettings(BaseModel):
+    token: str
+    admin_chat_id: int
+    webhook_secret: WebhookSecret | None = None
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_prefix='FASTAPI_',
@@ -11,19 +38,49 @@ class Settings(BaseSettings):
         env_file_encoding='utf-8',
         env_nested_delimiter='_',
         extra='ignore',
+        # 运行时只会整体替换, 见 src.runtime_config
+        frozen=True,
     )
 
     # SECURITY WARNING: don't run with debug turned on in production!
     DEBUG: bool = True
 
     ALLOW_ORIGINS: list[str] = []
+    # 只有来自这些地址的连接, 其 X-Forwarded-For 头才会被采信. 默认只有
+    # 本机, 反向代理在其他地址 (例如容器网络中的 cloudflared) 时需要把
+    # 它的地址或网段加进来, 见 README
+    TRUSTED_PROXIES: list[IPvAnyNetwork] = [
+        IPvAnyNetwork(i) for i in ('127.0.0.0/8', '::1/128')
+    ]
 
     TELEGRAM_TOKEN: str
     TELEGRAM_ADMIN_CHAT_ID: int
+    # setWebhook 的 secret_token, 未设置时由 TELEGRAM_TOKEN 派生
+    TELEGRAM_WEBHOOK_SECRET: WebhookSecret | None = None
+    # webhook: Telegram 推送更新, 需要 HTTPS 域名
+    # polling: 主动通过 getUpdates 拉取更新
+    TELEGRAM_UPDATE_MODE: Literal['webhook', 'polling'] = 'webhook'
+    TELEGRAM_POLLING_TIMEOUT: PositiveInt = 50
+    # 同一进程托管的其他 bot, 以 JSON 配置, 例如
+    # {"name": {"token": "...", "admin_chat_id": 123}}
+    # 它们的 webhook 位于 /webhooks/ptb/{name}/telegram 和 .../gh
+    TELEGRAM_BOTS: dict[BotName, BotSettings] = {}
+    # 同时运行的其他 bot 数量, 超出后停止最久未使用的
+    TELEGRAM_BOT_MAX_ACTIVE: PositiveInt = 32
+    # 空闲超过该秒数的 bot 会被停止, 下次收到更新时再启动
+    TELEGRAM_BOT_IDLE_TIMEOUT: PositiveInt = 600
+    # 每个其他 bot 的 HTTP 连接池大小
+    TELEGRAM_BOT_POOL_SIZE: PositiveInt = 4
 
     DOMAIN: HttpUrl
 
     GITHUB_WEBHOOK_SECRET: str
+    # 同时接受的其他密钥, 用于轮换密钥
+    GITHUB_WEBHOOK_SECRETS: list[str] = []
+    # 部分仓库或组织的 webhook 使用的密钥, 以 JSON 配置, 例如
+    # {"repository:123": ["new", "old"], "organization:456": ["..."]}
+    # 没有列出的仓库和组织使用上面的密钥; 列表中新的密钥放在前面
+    GITHUB_WEBHOOK_TARGET_SECRETS: dict[WebhookTarget, list[str]] = {}
     GITHUB_WEBHOOK_EVENTS: (
         set[
             Literal[
@@ -38,6 +95,96 @@ class Settings(BaseSettings):
         ]
         | None
     ) = None
+    # 调用 GitHub API 时使用的 token, 未设置时每小时只能请求 60 次
+    GITHUB_TOKEN: str | None = None
+    GITHUB_API_URL: HttpUrl = HttpUrl('https://api.github.com')
+    # 为 /releases 等交互请求保留的 API 请求次数, 轮询不会用掉它们
+    GITHUB_RATE_LIMIT_RESERVE: NonNegativeInt = 10
+    # 无法安装 webhook 的仓库, 定期轮询它们的 release
+    GITHUB_POLL_REPOSITORIES: list[Repository] = []
+    # 轮询间隔的上下限 (秒), 在其中按各仓库发布 release 的频率调整
+    GITHUB_POLL_MIN_INTERVAL: PositiveInt = 5 * 60
+    GITHUB_POLL_MAX_INTERVAL: PositiveInt = 6 * 60 * 60
+    # 只接受来自 GitHub webhook 地址段的请求, 地址段取自 GITHUB_META_URL
+    # 的 hooks, 并在 DATA_DIR 中保存一份快照
+    GITHUB_HOOK_ALLOWLIST: bool = False
+    GITHUB_META_URL: HttpUrl = HttpUrl('https://api.github.com/meta')
+    # 多少秒刷新一次地址段
+    GITHUB_META_REFRESH_INTERVAL: PositiveInt = 24 * 60 * 60
+
+    # 持久化数据 (消息索引等) 的存放目录
+    DATA_DIR: Path = Path('data')
+    # 超过该天数的 release 不再编辑原消息, 而是发送新消息
+    MESSAGE_INDEX_RETENTION_DAYS: PositiveInt = 90
+
+    # 收到的 release 先在内存中积攒, 达到数量或间隔秒数后一次性写入
+    RELEASE_STORE_BATCH_SIZE: PositiveInt = 100
+    RELEASE_STORE_FLUSH_INTERVAL: PositiveFloat = 1
+
+    # 订阅了摘要的聊天每天在该时间 (UTC) 收到摘要
+    DIGEST_TIME: time = time(9)
+    # 每周的摘要在星期几发送, 0 为星期日
+    DIGEST_WEEKDAY: int = Field(1, ge=0, le=6)
+
+    # 是否将 release 的文件作为附件转发到 Telegram
+    MIRROR_ASSETS: bool = False
+    # Bot API 上传文件的大小上限为 50MB
+    MIRROR_ASSET_MAX_SIZE: PositiveInt = 50 * 1024 * 1024
+    # 同时上传的请求数
+    MIRROR_CONCURRENCY: PositiveInt = 2
+    # 缓存的 Telegram file_id 数量, 已上传过的文件直接引用 file_id 发送
+    FILE_ID_CACHE_SIZE: PositiveInt = 10000
+
+    # update_queue 中允许积压的更新数量, 超出后返回 503
+    UPDATE_QUEUE_MAX_SIZE: PositiveInt = 10000
+    UPDATE_QUEUE_TELEGRAM_LIMIT: PositiveInt = 2000
+    UPDATE_QUEUE_GITHUB_LIMIT: PositiveInt = 5000
+    # 各来源的调度权重, Telegram 的交互命令优先处理
+    UPDATE_QUEUE_TELEGRAM_WEIGHT: PositiveInt = 8
+    UPDATE_QUEUE_GITHUB_WEIGHT: PositiveInt = 4
+    # 拒绝时建议对方多少秒后重试
+    UPDATE_QUEUE_RETRY_AFTER: PositiveInt = 30
+    # 同时处理的更新数量, 同一仓库或聊天的更新仍按顺序处理
+    UPDATE_CONCURRENCY: PositiveInt = 8
+    # /readyz 在最早的待处理更新等待超过该秒数, Telegram 请求持续失败
+    # 超过该秒数, 或 HEALTH_WINDOW 秒内至少 READY_MIN_REQUESTS 个请求中
+    # 失败的比例超过 READY_MAX_ERROR_RATE 时返回 503
+    READY_MAX_QUEUE_AGE: PositiveFloat = 120
+    READY_MAX_FAILING_FOR: PositiveFloat = 300
+    READY_MAX_ERROR_RATE: float = Field(0.5, ge=0, le=1)
+    READY_MIN_REQUESTS: PositiveInt = 20
+    HEALTH_WINDOW: PositiveInt = 300
+    # /readyz 的结果缓存多少秒
+    HEALTH_CACHE_TTL: NonNegativeFloat = 1
+    # 每隔多少秒检查一次 env 文件是否被修改, 修改后重新加载部分配置,
+    # 见 src.runtime_config; 也可以向 worker 发送 SIGHUP
+    CONFIG_WATCH_INTERVAL: PositiveFloat = 5
+    # 关闭时最多等待多少秒处理积压的更新, 剩下的在下次启动时处理;
+    # 应小于 gunicorn 的 GRACEFUL_TIMEOUT
+    SHUTDOWN_DRAIN_TIMEOUT: PositiveFloat = 90
+
+    # /releases 每页显示的 release 数量, 以及渲染好的页面的缓存
+    RELEASE_PAGE_SIZE: int = Field(5, ge=1, le=100)
+    RELEASE_PAGE_CACHE_SIZE: PositiveInt = 256
+    RELEASE_PAGE_CACHE_TTL: PositiveInt = 300
+    # 超出 64 字节的 callback data 在数据库中保留的数量, 按钮中只携带 key
+    CALLBACK_DATA_CACHE_SIZE: PositiveInt = 1024
+    # /search 和 inline 模式每次返回的结果数量, inline 最多 50 个
+    SEARCH_PAGE_SIZE: int = Field(10, ge=1, le=50)
+    # Telegram 缓存 inline 查询结果的秒数, 期间相同的查询不会再发到 bot
+    SEARCH_INLINE_CACHE_TIME: NonNegativeInt = 300
+
+    # 在 DATA_DIR 中保留最近的请求, 可以通过 bot 的 /recent 和 /show 查看
+    CAPTURE_SIZE: PositiveInt = 256
+    # 记录请求的比例, 返回错误的请求和 /check 总是会被记录
+    CAPTURE_SAMPLE_RATE: float = Field(0.1, ge=0, le=1)
+    # 被记录的请求保留请求体开头的多少字节
+    CAPTURE_BODY_PREVIEW: NonNegativeInt = 512
+
+    # 发送消息失败时的重试策略 (秒)
+    SEND_RETRY_ATTEMPTS: PositiveInt = 5
+    SEND_RETRY_BASE_DELAY: PositiveFloat = 1
+    SEND_RETRY_MAX_DELAY: PositiveFloat = 60
 
 
 settings = Settings()  # type: ignore
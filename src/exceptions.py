@@ -1,7 +1,8 @@
+from functools import cache
 from typing import ClassVar, Generic, Literal, TypeVar
 
+import orjson
 from fastapi import Response
-from fastapi.responses import JSONResponse
 from fastapi.utils import is_body_allowed_for_status_code
 from pydantic import BaseModel, create_model
 from starlette.status import (
@@ -10,6 +11,7 @@ from starlette.status import (
     HTTP_404_NOT_FOUND,
     HTTP_409_CONFLICT,
     HTTP_500_INTERNAL_SERVER_ERROR,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 
 from src.models import CamelModel
@@ -33,6 +35,20 @@ class Error(CamelModel, Generic[BaseModelT]):
     error: BaseModelT
 
 
+# 序列化好的错误响应体, 以错误的类和内容为键
+ERROR_BODY_CACHE_SIZE = 1024
+_error_bodies: dict[tuple, bytes] = {}
+
+
+def _error_body(exc: 'BaseHTTPError | NamedHTTPError', key: tuple) -> bytes:
+    key = (type(exc), *key)
+    if (body := _error_bodies.get(key)) is None:
+        body = orjson.dumps(exc.data.model_dump(exclude_none=True))
+        if len(_error_bodies) < ERROR_BODY_CACHE_SIZE:
+            _error_bodies[key] = body
+    return body
+
+
 class BaseHTTPError(
     Exception,
     Generic[ErrorCodeT, BaseErrorModelT],
@@ -47,13 +63,24 @@ class BaseHTTPError(
         message: str,
         headers: dict[str, str] | None = None,
     ) -> None:
-        model = self.model_class(code=code, message=message)
         self.code = code
-        self.data = Error(error=model)
+        self.message = message
         self.headers = headers
 
+    @property
+    def data(self) -> Error[BaseErrorModelT]:
+        return Error(
+            error=self.model_class(code=self.code, message=self.message)
+        )
+
+    @property
+    def body(self) -> bytes:
+        """`data` as JSON, rendered once per error class and content."""
+
+        return _error_body(self, (self.code, self.message))
+
     def __str__(self) -> str:
-        return f'{self.STATUS_CODE}: {self.data.error.code}'
+        return f'{self.STATUS_CODE}: {self.code}'
 
     def __repr__(self) -> str:
         return f'{self.model_class: str(self.error)}'
@@ -106,13 +133,22 @@ class BaseBadRequestError(
         target: TargetT | None = None,
         headers: dict[str, str] | None = None,
     ) -> None:
-        model = self.model_class(
-            code=code,
-            message=message,
-            target=target,
+        super().__init__(code=code, message=message, headers=headers)
+        self.target = target
+
+    @property
+    def data(self) -> Error[BaseBadRequestErrorModel[ErrorCodeT, TargetT]]:
+        return Error(
+            error=self.model_class(
+                code=self.code,
+                message=self.message,
+                target=self.target,
+            )
         )
-        self.data = Error(error=model)
-        self.headers = headers
+
+    @property
+    def body(self) -> bytes:
+        return _error_body(self, (self.code, self.message, self.target))
 
 
 # Bad Request
@@ -142,6 +178,32 @@ class ForbiddenError(HTTPError[Literal['forbidden']]):
         )
 
 
+class ServiceUnavailableErrorModel(
+    ErrorModel[Literal['service_unavailable']]
+): ...
+
+
+class ServiceUnavailableError(HTTPError[Literal['service_unavailable']]):
+    model_class = ServiceUnavailableErrorModel
+    STATUS_CODE = HTTP_503_SERVICE_UNAVAILABLE
+
+    def __init__(
+        self,
+        *,
+        message: str = 'The service is overloaded, please try again later',
+        retry_after: int | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        if retry_after is not None:
+            headers = {**(headers or {}), 'Retry-After': str(retry_after)}
+
+        super().__init__(
+            code='service_unavailable',
+            message=message,
+            headers=headers,
+        )
+
+
 class NamedHTTPError(Exception):
     STATUS_CODE: int = HTTP_400_BAD_REQUEST
     ERROR_CODE: str | None = None
@@ -152,6 +214,7 @@ class NamedHTTPError(Exception):
         return cls.__name__.removesuffix('Error')
 
     @classmethod
+    @cache
     def model_class(cls):
         type_ = cls.name()
         error_code = cls.ERROR_CODE or type_
@@ -182,22 +245,28 @@ class NamedHTTPError(Exception):
         target: str | None = None,
         headers: dict[str, str] | None = None,
     ) -> None:
-        kwargs = {
-            'code': self.code(),
-            'message': message,
-        }
-
         if target is not None:
             target = to_camel(target)
-            kwargs['target'] = target
-            kwargs['message'] = kwargs['message'].format(target=target)
-
-        model = self.model_class()(**kwargs)
-        self.data = Error(error=model)
+            message = message.format(target=target)
+        self.message = message
+        self.target = target
         self.headers = headers
 
+    @property
+    def data(self) -> Error:
+        kwargs = {'code': self.code(), 'message': self.message}
+        if self.target is not None:
+            kwargs['target'] = self.target
+        return Error(error=self.model_class()(**kwargs))
+
+    @property
+    def body(self) -> bytes:
+        """`data` as JSON, rendered once per error class and content."""
+
+        return _error_body(self, (self.message, self.target))
+
     def __str__(self) -> str:
-        return f'{self.STATUS_CODE}: {self.data.error.code}'  # type: ignore
+        return f'{self.STATUS_CODE}: {self.code()}'
 
     def __repr__(self) -> str:
         return f'{self.model_class: str(self.error)}'
@@ -237,13 +306,15 @@ class NotFoundError(NamedHTTPError):
         super().__init__(target=target, message=message, headers=headers)
 
 
-def http_error_handler(_, exc: BaseHTTPError | NamedHTTPError):
+# 同步的处理函数会被 starlette 放到线程池中运行
+async def http_error_handler(_, exc: BaseHTTPError | NamedHTTPError):
     headers = getattr(exc, 'headers', None)
     if not is_body_allowed_for_status_code(exc.STATUS_CODE):
         return Response(status_code=exc.STATUS_CODE, headers=headers)
 
-    return JSONResponse(
-        exc.data.model_dump(exclude_none=True),
+    return Response(
+        exc.body,
         status_code=exc.STATUS_CODE,
         headers=headers,
+        media_type='application/json',
     )
@@ -1,31 +1,156 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from telegram import Update
 
+from src.captures import CaptureMiddleware, captures
 from src.config import settings
-from src.logger import logger  # noqa: F401
-from src.ptb import tgbot
+from src.exceptions import (
+    BaseHTTPError,
+    NamedHTTPError,
+    NotFoundError,
+    http_error_handler,
+)
+from src.logger import logger
+from src.ptb import assets, github, tgbot, update_queue
+from src.ptb.bots import bots, shared_ssl_context
+from src.ptb.callback_data import callback_data
+from src.ptb.constants import DEFAULT_BOT
+from src.ptb.dead_letter import dead_letters
+from src.ptb.digests import digests
+from src.ptb.file_cache import file_id_cache
+from src.ptb.github_meta import github_hooks
+from src.ptb.github_poller import release_poller
+from src.ptb.message_index import message_index
+from src.ptb.polling import create_poller
+from src.ptb.release_store import release_store
+from src.ptb.spool import drain, spool
 from src.router import router
+from src.runtime_config import ReloadableCORSMiddleware, runtime_config
 
 
 @asynccontextmanager
 async def lifespan(_):
     async with tgbot:
         await tgbot.start()
+        await requeue_spooled()
+
+        poller = None
+        if settings.TELEGRAM_UPDATE_MODE == 'polling':
+            poller = asyncio.create_task(
+                create_poller(tgbot.bot, update_queue).run()
+            )
+
+        # 定期停止空闲的其他 bot
+        evictor = asyncio.create_task(bots.run()) if bots.configs else None
+        store_flusher = asyncio.create_task(release_store.run())
+        hooks_refresher = None
+        if settings.GITHUB_HOOK_ALLOWLIST:
+            hooks_refresher = asyncio.create_task(github_hooks.run())
+        # 仓库可以在运行时加入, 没有仓库时也启动
+        release_poller_task = asyncio.create_task(release_poller.run())
+        config_watcher = asyncio.create_task(runtime_config.run())
+
         yield
-        await tgbot.stop()
 
+        for task in (
+            poller,
+            evictor,
+            store_flusher,
+            hooks_refresher,
+            release_poller_task,
+            config_watcher,
+        ):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        await drain_updates()
+    await assets.close()
+    await github.close()
+    message_index.close()
+    file_id_cache.close()
+    dead_letters.close()
+    digests.close()
+    release_poller.close()
+    release_store.close()
+    spool.close()
+    captures.close()
+    callback_data.close()
+
+
+async def drain_updates() -> None:
+    """Handle the backlog of all bots until `SHUTDOWN_DRAIN_TIMEOUT`,
+    spool what is left."""
+
+    timeout = settings.SHUTDOWN_DRAIN_TIMEOUT
+    left, bots_left = await asyncio.gather(
+        drain(tgbot, timeout), bots.drain(timeout)
+    )
+    spooled = spool.add(DEFAULT_BOT, left)
+    for name, updates in bots_left.items():
+        spooled += spool.add(name, updates)
+    if spooled:
+        logger.warning(f'Spooled {spooled} updates for the next boot')
+
+
+async def requeue_spooled() -> None:
+    """Queue the updates spooled at the last shutdown again."""
 
-app = FastAPI(title='FastAPI PTB', lifespan=lifespan)
+    spooled = spool.take()
+    for name, update in spooled:
+        try:
+            app = tgbot if name == DEFAULT_BOT else await bots.get(name)
+        except NotFoundError:
+            logger.warning(f'Dropped a spooled update of unknown bot {name}')
+            continue
+        if isinstance(update, dict):
+            update = Update.de_json(update, app.bot)
+        app.update_queue.put_nowait(update)
+    if spooled:
+        logger.info(f'Queued {len(spooled)} spooled updates')
+
+
+app = FastAPI(
+    title='FastAPI PTB',
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+    exception_handlers={
+        BaseHTTPError: http_error_handler,
+        NamedHTTPError: http_error_handler,
+    },
+)
 
 
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.ALLOW_ORIGINS,
+    # 允许的来源取自 runtime_config, 可以在运行时修改
+    ReloadableCORSMiddleware,
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
 )
+app.add_middleware(
+    CaptureMiddleware,
+    captures=captures,
+    sample_rate=settings.CAPTURE_SAMPLE_RATE,
+    body_preview=settings.CAPTURE_BODY_PREVIEW,
+    always=['/webhooks/ptb/check'],
+    never=['/webhooks/ptb/livez', '/webhooks/ptb/readyz'],
+)
 
 app.include_router(router)
+
+
+def preload() -> None:
+    """Do the work shared by all workers once, before gunicorn forks them.
+
+    Nothing opened at import time may be used by several processes:
+    the bots, HTTP connection pools and databases are only started or
+    opened by each worker, in `lifespan`.
+    """
+
+    app.openapi()
+    # 其他 bot 共用的 SSL context, 加载 CA 证书会占用约 1.5MB
+    shared_ssl_context()
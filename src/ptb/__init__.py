@@ -1,7 +1,13 @@
+from typing import cast
+
 from telegram.ext import Application, ContextTypes
+from telegram.request import BaseRequest
 
 from src.config import settings
-from src.ptb.bot import setup_ptb
+from src.ptb.bot import schedule_digests, setup_ptb
+from src.ptb.constants import DEFAULT_BOT
+from src.ptb.processor import KeyedUpdateProcessor
+from src.ptb.update_queue import UpdateQueue, create_update_queue
 from src.ptb.utils import CustomContext
 
 
@@ -10,12 +16,42 @@ Set up PTB application and a web application for handling the incoming
 requests.
 """
 context_types = ContextTypes(context=CustomContext)
-# Here we set updater to None because we want our custom webhook server to
-# handle the updates and hence we don't need an Updater instance
-tgbot = setup_ptb(
-    Application.builder()
-    .token(settings.TELEGRAM_TOKEN)
-    .updater(None)
-    .context_types(context_types)
-    .build()
+
+
+def create_application(
+    token: str,
+    admin_chat_id: int,
+    *,
+    name: str = DEFAULT_BOT,
+    request: BaseRequest | None = None,
+    get_updates_request: BaseRequest | None = None,
+) -> Application:
+    update_queue = create_update_queue()
+    update_processor = KeyedUpdateProcessor(
+        workers=settings.UPDATE_CONCURRENCY,
+        buffer_size=settings.UPDATE_CONCURRENCY * 4,
+    )
+    update_queue.backpressure = update_processor.slots
+    # Here we set updater to None because we want our custom webhook server
+    # to handle the updates and hence we don't need an Updater instance
+    builder = (
+        Application.builder()
+        .token(token)
+        .updater(None)
+        .update_queue(update_queue)
+        .concurrent_updates(update_processor)
+        .context_types(context_types)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    return setup_ptb(builder.build(), name=name, admin_chat_id=admin_chat_id)
+
+
+tgbot = schedule_digests(
+    create_application(
+        settings.TELEGRAM_TOKEN, settings.TELEGRAM_ADMIN_CHAT_ID
+    )
 )
+update_queue = cast(UpdateQueue, tgbot.update_queue)
@@ -0,0 +1,253 @@
+"""Mirror release assets into Telegram as documents.
+
+Assets are streamed from GitHub straight into a hand-built multipart
+body, so a file is never held in memory as a whole. Up to ten assets
+are sent together with `sendMediaGroup`, and a global semaphore bounds
+the number of uploads in flight. Once uploaded, an asset is re-sent by
+its Telegram `file_id` instead.
+"""
+
+import asyncio
+import secrets
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import asdict, dataclass
+
+import httpx
+import orjson
+from telegram.constants import MediaGroupLimit
+
+from src.config import settings
+from src.logger import logger
+from src.ptb.file_cache import file_id_cache
+from src.ptb.models import ReleaseAsset
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class MirrorMetrics:
+    assets_sent: int = 0
+    assets_failed: int = 0
+    assets_skipped: int = 0
+    assets_cached: int = 0
+    bytes_sent: int = 0
+    uploads_in_flight: int = 0
+
+
+metrics = MirrorMetrics()
+
+_client: httpx.AsyncClient | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(30, read=300, write=300),
+        )
+    return _client
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.MIRROR_CONCURRENCY)
+    return _semaphore
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class _Multipart:
+    """A `multipart/form-data` body whose file parts are streamed."""
+
+    def __init__(self) -> None:
+        self.boundary = secrets.token_hex(16)
+        self._fields: list[bytes] = []
+        self._files: list[tuple[bytes, ReleaseAsset]] = []
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def _header(self, name: str, filename: str | None = None) -> bytes:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            filename = filename.replace('"', '%22')
+            disposition += f'; filename="{filename}"'
+        return (
+            f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+        ).encode()
+
+    def add_field(self, name: str, value: str) -> None:
+        self._fields.append(
+            self._header(name) + b'\r\n' + value.encode() + b'\r\n'
+        )
+
+    def add_file(self, name: str, asset: ReleaseAsset) -> None:
+        header = (
+            self._header(name, asset.name)
+            + f'Content-Type: {asset.content_type}\r\n\r\n'.encode()
+        )
+        self._files.append((header, asset))
+
+    @property
+    def trailer(self) -> bytes:
+        return f'--{self.boundary}--\r\n'.encode()
+
+    def __len__(self) -> int:
+        return (
+            sum(len(i) for i in self._fields)
+            + sum(
+                len(header) + asset.size + 2 for header, asset in self._files
+            )
+            + len(self.trailer)
+        )
+
+    async def stream(self, client: httpx.AsyncClient) -> AsyncIterator[bytes]:
+        for field in self._fields:
+            yield field
+
+        for header, asset in self._files:
+            yield header
+            # Content-Length 按 GitHub 给出的大小计算, 不一致时中止上传,
+            # 否则 Telegram 收到的文件会错位
+            sent = 0
+            async with client.stream('GET', asset.url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_raw(CHUNK_SIZE):
+                    sent += len(chunk)
+                    if sent > asset.size:
+                        break
+                    metrics.bytes_sent += len(chunk)
+                    yield chunk
+            if sent != asset.size:
+                raise RuntimeError(
+                    f'{asset.name} is not {asset.size} bytes long'
+                )
+            yield b'\r\n'
+
+        yield self.trailer
+
+
+async def _upload(
+    base_url: str,
+    bot_id: int,
+    chat_id: int,
+    assets: Sequence[ReleaseAsset],
+    reply_to_message_id: int | None,
+) -> None:
+    """Send one group of assets.
+
+    Assets that were uploaded before are sent by their cached `file_id`,
+    only the others are streamed from GitHub.
+    """
+
+    body = _Multipart()
+    body.add_field('chat_id', str(chat_id))
+    if reply_to_message_id is not None:
+        body.add_field(
+            'reply_parameters',
+            orjson.dumps(
+                {
+                    'message_id': reply_to_message_id,
+                    'allow_sending_without_reply': True,
+                }
+            ).decode(),
+        )
+
+    cached = [file_id_cache.get(i, bot_id) for i in assets]
+    if len(assets) == 1:
+        method = 'sendDocument'
+        if cached[0] is None:
+            body.add_file('document', assets[0])
+        else:
+            body.add_field('document', cached[0])
+    else:
+        method = 'sendMediaGroup'
+        media = []
+        for index, (asset, file_id) in enumerate(
+            zip(assets, cached, strict=True)
+        ):
+            if file_id is None:
+                file_id = f'attach://file{index}'
+                body.add_file(f'file{index}', asset)
+            media.append({'type': 'document', 'media': file_id})
+        body.add_field('media', orjson.dumps(media).decode())
+
+    client = get_client()
+    response = await client.post(
+        f'{base_url}/{method}',
+        content=body.stream(client),
+        headers={
+            'Content-Type': body.content_type,
+            'Content-Length': str(len(body)),
+        },
+    )
+    result = orjson.loads(response.content)
+    if not result.get('ok'):
+        # 缓存的 file_id 可能已经失效, 下次重新上传
+        for asset, file_id in zip(assets, cached, strict=True):
+            if file_id is not None:
+                file_id_cache.discard(asset, bot_id)
+        raise RuntimeError(result.get('description') or response.text)
+
+    metrics.assets_cached += sum(i is not None for i in cached)
+    messages = result['result']
+    if isinstance(messages, dict):
+        messages = [messages]
+    for asset, file_id, message in zip(assets, cached, messages, strict=False):
+        if file_id is None and (document := message.get('document')):
+            file_id_cache.put(asset, bot_id, document['file_id'])
+
+
+async def mirror_assets(
+    base_url: str,
+    chat_id: int,
+    assets: Sequence[ReleaseAsset],
+    *,
+    bot_id: int,
+    reply_to_message_id: int | None = None,
+) -> None:
+    """Send `assets` to `chat_id` as documents.
+
+    Assets larger than `MIRROR_ASSET_MAX_SIZE` are skipped, the rest are
+    sent in groups of up to ten files.
+    """
+
+    accepted: list[ReleaseAsset] = []
+    for asset in assets:
+        if asset.size > settings.MIRROR_ASSET_MAX_SIZE:
+            metrics.assets_skipped += 1
+            logger.info(f'Skip mirroring {asset.name}: {asset.size} bytes')
+        else:
+            accepted.append(asset)
+
+    size = MediaGroupLimit.MAX_MEDIA_LENGTH
+    for group in (
+        accepted[i : i + size] for i in range(0, len(accepted), size)
+    ):
+        async with get_semaphore():
+            metrics.uploads_in_flight += 1
+            try:
+                await _upload(
+                    base_url, bot_id, chat_id, group, reply_to_message_id
+                )
+            except (httpx.HTTPError, RuntimeError, ValueError) as e:
+                metrics.assets_failed += len(group)
+                logger.error(
+                    f'Failed to mirror {[i.name for i in group]}: {e!r}'
+                )
+            else:
+                metrics.assets_sent += len(group)
+            finally:
+                metrics.uploads_in_flight -= 1
+
+        logger.info(f'Asset mirroring progress: {asdict(metrics)}')
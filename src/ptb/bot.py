@@ -1,17 +1,80 @@
 from typing import TypeVar
 
-from telegram.ext import Application, CommandHandler, TypeHandler
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    InlineQueryHandler,
+    TypeHandler,
+    filters,
+)
 
-from src.ptb.handlers import start, webhook_update
+from src.config import settings
+from src.ptb.digests import DigestPeriod
+from src.ptb.handlers import (
+    dead_letter_list,
+    digest,
+    inline_search,
+    recent,
+    releases,
+    releases_page,
+    replay,
+    search,
+    send_digest,
+    show,
+    start,
+    webhook_update,
+)
 from src.ptb.models import WebhookUpdate
 
 
 _AppT = TypeVar('_AppT', bound=Application)
 
 
-def setup_ptb(tgbot: _AppT) -> _AppT:
+def setup_ptb(tgbot: _AppT, *, name: str, admin_chat_id: int) -> _AppT:
+    # 见 CustomContext.bot_name 和 CustomContext.admin_chat_id
+    tgbot.bot_data['bot'] = name
+    tgbot.bot_data['admin_chat_id'] = admin_chat_id
+
     # register handlers
     tgbot.add_handler(CommandHandler('start', start))
     tgbot.add_handler(TypeHandler(type=WebhookUpdate, callback=webhook_update))
+    tgbot.add_handler(InlineQueryHandler(inline_search))
+
+    admin = filters.Chat(admin_chat_id)
+    tgbot.add_handler(CommandHandler('search', search, filters=admin))
+    # 使用服务器的 GITHUB_TOKEN 请求 GitHub, 可以读到私有仓库
+    tgbot.add_handler(CommandHandler('releases', releases, filters=admin))
+    tgbot.add_handler(
+        CallbackQueryHandler(releases_page, pattern=r'^releases=&')
+    )
+    tgbot.add_handler(
+        CommandHandler('deadletters', dead_letter_list, filters=admin)
+    )
+    tgbot.add_handler(CommandHandler('replay', replay, filters=admin))
+    tgbot.add_handler(CommandHandler('recent', recent, filters=admin))
+    tgbot.add_handler(CommandHandler('show', show, filters=admin))
+
+    return tgbot
+
+
+def schedule_digests(tgbot: _AppT) -> _AppT:
+    """Let chats subscribe to the digests sent by `tgbot`, see
+    `src.ptb.digests`."""
 
+    assert tgbot.job_queue is not None
+    tgbot.add_handler(CommandHandler('digest', digest))
+    tgbot.job_queue.run_daily(
+        send_digest,
+        settings.DIGEST_TIME,
+        data=DigestPeriod.DAILY,
+        name='daily digest',
+    )
+    tgbot.job_queue.run_daily(
+        send_digest,
+        settings.DIGEST_TIME,
+        days=(settings.DIGEST_WEEKDAY,),
+        data=DigestPeriod.WEEKLY,
+        name='weekly digest',
+    )
     return tgbot
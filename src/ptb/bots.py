@@ -0,0 +1,230 @@
+"""Host the bots of `TELEGRAM_BOTS` next to the default one.
+
+A bot's `Application` is only started when the first update for it
+arrives, and stopped again once it has been idle for
+`TELEGRAM_BOT_IDLE_TIMEOUT` seconds or when more than
+`TELEGRAM_BOT_MAX_ACTIVE` bots are running, so that many rarely used
+bots cost little more than their configuration.
+
+Each `httpx` client would load the CA bundle into an SSL context of its
+own, about 800 KiB apiece and two clients per bot, so all bots share a
+single context and a small connection pool instead.
+"""
+
+import asyncio
+import ssl
+import time
+from collections import OrderedDict
+from functools import cache
+from typing import cast
+
+import httpx
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+from src.config import BotSettings, settings
+from src.exceptions import NotFoundError, ServiceUnavailableError
+from src.logger import logger
+from src.ptb import create_application
+from src.ptb.constants import derive_webhook_secret
+from src.ptb.models import UpdateSource
+from src.ptb.processor import KeyedUpdateProcessor
+from src.ptb.spool import drain
+from src.ptb.update_queue import UpdateQueue
+
+
+@cache
+def shared_ssl_context() -> ssl.SSLContext:
+    return httpx.create_ssl_context()
+
+
+def _is_idle(app: Application) -> bool:
+    processor = cast(KeyedUpdateProcessor, app.update_processor)
+    return (
+        app.update_queue.empty() and processor.current_concurrent_updates == 0
+    )
+
+
+class BotRegistry:
+    def __init__(
+        self,
+        configs: dict[str, BotSettings],
+        *,
+        max_active: int,
+        idle_timeout: float,
+        pool_size: int,
+    ) -> None:
+        self.configs = configs
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self.started = 0
+        self.evicted = 0
+        self.failed = 0
+        self._secrets = {
+            name: (
+                config.webhook_secret or derive_webhook_secret(config.token)
+            ).encode()
+            for name, config in configs.items()
+        }
+        # 按最近使用的顺序排列, 最久未使用的在最前面
+        self._active: OrderedDict[str, Application] = OrderedDict()
+        self._last_used: dict[str, float] = {}
+        self._starting: dict[str, asyncio.Task[Application]] = {}
+        self.closed = False
+
+    def _config(self, name: str) -> BotSettings:
+        if (config := self.configs.get(name)) is None:
+            raise NotFoundError(target='bot')
+        return config
+
+    def secret(self, name: str) -> bytes:
+        """The `secret_token` of the bot's webhook."""
+
+        self._config(name)
+        return self._secrets[name]
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise ServiceUnavailableError(
+                message='The service is shutting down',
+                retry_after=settings.UPDATE_QUEUE_RETRY_AFTER,
+            )
+
+    def admit(self, name: str, source: UpdateSource) -> None:
+        """Like `UpdateQueue.admit`, without starting the bot.
+
+        A bot that is not running has nothing queued.
+        """
+
+        self._config(name)
+        self._check_open()
+        if (app := self._active.get(name)) is not None:
+            cast(UpdateQueue, app.update_queue).admit(source)
+
+    async def get(self, name: str) -> Application:
+        """Return the running application of bot `name`, starting it if
+        necessary.
+
+        Once `drain`ed no bot is started or returned any more.
+        """
+
+        config = self._config(name)
+        self._check_open()
+        self._last_used[name] = time.monotonic()
+        if (app := self._active.get(name)) is not None:
+            self._active.move_to_end(name)
+            return app
+
+        if (task := self._starting.get(name)) is None:
+            task = asyncio.create_task(self._start(name, config))
+            self._starting[name] = task
+            task.add_done_callback(lambda _: self._starting.pop(name, None))
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # drain 取消了启动, 而调用方本身并未被取消
+            current = asyncio.current_task()
+            if task.cancelled() and current and not current.cancelling():
+                self._check_open()
+            raise
+
+    async def _start(self, name: str, config: BotSettings) -> Application:
+        httpx_kwargs = {'verify': shared_ssl_context()}
+        app = create_application(
+            config.token,
+            config.admin_chat_id,
+            name=name,
+            request=HTTPXRequest(
+                connection_pool_size=self.pool_size,
+                httpx_kwargs=httpx_kwargs,
+            ),
+            # 只通过 webhook 接收更新, 用不到 getUpdates
+            get_updates_request=HTTPXRequest(httpx_kwargs=httpx_kwargs),
+        )
+        try:
+            await app.initialize()
+            await app.start()
+        except Exception:
+            self.failed += 1
+            logger.exception(f'Failed to start bot {name}')
+            raise
+
+        logger.info(f'Started bot {name}')
+        self.started += 1
+        self._active[name] = app
+        await self._evict_over_limit()
+        return app
+
+    async def _stop(self, name: str) -> None:
+        if (app := self._active.pop(name, None)) is None:
+            return
+        self._last_used.pop(name, None)
+        await app.stop()
+        await app.shutdown()
+        self.evicted += 1
+        logger.info(f'Stopped bot {name}')
+
+    async def _evict_over_limit(self) -> None:
+        excess = len(self._active) - self.max_active
+        if excess <= 0:
+            return
+        # 仍有更新在处理的 bot 暂时保留, 之后再停止;
+        # 最后一个是刚刚启动的, 也不停止
+        candidates = [
+            name
+            for name, app in list(self._active.items())[:-1]
+            if _is_idle(app)
+        ]
+        for name in candidates[:excess]:
+            await self._stop(name)
+
+    async def evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_timeout
+        for name in [
+            name
+            for name, app in self._active.items()
+            if self._last_used.get(name, 0) < deadline and _is_idle(app)
+        ]:
+            await self._stop(name)
+
+    async def run(self) -> None:
+        """Stop idle bots periodically."""
+
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            await self._evict_over_limit()
+            await self.evict_idle()
+
+    async def drain(self, timeout: float) -> dict[str, list[object]]:
+        """Stop accepting updates and `drain` the running bots, return
+        the updates each of them left."""
+
+        self.closed = True
+        for task in list(self._starting.values()):
+            task.cancel()
+        names = list(self._active)
+        left = await asyncio.gather(
+            *(drain(self._active[name], timeout) for name in names)
+        )
+        for name in names:
+            app = self._active.pop(name)
+            await app.shutdown()
+        return dict(zip(names, left, strict=True))
+
+    def metrics(self) -> dict:
+        return {
+            'configured': len(self.configs),
+            'active': len(self._active),
+            'started': self.started,
+            'evicted': self.evicted,
+            'failed': self.failed,
+        }
+
+
+bots = BotRegistry(
+    settings.TELEGRAM_BOTS,
+    max_active=settings.TELEGRAM_BOT_MAX_ACTIVE,
+    idle_timeout=settings.TELEGRAM_BOT_IDLE_TIMEOUT,
+    pool_size=settings.TELEGRAM_BOT_POOL_SIZE,
+)
@@ -0,0 +1,80 @@
+import hashlib
+import sqlite3
+import time
+from base64 import urlsafe_b64encode
+from pathlib import Path
+
+from src.config import settings
+from src.utils.sqlite import connect
+
+
+class CallbackDataStore:
+    """Keep callback payloads that do not fit into Telegram's 64 bytes.
+
+    The button only carries a short key derived from the payload, the
+    payload is kept in a SQLite table shared by all workers, so whichever
+    worker receives the callback query can resolve it. Only the
+    `max_size` most recently used payloads are kept, handlers have to
+    expect `get` to return `None` for old buttons.
+    """
+
+    def __init__(self, path: Path, *, max_size: int) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS callback_data ('
+                ' key TEXT PRIMARY KEY,'
+                ' payload TEXT NOT NULL,'
+                ' used_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS callback_data_used_at '
+                'ON callback_data (used_at)'
+            )
+            self._connection = connection
+        return self._connection
+
+    def put(self, payload: str) -> str:
+        # key 由 payload 决定, 各 worker 为同一个 payload 生成相同的 key
+        digest = hashlib.blake2b(payload.encode(), digest_size=6).digest()
+        key = urlsafe_b64encode(digest).decode()
+        self.connection.execute(
+            'INSERT OR REPLACE INTO callback_data (key, payload, used_at) '
+            'VALUES (?, ?, ?)',
+            (key, payload, time.time()),
+        )
+        self.connection.execute(
+            'DELETE FROM callback_data WHERE key IN ('
+            ' SELECT key FROM callback_data'
+            ' ORDER BY used_at DESC LIMIT -1 OFFSET ?'
+            ')',
+            (self._max_size,),
+        )
+        return key
+
+    def get(self, key: str) -> str | None:
+        row = self.connection.execute(
+            'UPDATE callback_data SET used_at = ? WHERE key = ? '
+            'RETURNING payload',
+            (time.time(), key),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+# 与 release_store 共用一个数据库
+callback_data = CallbackDataStore(
+    settings.DATA_DIR / 'releases.sqlite3',
+    max_size=settings.CALLBACK_DATA_CACHE_SIZE,
+)
@@ -1,4 +1,25 @@
+import hashlib
+import hmac
+
 from src.config import settings
 
 
 WEBHOOK_URL = f'{settings.DOMAIN}webhooks/ptb'
+
+# 默认 bot 的名字, TELEGRAM_BOTS 中的 bot 以它们的键命名
+DEFAULT_BOT = ''
+
+
+def derive_webhook_secret(token: str) -> str:
+    return hmac.new(
+        token.encode(), b'telegram-webhook-secret', hashlib.sha256
+    ).hexdigest()
+
+
+# Telegram 会在每次推送更新时带上 X-Telegram-Bot-Api-Secret-Token 头
+TELEGRAM_WEBHOOK_SECRET = settings.TELEGRAM_WEBHOOK_SECRET or (
+    derive_webhook_secret(settings.TELEGRAM_TOKEN)
+)
+
+# 撤回 release 的动作, 原消息会被改为划掉的版本号
+RETRACTED_ACTIONS = frozenset(('deleted', 'unpublished'))
@@ -0,0 +1,103 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from src.config import settings
+from src.ptb.models import WebhookUpdate
+from src.utils.sqlite import connect
+
+
+class DeadLetter(NamedTuple):
+    id: int
+    bot: str
+    failed_at: float
+    chat_id: int
+    kind: str
+    error: str
+    update: WebhookUpdate
+
+
+class DeadLetterStore:
+    """Persist notifications that could not be delivered.
+
+    Entries can be listed and replayed from the bot, see
+    `src.ptb.handlers.dead_letters` and `src.ptb.handlers.replay`. Each
+    entry belongs to the bot that failed to deliver it, and is only
+    visible to that bot.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS dead_letter ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' bot TEXT NOT NULL,'
+                ' failed_at REAL NOT NULL,'
+                ' chat_id INTEGER NOT NULL,'
+                ' kind TEXT NOT NULL,'
+                ' error TEXT NOT NULL,'
+                ' payload BLOB NOT NULL'
+                ')'
+            )
+            self._connection = connection
+        return self._connection
+
+    def add(
+        self,
+        update: WebhookUpdate,
+        *,
+        bot: str,
+        chat_id: int,
+        kind: str,
+        error: str,
+    ) -> int:
+        cursor = self.connection.execute(
+            'INSERT INTO dead_letter '
+            '(bot, failed_at, chat_id, kind, error, payload) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (bot, time.time(), chat_id, kind, error, update.to_json()),
+        )
+        return cursor.lastrowid or 0
+
+    def entries(self, bot: str, limit: int = 20) -> list[DeadLetter]:
+        rows = self.connection.execute(
+            'SELECT id, bot, failed_at, chat_id, kind, error, payload '
+            'FROM dead_letter WHERE bot = ? ORDER BY id LIMIT ?',
+            (bot, limit),
+        ).fetchall()
+        return [
+            DeadLetter(*row[:6], WebhookUpdate.from_json(row[6]))
+            for row in rows
+        ]
+
+    def count(self, bot: str) -> int:
+        return self.connection.execute(
+            'SELECT count(*) FROM dead_letter WHERE bot = ?', (bot,)
+        ).fetchone()[0]
+
+    def pop(self, bot: str, id_: int) -> DeadLetter | None:
+        """Remove and return entry `id_`, if it belongs to `bot`."""
+
+        row = self.connection.execute(
+            'DELETE FROM dead_letter WHERE id = ? AND bot = ? '
+            'RETURNING id, bot, failed_at, chat_id, kind, error, payload',
+            (id_, bot),
+        ).fetchone()
+        if row is None:
+            return None
+        return DeadLetter(*row[:6], WebhookUpdate.from_json(row[6]))
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+dead_letters = DeadLetterStore(settings.DATA_DIR / 'dead_letters.sqlite3')
@@ -1,45 +1,132 @@
-import hashlib
 import hmac
 from dataclasses import dataclass
 from datetime import UTC, datetime
 from typing import Annotated
 
 import orjson
-from fastapi import Body, Depends, Header, Request
+from fastapi import Depends, Header, Request
 
 from src.config import settings
 from src.exceptions import ForbiddenError
+from src.ptb import update_queue
+from src.ptb.bots import bots
+from src.ptb.constants import TELEGRAM_WEBHOOK_SECRET
+from src.ptb.github_meta import github_hooks
+from src.ptb.models import UpdateSource
+from src.ptb.projection import EVENT_PROJECTIONS, project
+from src.runtime_config import runtime_config
+from src.utils.ip import client_ip
 
 
-def valid_release_event(
-    payload_body: dict = Body(),
+def admission(source: UpdateSource):
+    """Reject the request with `503` while `source` is backlogged.
+
+    Use it in the route's `dependencies` so that it runs before the
+    request body is read.
+    """
+
+    # 这里的检查都不会阻塞, 声明为 async 可以省去在线程池中运行的开销
+    async def admit():
+        update_queue.admit(source)
+
+    return Depends(admit)
+
+
+def bot_admission(source: UpdateSource):
+    """`admission` for the bot named by the `bot` path parameter."""
+
+    async def admit(bot: str):
+        bots.admit(bot, source)
+
+    return Depends(admit)
+
+
+_TELEGRAM_WEBHOOK_SECRET = TELEGRAM_WEBHOOK_SECRET.encode()
+
+
+async def valid_telegram_update(
+    secret_token: str = Header('', alias='x-telegram-bot-api-secret-token'),
+):
+    """Verify that the update was pushed by Telegram.
+
+    Raise and return 403 if the secret token registered with setWebhook
+    is missing or wrong, before the body is read.
+    """
+
+    if not hmac.compare_digest(
+        secret_token.encode(), _TELEGRAM_WEBHOOK_SECRET
+    ):
+        raise ForbiddenError(message='Invalid secret token!')
+
+
+async def valid_bot_telegram_update(
+    bot: str,
+    secret_token: str = Header('', alias='x-telegram-bot-api-secret-token'),
+):
+    """`valid_telegram_update` for the bot named by the `bot` path
+    parameter."""
+
+    if not hmac.compare_digest(secret_token.encode(), bots.secret(bot)):
+        raise ForbiddenError(message='Invalid secret token!')
+
+
+async def valid_github_source(request: Request):
+    """Reject requests that do not come from GitHub's hook addresses.
+
+    Only enforced with `GITHUB_HOOK_ALLOWLIST`, and only once the ranges
+    have been loaded, until then the signature check alone applies.
+    """
+
+    if (
+        settings.GITHUB_HOOK_ALLOWLIST
+        and github_hooks.loaded
+        and client_ip(request) not in github_hooks
+    ):
+        raise ForbiddenError(message='Request did not come from GitHub!')
+
+
+async def valid_release_event(
+    request: Request,
     event: str = Header(alias='x-github-event'),
     signature_header: str = Header(alias='x-hub-signature-256'),
+    target_type: str | None = Header(
+        None, alias='x-github-hook-installation-target-type'
+    ),
+    target_id: str | None = Header(
+        None, alias='x-github-hook-installation-target-id'
+    ),
 ):
     """Verify that the payload was sent from GitHub by validating SHA256.
 
-    Raise and return 403 if not authorized.
+    Raise and return 403 if not authorized. The body is read here rather
+    than declared as a `Body()` parameter, which FastAPI would read before
+    running any of the route's dependencies.
 
     Args:
-        payload_body: original request body to verify (request.body())
+        request: the body to verify is read from it (request.body())
         signature_header: header received from GitHub (x-hub-signature-256)
+        target_type, target_id: the repository or organization of the
+            hook, they select the secrets it may be signed with
     """
 
     if not signature_header:
         raise ForbiddenError(message='x-hub-signature-256 header is missing!')
 
-    hash_object = hmac.new(
-        settings.GITHUB_WEBHOOK_SECRET.encode('utf-8'),
-        msg=orjson.dumps(payload_body),
-        digestmod=hashlib.sha256,
-    )
-    expected_signature = 'sha256=' + hash_object.hexdigest()
-    if not hmac.compare_digest(expected_signature, signature_header):
+    config = runtime_config.current
+    target = None
+    if target_type is not None and target_id is not None:
+        target = f'{target_type}:{target_id}'
+    body = await request.body()
+    if not config.github_webhook_keys.verify(body, signature_header, target):
         raise ForbiddenError(message="Request signatures didn't match!")
 
+    if (projection := EVENT_PROJECTIONS.get(event)) is None:
+        return None
+    payload_body = project(orjson.loads(body), projection)
+
+    events = config.github_webhook_events
     if event == 'release' and (
-        settings.GITHUB_WEBHOOK_EVENTS is None
-        or payload_body.get('action') in settings.GITHUB_WEBHOOK_EVENTS
+        events is None or payload_body.get('action') in events
     ):
         return payload_body
     return None
@@ -48,36 +135,7 @@ def valid_release_event(
 ReleaseData = Annotated[dict | None, Depends(valid_release_event)]
 
 
-IP_HEADERS = [
-    'X-Forwarded-For',  # 最常见的, 用于传递客户端 IP
-    'X-Real-IP',  # 一些代理服务器使用, 如 Nginx
-    'Proxy-Client-IP',  # 一些代理服务器或应用使用
-    'WL-Proxy-Client-IP',  # WebLogic 服务器代理使用
-    'HTTP_CLIENT_IP',  # 某些环境下的自定义头
-    'HTTP_X_FORWARDED_FOR',  # 某些环境下的自定义头
-    'CF-Connecting-IP',  # Cloudflare 使用
-    'True-Client-IP',  # Akamai 使用
-    'X-Cluster-Client-IP',  # 某些负载均衡器使用
-    'Fastly-Client-IP',  # Fastly CDN 使用
-    'Forwarded',  # 标准化头, RFC 7239 定义
-]
-
-
-def request_ip(request: Request):
-    headers = request.headers
-
-    for i in IP_HEADERS:
-        result = headers.get(i)
-        if result:
-            return result
-
-    if request.client:
-        return request.client.host
-
-    return '127.0.0.1'
-
-
-RequestIP = Annotated[str | None, Depends(request_ip)]
+RequestIP = Annotated[str | None, Depends(client_ip)]
 
 
 def request_user_agent(request: Request):
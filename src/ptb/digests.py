@@ -0,0 +1,337 @@
+"""Send chats a periodic summary of the releases instead of one message
+per release.
+
+Every release that arrives is added to a running aggregate per digest
+period, so building a digest only reads the releases of its window. The
+aggregates live in SQLite and are shared by all gunicorn workers. Each
+worker schedules the digest jobs, the first one to claim a window sends
+it and the others find it already claimed. The window only moves on
+once the digest was delivered, if it could not be sent at all its
+releases are sent with the next one.
+"""
+
+import html
+import sqlite3
+from datetime import UTC, datetime, timedelta
+from enum import StrEnum, auto
+from itertools import groupby
+from pathlib import Path
+from typing import NamedTuple
+
+from telegram.constants import MessageLimit
+
+from src.config import settings
+from src.ptb.constants import DEFAULT_BOT
+from src.ptb.models import StoredRelease
+from src.ptb.release_store import release_store
+from src.utils.sqlite import connect
+
+
+class DigestPeriod(StrEnum):
+    DAILY = auto()
+    WEEKLY = auto()
+
+
+PERIOD_LENGTH = {
+    DigestPeriod.DAILY: timedelta(days=1),
+    DigestPeriod.WEEKLY: timedelta(weeks=1),
+}
+
+SCHEMA = (
+    (
+        'CREATE TABLE IF NOT EXISTS digest_subscription ('
+        ' chat_id INTEGER NOT NULL,'
+        ' period TEXT NOT NULL,'
+        ' PRIMARY KEY (chat_id, period)'
+        ') WITHOUT ROWID'
+    ),
+    (
+        'CREATE TABLE IF NOT EXISTS digest_window ('
+        ' period TEXT PRIMARY KEY,'
+        ' start REAL NOT NULL,'
+        ' claimed_at REAL'
+        ')'
+    ),
+    (
+        'CREATE TABLE IF NOT EXISTS digest_release ('
+        ' period TEXT NOT NULL,'
+        ' release_id INTEGER NOT NULL,'
+        ' repository TEXT NOT NULL,'
+        ' tag TEXT NOT NULL,'
+        ' name TEXT,'
+        ' html_url TEXT NOT NULL,'
+        ' prerelease INTEGER NOT NULL,'
+        ' published_at REAL NOT NULL,'
+        ' PRIMARY KEY (period, release_id)'
+        ') WITHOUT ROWID'
+    ),
+    (
+        'CREATE INDEX IF NOT EXISTS digest_release_release_id '
+        'ON digest_release (release_id)'
+    ),
+)
+
+DIGEST_COLUMNS = (
+    'release_id, repository, tag, name, html_url, prerelease, published_at'
+)
+
+
+class DigestEntry(NamedTuple):
+    release_id: int
+    repository: str
+    tag: str
+    name: str | None
+    html_url: str
+    prerelease: bool
+    published_at: float
+
+
+class Digest(NamedTuple):
+    period: DigestPeriod
+    start: float
+    end: float
+    # 按仓库和发布时间排序
+    entries: list[DigestEntry]
+
+
+def _entry_row(period: DigestPeriod, release: StoredRelease) -> tuple:
+    assert release.published_at is not None
+    return (
+        period,
+        release.id,
+        release.repository,
+        release.tag,
+        release.name,
+        release.html_url,
+        release.prerelease,
+        release.published_at.timestamp(),
+    )
+
+
+class DigestStore:
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._connection = connection
+            for period in DigestPeriod:
+                self._open_window(period)
+        return self._connection
+
+    def _open_window(self, period: DigestPeriod) -> None:
+        # 第一次启动时, 用 release 历史填充当前的窗口
+        connection = self.connection
+        end = datetime.now(UTC)
+        start = end - PERIOD_LENGTH[period]
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO digest_window (period, start) '
+                'VALUES (?, ?)',
+                (period, start.timestamp()),
+            )
+            if cursor.rowcount:
+                connection.executemany(
+                    f'INSERT OR REPLACE INTO digest_release '
+                    f'(period, {DIGEST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [
+                        _entry_row(period, i)
+                        for i in release_store.published_between(
+                            start, end, bot=DEFAULT_BOT
+                        )
+                    ],
+                )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def record(self, release: StoredRelease) -> None:
+        """Add `release` to the running aggregates, or take it out of
+        them once it was deleted or turned back into a draft."""
+
+        if release.deleted or release.published_at is None:
+            self.connection.execute(
+                'DELETE FROM digest_release WHERE release_id = ?',
+                (release.id,),
+            )
+            return
+
+        self.connection.executemany(
+            f'INSERT OR REPLACE INTO digest_release (period, {DIGEST_COLUMNS}) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [_entry_row(i, release) for i in DigestPeriod],
+        )
+
+    def claim(self, period: DigestPeriod, end: float) -> Digest | None:
+        """Take the aggregate of `period` up to `end`.
+
+        The releases stay in the aggregate until the digest is either
+        `complete`d or `release`d. Return `None` if another worker
+        already claimed this window.
+        """
+
+        connection = self.connection
+        half_period = PERIOD_LENGTH[period].total_seconds() / 2
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            start, claimed_at = connection.execute(
+                'SELECT start, claimed_at FROM digest_window WHERE period = ?',
+                (period,),
+            ).fetchone()
+            # 同一时间触发的其他 worker 会看到刚刚开始或正在发送的窗口,
+            # 发送中途退出的 worker 留下的标记在半个周期后失效
+            if end - start < half_period or (
+                claimed_at is not None and end - claimed_at < half_period
+            ):
+                connection.execute('ROLLBACK')
+                return None
+
+            rows = connection.execute(
+                f'SELECT {DIGEST_COLUMNS} FROM digest_release '
+                'WHERE period = ? ORDER BY repository, published_at',
+                (period,),
+            ).fetchall()
+            connection.execute(
+                'UPDATE digest_window SET claimed_at = ? WHERE period = ?',
+                (end, period),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+        return Digest(
+            period=period,
+            start=start,
+            end=end,
+            entries=[
+                DigestEntry(*row[:5], bool(row[5]), row[6]) for row in rows
+            ],
+        )
+
+    def complete(self, digest: Digest) -> None:
+        """Take the releases of the delivered `digest` out of the
+        aggregate and start the next window."""
+
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # 发送期间收到的 release 留给下一个窗口
+            connection.executemany(
+                'DELETE FROM digest_release '
+                'WHERE period = ? AND release_id = ?',
+                [(digest.period, i.release_id) for i in digest.entries],
+            )
+            connection.execute(
+                'UPDATE digest_window SET start = ?, claimed_at = NULL '
+                'WHERE period = ?',
+                (digest.end, digest.period),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def release(self, digest: Digest) -> None:
+        """Give up the claim on `digest`, its releases are sent with
+        the next digest of the period."""
+
+        self.connection.execute(
+            'UPDATE digest_window SET claimed_at = NULL WHERE period = ?',
+            (digest.period,),
+        )
+
+    def subscribe(self, chat_id: int, period: DigestPeriod) -> None:
+        self.connection.execute(
+            'INSERT OR IGNORE INTO digest_subscription (chat_id, period) '
+            'VALUES (?, ?)',
+            (chat_id, period),
+        )
+
+    def unsubscribe(
+        self, chat_id: int, period: DigestPeriod | None = None
+    ) -> int:
+        if period is None:
+            cursor = self.connection.execute(
+                'DELETE FROM digest_subscription WHERE chat_id = ?',
+                (chat_id,),
+            )
+        else:
+            cursor = self.connection.execute(
+                'DELETE FROM digest_subscription '
+                'WHERE chat_id = ? AND period = ?',
+                (chat_id, period),
+            )
+        return cursor.rowcount
+
+    def subscriptions(self, chat_id: int) -> list[DigestPeriod]:
+        rows = self.connection.execute(
+            'SELECT period FROM digest_subscription WHERE chat_id = ? '
+            'ORDER BY period',
+            (chat_id,),
+        ).fetchall()
+        return [DigestPeriod(period) for (period,) in rows]
+
+    def subscribers(self, period: DigestPeriod) -> list[int]:
+        rows = self.connection.execute(
+            'SELECT chat_id FROM digest_subscription WHERE period = ?',
+            (period,),
+        ).fetchall()
+        return [chat_id for (chat_id,) in rows]
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _format_time(timestamp: float) -> str:
+    return f'{datetime.fromtimestamp(timestamp, UTC):%Y-%m-%d %H:%M}'
+
+
+def render_digest(
+    digest: Digest, *, limit: int = MessageLimit.MAX_TEXT_LENGTH
+) -> list[str]:
+    """Render `digest` as HTML, split into messages of at most `limit`
+    characters."""
+
+    repositories = sum(
+        1 for _ in groupby(i.repository for i in digest.entries)
+    )
+    header = (
+        f'📰 <b>{digest.period.capitalize()} release digest</b>\n'
+        f'{_format_time(digest.start)} – {_format_time(digest.end)} UTC\n'
+        f'{len(digest.entries)} release(s) in {repositories} repositories'
+    )
+
+    messages: list[str] = []
+    current = header
+    for repository, entries in groupby(
+        digest.entries, key=lambda i: i.repository
+    ):
+        lines = [f'\n\n<b>{html.escape(repository)}</b>']
+        for entry in entries:
+            pre = ' (pre-release)' if entry.prerelease else ''
+            lines.append(
+                f'\n🏷️ <a href="{html.escape(entry.html_url)}">'
+                f'{html.escape(entry.name or entry.tag)}</a> '
+                f'<code>{html.escape(entry.tag)}</code>{pre}'
+            )
+        for line in lines:
+            if len(current) + len(line) > limit:
+                messages.append(current)
+                current = line.lstrip('\n')
+            else:
+                current += line
+    messages.append(current)
+    return messages
+
+
+digests = DigestStore(settings.DATA_DIR / 'digests.sqlite3')
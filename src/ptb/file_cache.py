@@ -0,0 +1,102 @@
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from src.config import settings
+from src.ptb.models import ReleaseAsset
+from src.utils.sqlite import connect
+
+
+def asset_key(asset: ReleaseAsset, bot_id: int) -> str:
+    """Identify the content of an asset as uploaded by `bot_id`.
+
+    GitHub bumps `updated_at` whenever an asset is replaced, so together
+    with the asset id it changes exactly when the file does. A `file_id`
+    can only be used by the bot that received it.
+    """
+
+    return f'{bot_id}:{asset.id}:{asset.updated_at}'
+
+
+class FileIdCache:
+    """Map release assets to the Telegram `file_id` of their upload.
+
+    The whole cache is kept in memory in LRU order and mirrored to a
+    SQLite table, the least recently used entries are evicted once
+    there are more than `max_size` of them.
+    """
+
+    def __init__(self, path: Path, *, max_size: int) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS file_id ('
+                ' key TEXT PRIMARY KEY,'
+                ' file_id TEXT NOT NULL,'
+                ' used_at REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            rows = connection.execute(
+                'SELECT key, file_id FROM file_id ORDER BY used_at'
+            ).fetchall()
+            self._cache = OrderedDict(rows)
+            self._connection = connection
+            self._evict()
+        return self._connection
+
+    def _evict(self) -> None:
+        evicted = []
+        while len(self._cache) > self._max_size:
+            evicted.append((self._cache.popitem(last=False)[0],))
+        if evicted:
+            self.connection.executemany(
+                'DELETE FROM file_id WHERE key = ?', evicted
+            )
+
+    def get(self, asset: ReleaseAsset, bot_id: int) -> str | None:
+        connection = self.connection
+        key = asset_key(asset, bot_id)
+        if (file_id := self._cache.get(key)) is None:
+            return None
+
+        self._cache.move_to_end(key)
+        connection.execute(
+            'UPDATE file_id SET used_at = ? WHERE key = ?',
+            (time.time(), key),
+        )
+        return file_id
+
+    def put(self, asset: ReleaseAsset, bot_id: int, file_id: str) -> None:
+        key = asset_key(asset, bot_id)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO file_id (key, file_id, used_at) '
+            'VALUES (?, ?, ?)',
+            (key, file_id, time.time()),
+        )
+        self._cache[key] = file_id
+        self._cache.move_to_end(key)
+        self._evict()
+
+    def discard(self, asset: ReleaseAsset, bot_id: int) -> None:
+        key = asset_key(asset, bot_id)
+        self.connection.execute('DELETE FROM file_id WHERE key = ?', (key,))
+        self._cache.pop(key, None)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+file_id_cache = FileIdCache(
+    settings.DATA_DIR / 'file_ids.sqlite3',
+    max_size=settings.FILE_ID_CACHE_SIZE,
+)
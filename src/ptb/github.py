@@ -0,0 +1,88 @@
+"""A shared client for the GitHub REST API."""
+
+import asyncio
+import time
+
+import httpx
+
+from src.config import settings
+
+
+class RateBudget:
+    """The rate limit of the API, shared by everything using the client.
+
+    It is updated from the `X-RateLimit-*` headers of every response.
+    Background callers `await acquire()` before each request, which
+    spreads the requests left, less `reserve` kept for interactive ones,
+    evenly over the time until the limit resets.
+    """
+
+    def __init__(self, *, reserve: int) -> None:
+        self.reserve = reserve
+        self.remaining: int | None = None
+        self.reset_at = 0.0
+
+    def update(self, response: httpx.Response) -> None:
+        headers = response.headers
+        remaining = headers.get('x-ratelimit-remaining')
+        reset_at = headers.get('x-ratelimit-reset')
+        if remaining is not None and reset_at is not None:
+            self.remaining = int(remaining)
+            self.reset_at = float(reset_at)
+
+        # 触发了 secondary rate limit
+        if response.status_code in (
+            httpx.codes.FORBIDDEN,
+            httpx.codes.TOO_MANY_REQUESTS,
+        ) and (retry_after := headers.get('retry-after')):
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, time.time() + int(retry_after))
+
+    def delay(self) -> float:
+        """How long to wait before the next background request."""
+
+        now = time.time()
+        if self.remaining is None or now >= self.reset_at:
+            return 0
+        spare = self.remaining - self.reserve
+        if spare <= 0:
+            return self.reset_at - now
+        return (self.reset_at - now) / spare
+
+    async def acquire(self) -> None:
+        if (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+
+
+rate_budget = RateBudget(reserve=settings.GITHUB_RATE_LIMIT_RESERVE)
+
+_client: httpx.AsyncClient | None = None
+
+
+async def _track_rate_limit(response: httpx.Response) -> None:
+    rate_budget.update(response)
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        headers = {
+            'Accept': 'application/vnd.github+json',
+            'X-GitHub-Api-Version': '2022-11-28',
+        }
+        if settings.GITHUB_TOKEN is not None:
+            headers['Authorization'] = f'Bearer {settings.GITHUB_TOKEN}'
+        _client = httpx.AsyncClient(
+            base_url=str(settings.GITHUB_API_URL),
+            headers=headers,
+            timeout=30,
+            event_hooks={'response': [_track_rate_limit]},
+        )
+    return _client
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,104 @@
+"""The address ranges GitHub delivers webhooks from.
+
+They are published as `hooks` by the meta API. The last response is
+kept as a snapshot in `DATA_DIR`, so a restart does not depend on
+GitHub being reachable, and the snapshot is revalidated with its ETag
+every `GITHUB_META_REFRESH_INTERVAL` seconds.
+"""
+
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import httpx
+import orjson
+
+from src.config import settings
+from src.logger import logger
+from src.utils.ip import CidrTrie
+
+
+class GithubHookAllowlist:
+    def __init__(self, snapshot: Path, *, url: str, interval: int) -> None:
+        self.url = url
+        self.interval = interval
+        self.networks = CidrTrie()
+        self.loaded = False
+        self._snapshot = snapshot
+        self._etag: str | None = None
+
+    def __contains__(self, ip: object) -> bool:
+        return ip in self.networks
+
+    def _use(self, hooks: list[str]) -> None:
+        self.networks = CidrTrie(hooks)
+        self.loaded = True
+
+    def load_snapshot(self) -> float | None:
+        """Load the saved ranges, return when they were fetched."""
+
+        try:
+            snapshot = orjson.loads(self._snapshot.read_bytes())
+        except FileNotFoundError:
+            return None
+
+        self._use(snapshot['hooks'])
+        self._etag = snapshot.get('etag')
+        return self._snapshot.stat().st_mtime
+
+    def save_snapshot(self, hooks: list[str]) -> None:
+        self._snapshot.parent.mkdir(parents=True, exist_ok=True)
+        # 每个 worker 写入各自的临时文件, 同时刷新时不会互相覆盖
+        temp = self._snapshot.with_name(
+            f'{self._snapshot.name}.{os.getpid()}.tmp'
+        )
+        temp.write_bytes(orjson.dumps({'etag': self._etag, 'hooks': hooks}))
+        temp.replace(self._snapshot)
+
+    async def refresh(self) -> None:
+        headers = {'Accept': 'application/vnd.github+json'}
+        if self._etag is not None and self.loaded:
+            headers['If-None-Match'] = self._etag
+
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.get(self.url, headers=headers)
+
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            # 只更新快照的修改时间
+            self._snapshot.touch()
+            return
+        response.raise_for_status()
+
+        hooks = orjson.loads(response.content)['hooks']
+        self._etag = response.headers.get('etag')
+        self._use(hooks)
+        self.save_snapshot(hooks)
+        logger.info(f'Loaded {len(self.networks)} GitHub hook ranges')
+
+    async def run(self) -> None:
+        """Keep the ranges up to date."""
+
+        fetched_at = self.load_snapshot()
+        if fetched_at is None:
+            delay = 0.0
+        else:
+            delay = max(0.0, fetched_at + self.interval - time.time())
+
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except (httpx.HTTPError, KeyError, ValueError, OSError) as e:
+                logger.warning(f'Failed to refresh GitHub hook ranges: {e!r}')
+                # 尽快重试, 在此之前继续使用旧的地址段
+                delay = min(self.interval, 5 * 60)
+            else:
+                delay = self.interval
+
+
+github_hooks = GithubHookAllowlist(
+    settings.DATA_DIR / 'github_hooks.json',
+    url=str(settings.GITHUB_META_URL),
+    interval=settings.GITHUB_META_REFRESH_INTERVAL,
+)
@@ -0,0 +1,315 @@
+"""Poll the releases of repositories we cannot install a webhook on.
+
+Every repository is requested with the `ETag` of its previous response,
+so while nothing changed GitHub answers with an empty 304, which does
+not count against the rate limit of authenticated requests. The
+validators and the schedule are kept in SQLite, a restart neither polls
+every repository at once nor announces the same releases again. The
+repositories can be changed at runtime, see `src.runtime_config`.
+
+Each repository is polled more often the more often it publishes, and
+all of them draw from the rate limit shared with the rest of the bot,
+see `src.ptb.github.RateBudget`. Like the Telegram poller, only the
+worker holding a lock in `DATA_DIR` polls.
+"""
+
+import asyncio
+import fcntl
+import heapq
+import os
+import sqlite3
+import time
+from collections.abc import Iterable
+from contextlib import suppress
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+import httpx
+import orjson
+from pydantic import ValidationError
+
+from src.config import settings
+from src.logger import logger
+from src.ptb import github, update_queue
+from src.ptb.models import StoredRelease, UpdateSource
+from src.ptb.projection import RELEASE_PROJECTION, project
+from src.ptb.release_store import release_store
+from src.ptb.webhooks import publish_release
+from src.runtime_config import RuntimeConfig, runtime_config
+from src.utils.sqlite import connect
+
+
+# 每次请求的 release 数量, 新 release 超出这个数量时只会通知最近的
+PAGE_SIZE = 10
+# 轮询间隔为两次发布平均间隔的几分之一
+CADENCE_DIVISOR = 4
+# 没有拿到锁时, 每隔多久重试一次
+LOCK_RETRY_INTERVAL = 30
+# 轮询一个仓库失败时, 稍后重试而不是停止轮询
+POLL_ERRORS = (
+    httpx.HTTPError,
+    # 响应不是 JSON, 或是其中的 release 不完整
+    ValueError,
+    KeyError,
+    ValidationError,
+)
+
+
+class PollState(NamedTuple):
+    etag: str | None
+    # 当前的轮询间隔, 以及按发布频率得出的间隔 (秒)
+    interval: float
+    cadence: float
+    next_poll: float
+
+
+class ReleasePoller:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        repositories: Iterable[str],
+        min_interval: float,
+        max_interval: float,
+    ) -> None:
+        self._path = path
+        self._lock_path = path.with_suffix('.lock')
+        self.repositories = list(dict.fromkeys(repositories))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._connection: sqlite3.Connection | None = None
+        self._changed = asyncio.Event()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS poll_state ('
+                ' repository TEXT PRIMARY KEY,'
+                ' etag TEXT,'
+                ' interval REAL NOT NULL,'
+                ' cadence REAL NOT NULL,'
+                ' next_poll REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self._connection = connection
+        return self._connection
+
+    def state(self, repository: str) -> PollState | None:
+        row = self.connection.execute(
+            'SELECT etag, interval, cadence, next_poll FROM poll_state '
+            'WHERE repository = ?',
+            (repository,),
+        ).fetchone()
+        return None if row is None else PollState(*row)
+
+    def save_state(self, repository: str, state: PollState) -> None:
+        self.connection.execute(
+            'INSERT OR REPLACE INTO poll_state '
+            '(repository, etag, interval, cadence, next_poll) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (repository, *state),
+        )
+
+    def set_repositories(self, repositories: Iterable[str]) -> None:
+        """Poll `repositories` from now on, the state of those polled
+        before is kept."""
+
+        repositories = list(dict.fromkeys(repositories))
+        if repositories != self.repositories:
+            self.repositories = repositories
+            self._changed.set()
+
+    def _clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def cadence(self, releases: list[dict]) -> float:
+        """The poll interval suiting how often `releases` came out."""
+
+        published = sorted(
+            datetime.fromisoformat(i['published_at']).timestamp()
+            for i in releases
+            if i.get('published_at')
+        )
+        if len(published) < 2:
+            return self.max_interval
+        gap = (published[-1] - published[0]) / (len(published) - 1)
+        return self._clamp(gap / CADENCE_DIVISOR)
+
+    async def poll(self, repository: str) -> PollState:
+        """Announce the releases of `repository` that are not known yet,
+        return when to poll it again.
+
+        The first poll of a repository only records its releases.
+        """
+
+        state = self.state(repository)
+        headers = {}
+        if state is not None and state.etag is not None:
+            headers['If-None-Match'] = state.etag
+
+        response = await github.get_client().get(
+            f'/repos/{repository}/releases',
+            params={'per_page': PAGE_SIZE},
+            headers=headers,
+        )
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            assert state is not None
+            # 没有变化时逐渐放慢, 直到回到按发布频率得出的间隔
+            interval = min(state.interval * 2, state.cadence)
+            return self._schedule(repository, state.etag, interval, state)
+        if response.status_code == httpx.codes.NOT_FOUND:
+            logger.warning(f'Repository {repository} was not found')
+            return self._schedule(repository, None, self.max_interval, state)
+        response.raise_for_status()
+
+        payload = orjson.loads(response.content)
+        if not isinstance(payload, list) or not all(
+            isinstance(i, dict) for i in payload
+        ):
+            raise ValueError('Expected a list of releases')
+        releases = [
+            project(i, RELEASE_PROJECTION)
+            for i in payload
+            if not i.get('draft')
+        ]
+        new = [i for i in releases if release_store.get(i['id']) is None]
+        name = repository.partition('/')[2]
+        events = [
+            {
+                'action': 'published',
+                'release': release,
+                'repository': {
+                    'name': name,
+                    'full_name': repository,
+                    'html_url': f'https://github.com/{repository}',
+                },
+            }
+            for release in reversed(new)
+        ]
+        # 先校验所有 release, 不完整的响应不会只通知其中一部分
+        records = [StoredRelease.from_payload(i) for i in events]
+        for data, record in zip(events, records, strict=True):
+            if state is None:
+                release_store.add(record)
+            else:
+                await publish_release(data)
+
+        cadence = self.cadence(releases)
+        # 刚发布的仓库经常紧接着发布修复版本
+        interval = self.min_interval if new and state else cadence
+        return self._schedule(
+            repository,
+            response.headers.get('etag'),
+            interval,
+            state,
+            cadence=cadence,
+        )
+
+    def _schedule(
+        self,
+        repository: str,
+        etag: str | None,
+        interval: float,
+        previous: PollState | None,
+        *,
+        cadence: float | None = None,
+    ) -> PollState:
+        if cadence is None:
+            cadence = (
+                self.max_interval if previous is None else previous.cadence
+            )
+        state = PollState(
+            etag=etag,
+            interval=interval,
+            cadence=cadence,
+            next_poll=time.time() + interval,
+        )
+        self.save_state(repository, state)
+        return state
+
+    async def _acquire_lock(self) -> int:
+        self._lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                await asyncio.sleep(LOCK_RETRY_INTERVAL)
+            else:
+                return fd
+
+    async def run(self) -> None:
+        fd = await self._acquire_lock()
+        try:
+            logger.info(
+                f'Start polling the releases of '
+                f'{len(self.repositories)} repositories'
+            )
+            await self._poll()
+        finally:
+            os.close(fd)
+
+    async def _poll(self) -> None:
+        while True:
+            self._changed.clear()
+            queue: list[tuple[float, str]] = []
+            for repository in self.repositories:
+                state = self.state(repository)
+                heapq.heappush(
+                    queue,
+                    (0 if state is None else state.next_poll, repository),
+                )
+            await self._poll_until_changed(queue)
+
+    async def _wait_changed(self, timeout: float | None) -> None:
+        with suppress(TimeoutError):
+            await asyncio.wait_for(self._changed.wait(), timeout)
+
+    async def _poll_until_changed(
+        self, queue: list[tuple[float, str]]
+    ) -> None:
+        while not self._changed.is_set():
+            if not queue:
+                await self._wait_changed(None)
+                continue
+            next_poll, repository = queue[0]
+            if (delay := next_poll - time.time()) > 0:
+                await self._wait_changed(delay)
+                continue
+            # 通知积压时暂停, 等待队列消化
+            if update_queue.is_full(UpdateSource.GITHUB):
+                await self._wait_changed(update_queue.retry_after)
+                continue
+
+            await github.rate_budget.acquire()
+            try:
+                state = await self.poll(repository)
+            except POLL_ERRORS as e:
+                logger.warning(
+                    f'Failed to poll the releases of {repository}: {e!r}'
+                )
+                next_poll = time.time() + self.min_interval
+            else:
+                next_poll = state.next_poll
+            heapq.heapreplace(queue, (next_poll, repository))
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+release_poller = ReleasePoller(
+    settings.DATA_DIR / 'github_poller.sqlite3',
+    repositories=settings.GITHUB_POLL_REPOSITORIES,
+    min_interval=settings.GITHUB_POLL_MIN_INTERVAL,
+    max_interval=settings.GITHUB_POLL_MAX_INTERVAL,
+)
+
+
+@runtime_config.subscribe
+def _reload_repositories(config: RuntimeConfig) -> None:
+    release_poller.set_repositories(config.settings.GITHUB_POLL_REPOSITORIES)
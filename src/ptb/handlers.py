@@ -1,13 +1,54 @@
 import html
+import re
+import time
+from datetime import UTC, datetime
+from functools import partial
+from typing import cast
+from urllib.parse import parse_qsl
 
-from telegram import Update
-from telegram.constants import ParseMode
+import httpx
+from telegram import (
+    ChatMemberRestricted,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    LinkPreviewOptions,
+    Update,
+)
+from telegram.constants import ChatMemberStatus, MessageLimit, ParseMode
+from telegram.error import BadRequest, Forbidden, TelegramError
 
+from src.captures import Capture, captures
 from src.config import settings
+from src.logger import logger
+from src.ptb.assets import mirror_assets
+from src.ptb.callback_data import callback_data
 from src.ptb.constants import WEBHOOK_URL
+from src.ptb.dead_letter import dead_letters
+from src.ptb.digests import DigestPeriod, digests, render_digest
+from src.ptb.message_index import message_index
 from src.ptb.models import WebhookUpdate
+from src.ptb.release_pages import (
+    ReleasePage,
+    RepositoryNotFoundError,
+    release_pages,
+)
+from src.ptb.release_store import (
+    HIGHLIGHT_END,
+    HIGHLIGHT_START,
+    SearchHit,
+    release_store,
+)
+from src.ptb.retry import ErrorKind, classify, with_retry
 from src.ptb.utils import CustomContext
-from src.utils.telegram import text
+from src.utils.telegram import (
+    build_cb_query_data,
+    build_menu,
+    edit_message,
+    text,
+)
+from src.utils.telegram.markdown import render_release_body
 
 
 async def start(update: Update, context: CustomContext) -> None:
@@ -35,15 +76,597 @@ async def webhook_update(
     update: WebhookUpdate,
     context: CustomContext,
 ) -> None:
-    """Handle custom updates."""
-
-    # text = (
-    #     f'The user {chat_member.user.mention_html()} has sent a new payload. '
-    #     f'So far they have sent the following payloads: \n\n'
-    #     f'• <code>{combined_payloads}</code>'
-    # )
-    await context.bot.send_message(
-        chat_id=settings.TELEGRAM_ADMIN_CHAT_ID,
-        text=update.text,
-        parse_mode=ParseMode.MARKDOWN_V2,
+    """Handle custom updates.
+
+    Updates that still fail after retrying are moved to the dead letter
+    store, from which they can be replayed with /replay.
+    """
+
+    chat_id = context.admin_chat_id
+    try:
+        await deliver(update, context, chat_id)
+    except TelegramError as e:
+        kind = classify(e)
+        id_ = dead_letters.add(
+            update,
+            bot=context.bot_name,
+            chat_id=chat_id,
+            kind=kind,
+            error=str(e),
+        )
+        logger.error(f'Failed to deliver update, dead letter {id_}: {e!r}')
+
+
+async def deliver(
+    update: WebhookUpdate,
+    context: CustomContext,
+    chat_id: int,
+) -> None:
+    """Send `update` to `chat_id`.
+
+    Updates about a release that was already announced edit the original
+    message instead of posting a new one.
+    """
+
+    release_id = update.release_id
+
+    if release_id is not None:
+        for sent_chat_id, message_id in message_index.get(release_id):
+            if sent_chat_id != chat_id:
+                continue
+            try:
+                await with_retry(
+                    partial(
+                        context.bot.edit_message_text,
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        text=update.text,
+                        parse_mode=ParseMode.MARKDOWN_V2,
+                    )
+                )
+            except BadRequest as e:
+                if 'not modified' in e.message:
+                    return
+                if classify(e) == ErrorKind.PARSE:
+                    raise
+                # 原消息已经被删除, 或是已经不能再编辑了, 重新发送
+                logger.warning(
+                    f'Failed to edit message {message_id} of release '
+                    f'{release_id}: {e.message}'
+                )
+                message_index.discard(release_id, chat_id)
+                break
+            else:
+                if update.action == 'deleted':
+                    message_index.discard(release_id, chat_id)
+                return
+
+    message = await with_retry(
+        partial(
+            context.bot.send_message,
+            chat_id=chat_id,
+            text=update.text,
+            parse_mode=ParseMode.MARKDOWN_V2,
+        )
+    )
+    if release_id is not None and update.action != 'deleted':
+        message_index.add(release_id, message.chat_id, message.message_id)
+
+    if update.assets and settings.MIRROR_ASSETS:
+        context.application.create_task(
+            mirror_assets(
+                context.bot.base_url,
+                chat_id,
+                update.assets,
+                bot_id=context.bot.id,
+                reply_to_message_id=message.message_id,
+            ),
+            update=update,
+        )
+
+
+async def dead_letter_list(update: Update, context: CustomContext) -> None:
+    """List the notifications that could not be delivered."""
+
+    assert update.message is not None
+    bot = context.bot_name
+    entries = dead_letters.entries(bot)
+    if not entries:
+        await update.message.reply_text('There are no dead letters.')
+        return
+
+    lines = [f'{dead_letters.count(bot)} dead letter(s):']
+    for entry in entries:
+        failed_at = datetime.fromtimestamp(entry.failed_at, UTC)
+        lines.append(
+            f'<code>{entry.id}</code> {failed_at:%Y-%m-%d %H:%M:%S} '
+            f'[{entry.kind}] {html.escape(entry.error)}'
+        )
+    lines.append(
+        '\nReplay with <code>/replay &lt;id&gt;</code> or '
+        '<code>/replay all</code>.'
+    )
+    await update.message.reply_html('\n'.join(lines))
+
+
+async def replay(update: Update, context: CustomContext) -> None:
+    """Put dead letters of this bot back into its update queue."""
+
+    assert update.message is not None
+    bot = context.bot_name
+    if not context.args:
+        await update.message.reply_text('Usage: /replay <id> | all')
+        return
+
+    if context.args[0] == 'all':
+        ids = [i.id for i in dead_letters.entries(bot, limit=-1)]
+    else:
+        try:
+            ids = [int(i) for i in context.args]
+        except ValueError:
+            await update.message.reply_text('Usage: /replay <id> | all')
+            return
+
+    replayed = 0
+    for id_ in ids:
+        if (entry := dead_letters.pop(bot, id_)) is not None:
+            await context.application.update_queue.put(entry.update)
+            replayed += 1
+    await update.message.reply_text(f'Replayed {replayed} dead letter(s).')
+
+
+# /recent 每页显示的请求数量
+RECENT_PAGE_SIZE = 10
+
+
+def _capture_line(capture: Capture) -> str:
+    captured_at = datetime.fromtimestamp(capture.time, UTC)
+    return (
+        f'<code>{capture.id}</code> {captured_at:%H:%M:%S} '
+        f'{capture.method} {html.escape(capture.path)} {capture.status} '
+        f'{capture.duration * 1000:.0f}ms {html.escape(str(capture.ip))}'
+    )
+
+
+async def recent(update: Update, context: CustomContext) -> None:
+    """List the latest captured requests, newest first."""
+
+    assert update.message is not None
+    before = None
+    if context.args:
+        try:
+            before = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text('Usage: /recent [before id]')
+            return
+
+    page = captures.recent(before=before, limit=RECENT_PAGE_SIZE)
+    if not page:
+        await update.message.reply_text('There are no captured requests.')
+        return
+
+    lines = [_capture_line(i) for i in page]
+    lines.append(
+        f'\nShow one with <code>/show &lt;id&gt;</code>, '
+        f'older ones with <code>/recent {page[-1].id}</code>.'
+    )
+    await update.message.reply_html('\n'.join(lines))
+
+
+async def show(update: Update, context: CustomContext) -> None:
+    """Show the details of one captured request."""
+
+    assert update.message is not None
+    try:
+        id_ = int(context.args[0]) if context.args else None
+    except ValueError:
+        id_ = None
+    if id_ is None:
+        await update.message.reply_text('Usage: /show <id>')
+        return
+
+    if (capture := captures.get(id_)) is None:
+        await update.message.reply_text(
+            f'Request {id_} is not, or no longer, captured.'
+        )
+        return
+
+    captured_at = datetime.fromtimestamp(capture.time, UTC)
+    response_start = (
+        '-'
+        if capture.response_start is None
+        else f'{capture.response_start * 1000:.1f}ms'
+    )
+    lines = [
+        f'<b>{capture.method} {html.escape(capture.path)}</b>',
+        f'Time: {captured_at:%Y-%m-%d %H:%M:%S.%f}',
+        f'IP: <code>{html.escape(str(capture.ip))}</code>',
+        f'Status: {capture.status} {html.escape(capture.verdict)}',
+        (
+            f'Response started after {response_start}, '
+            f'finished after {capture.duration * 1000:.1f}ms'
+        ),
+    ]
+    if capture.body_digest is None:
+        lines.append('Body: not sampled')
+    else:
+        lines.append(
+            f'Body: {capture.body_size} bytes, '
+            f'blake2b <code>{capture.body_digest}</code>'
+        )
+
+    headers = '\n'.join(
+        f'{name}: {value[:200]}' for name, value in capture.headers
     )
+    lines.append(f'\n<pre>{html.escape(headers)}</pre>')
+    if capture.body_preview:
+        preview = capture.body_preview.decode(errors='replace')
+        lines.append(f'<pre>{html.escape(preview)}</pre>')
+    await update.message.reply_html('\n'.join(lines))
+
+
+REPOSITORY_PATTERN = re.compile(r'^[\w.-]+/[\w.-]+$')
+NO_LINK_PREVIEW = LinkPreviewOptions(is_disabled=True)
+
+
+# Telegram 允许的 callback data 长度
+CALLBACK_DATA_LIMIT = 64
+
+
+def _release_page_data(repo: str, page: int) -> str:
+    data = build_cb_query_data('releases', repo=repo, page=page)
+    if len(data.encode()) <= CALLBACK_DATA_LIMIT:
+        return data
+    # 仓库名太长时, 按钮中只携带它的 key
+    return build_cb_query_data(
+        'releases', key=callback_data.put(repo), page=page
+    )
+
+
+def _release_page_keyboard(
+    repo: str, page: ReleasePage
+) -> InlineKeyboardMarkup | None:
+    buttons = []
+    if page.page > 1:
+        buttons.append(
+            InlineKeyboardButton(
+                '« Newer',
+                callback_data=_release_page_data(repo, page.page - 1),
+            )
+        )
+    if page.has_next:
+        buttons.append(
+            InlineKeyboardButton(
+                'Older »',
+                callback_data=_release_page_data(repo, page.page + 1),
+            )
+        )
+    if not buttons:
+        return None
+    return build_menu(buttons, cols=len(buttons))
+
+
+async def _release_page(
+    context: CustomContext, repo: str, page: int
+) -> ReleasePage | str:
+    """Return the page, or the reason why it could not be loaded."""
+
+    try:
+        rendered = await release_pages.get(repo, page)
+    except RepositoryNotFoundError:
+        return f'Repository {repo} was not found.'
+    except httpx.HTTPError as e:
+        logger.warning(f'Failed to fetch releases of {repo}: {e!r}')
+        return 'Could not fetch the releases, please try again later.'
+
+    if rendered.has_next:
+        context.application.create_task(release_pages.prefetch(repo, page + 1))
+    return rendered
+
+
+async def releases(update: Update, context: CustomContext) -> None:
+    """Page through the releases of a repository."""
+
+    assert update.message is not None
+    if not context.args or not REPOSITORY_PATTERN.match(context.args[0]):
+        await update.message.reply_text('Usage: /releases <owner/repo>')
+        return
+
+    repo = context.args[0]
+    page = await _release_page(context, repo, 1)
+    if isinstance(page, str):
+        await update.message.reply_text(page)
+        return
+
+    await update.message.reply_html(
+        page.text,
+        reply_markup=_release_page_keyboard(repo, page),
+        link_preview_options=NO_LINK_PREVIEW,
+    )
+
+
+async def releases_page(update: Update, context: CustomContext) -> None:
+    """Swap the /releases message to another page."""
+
+    query = update.callback_query
+    assert query is not None and query.data is not None
+    # 按钮只出现在管理聊天中, 与 /releases 一样只在那里响应
+    chat = update.effective_chat
+    if chat is None or chat.id != context.admin_chat_id:
+        await query.answer()
+        return
+
+    params = dict(parse_qsl(query.data, keep_blank_values=True))
+    repo = params.get('repo') or callback_data.get(params.get('key', ''))
+    if repo is None:
+        await query.answer(
+            'This list has expired, send /releases again.', show_alert=True
+        )
+        return
+
+    page = await _release_page(context, repo, int(params.get('page', 1)))
+    if isinstance(page, str):
+        await query.answer(page, show_alert=True)
+        return
+
+    try:
+        await edit_message(
+            query,
+            page.text,
+            _release_page_keyboard(repo, page),
+            parse_mode=ParseMode.HTML,
+            link_preview_options=NO_LINK_PREVIEW,
+        )
+    except BadRequest as e:
+        # 重复点击同一个按钮
+        if 'not modified' not in e.message:
+            raise
+
+
+def _highlight(snippet: str) -> str:
+    return (
+        html.escape(' '.join(snippet.split()))
+        .replace(HIGHLIGHT_START, '<b>')
+        .replace(HIGHLIGHT_END, '</b>')
+    )
+
+
+def _search_hit_line(hit: SearchHit) -> str:
+    release = hit.release
+    published_at = (
+        'draft'
+        if release.published_at is None
+        else f'{release.published_at:%Y-%m-%d}'
+    )
+    return (
+        f'🏷️ {html.escape(release.repository)} '
+        f'<a href="{html.escape(release.html_url)}">'
+        f'{html.escape(release.name or release.tag)}</a> '
+        f'<code>{html.escape(release.tag)}</code> {published_at}\n'
+        f'    {_highlight(hit.snippet)}'
+    )
+
+
+async def search(update: Update, context: CustomContext) -> None:
+    """Search the notes of the releases the bot has seen."""
+
+    assert update.message is not None
+    if not context.args:
+        await update.message.reply_text('Usage: /search <words>')
+        return
+
+    hits = release_store.search(
+        ' '.join(context.args),
+        bot=context.bot_name,
+        limit=settings.SEARCH_PAGE_SIZE,
+    )
+    if not hits:
+        await update.message.reply_text('No release matches your search.')
+        return
+
+    await update.message.reply_html(
+        '\n\n'.join(_search_hit_line(i) for i in hits),
+        link_preview_options=NO_LINK_PREVIEW,
+    )
+
+
+def _search_result(hit: SearchHit) -> InlineQueryResultArticle:
+    release = hit.release
+    header = (
+        f'🏷️ <b>{html.escape(release.repository)}</b> '
+        f'<a href="{html.escape(release.html_url)}">'
+        f'{html.escape(release.name or release.tag)}</a> '
+        f'<code>{html.escape(release.tag)}</code>\n\n'
+    )
+    body = render_release_body(
+        release.id,
+        release.body,
+        limit=MessageLimit.MAX_TEXT_LENGTH - len(header),
+        as_html=True,
+    )
+    description = ' '.join(hit.snippet.split())
+    for marker in (HIGHLIGHT_START, HIGHLIGHT_END):
+        description = description.replace(marker, '')
+    return InlineQueryResultArticle(
+        id=str(release.id),
+        title=f'{release.repository} {release.name or release.tag}',
+        description=description,
+        url=release.html_url,
+        input_message_content=InputTextMessageContent(
+            header + body,
+            parse_mode=ParseMode.HTML,
+            link_preview_options=NO_LINK_PREVIEW,
+        ),
+    )
+
+
+# 缓存用户是否在管理聊天中的秒数
+ADMIN_MEMBER_TTL = 300
+ADMIN_MEMBER_CACHE_SIZE = 1024
+_MEMBER_STATUSES = frozenset(
+    (
+        ChatMemberStatus.OWNER,
+        ChatMemberStatus.ADMINISTRATOR,
+        ChatMemberStatus.MEMBER,
+    )
+)
+
+
+async def _in_admin_chat(context: CustomContext, user_id: int) -> bool:
+    """Whether `user_id` is the admin chat, or a member of it."""
+
+    chat_id = context.admin_chat_id
+    if user_id == chat_id:
+        return True
+    if chat_id > 0:
+        # 与另一个用户的私聊
+        return False
+
+    members: dict[int, tuple[float, bool]] = context.bot_data.setdefault(
+        'admin_members', {}
+    )
+    now = time.monotonic()
+    if (cached := members.get(user_id)) and now - cached[0] < (
+        ADMIN_MEMBER_TTL
+    ):
+        return cached[1]
+
+    try:
+        member = await context.bot.get_chat_member(chat_id, user_id)
+    except BadRequest:
+        # 用户从未加入过这个聊天
+        allowed = False
+    else:
+        allowed = member.status in _MEMBER_STATUSES or (
+            isinstance(member, ChatMemberRestricted) and member.is_member
+        )
+    if len(members) >= ADMIN_MEMBER_CACHE_SIZE:
+        members.clear()
+    members[user_id] = (now, allowed)
+    return allowed
+
+
+async def inline_search(update: Update, context: CustomContext) -> None:
+    """Answer inline queries with the releases matching them.
+
+    Only members of the admin chat find releases, and only those of this
+    bot. Telegram caches the answers of each user for
+    `SEARCH_INLINE_CACHE_TIME` seconds, repeated queries do not reach the
+    bot at all.
+    """
+
+    query = update.inline_query
+    assert query is not None
+    if not await _in_admin_chat(context, query.from_user.id):
+        await query.answer(
+            [], cache_time=settings.SEARCH_INLINE_CACHE_TIME, is_personal=True
+        )
+        return
+
+    try:
+        offset = int(query.offset or 0)
+    except ValueError:
+        offset = 0
+
+    hits = release_store.search(
+        query.query,
+        bot=context.bot_name,
+        limit=settings.SEARCH_PAGE_SIZE,
+        offset=offset,
+    )
+    next_offset = (
+        str(offset + len(hits))
+        if len(hits) == settings.SEARCH_PAGE_SIZE
+        else ''
+    )
+    await query.answer(
+        [_search_result(i) for i in hits],
+        cache_time=settings.SEARCH_INLINE_CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset,
+    )
+
+
+async def digest(update: Update, context: CustomContext) -> None:
+    """Subscribe the chat to a daily or weekly summary of the releases."""
+
+    assert update.message is not None
+    chat_id = update.message.chat_id
+    usage = 'Usage: /digest daily | weekly | off'
+    if not context.args:
+        periods = digests.subscriptions(chat_id)
+        subscribed = (
+            f'This chat receives the {" and ".join(periods)} digest.'
+            if periods
+            else 'This chat receives no digest.'
+        )
+        await update.message.reply_text(f'{subscribed}\n{usage}')
+        return
+
+    choice = context.args[0].lower()
+    if choice == 'off':
+        digests.unsubscribe(chat_id)
+        await update.message.reply_text('Unsubscribed from the digests.')
+        return
+    try:
+        period = DigestPeriod(choice)
+    except ValueError:
+        await update.message.reply_text(usage)
+        return
+
+    digests.subscribe(chat_id, period)
+    await update.message.reply_text(f'Subscribed to the {period} digest.')
+
+
+async def send_digest(context: CustomContext) -> None:
+    """Send the digest of the period in `context.job.data` to the chats
+    subscribed to it."""
+
+    assert context.job is not None
+    period = cast(DigestPeriod, context.job.data)
+    claimed = digests.claim(period, time.time())
+    if claimed is None:
+        return
+    if not claimed.entries:
+        digests.complete(claimed)
+        return
+
+    # 所有订阅者收到相同的内容, 只渲染一次
+    messages = render_digest(claimed)
+    delivered = failed = 0
+    finished = False
+    try:
+        for chat_id in digests.subscribers(period):
+            try:
+                for message in messages:
+                    await with_retry(
+                        partial(
+                            context.bot.send_message,
+                            chat_id=chat_id,
+                            text=message,
+                            parse_mode=ParseMode.HTML,
+                            link_preview_options=NO_LINK_PREVIEW,
+                        )
+                    )
+            except Forbidden as e:
+                # bot 已被移出聊天
+                digests.unsubscribe(chat_id)
+                logger.warning(
+                    f'Unsubscribed chat {chat_id} from the digests: '
+                    f'{e.message}'
+                )
+            except TelegramError as e:
+                failed += 1
+                logger.error(
+                    f'Failed to send the {period} digest to {chat_id}: {e!r}'
+                )
+            else:
+                delivered += 1
+        finished = True
+    finally:
+        # 没有任何聊天收到时保留这些 release, 与下一次的摘要一起发送,
+        # 部分聊天已经收到时不再重发, 以免重复
+        if delivered or (finished and not failed):
+            digests.complete(claimed)
+        else:
+            digests.release(claimed)
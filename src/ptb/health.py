@@ -0,0 +1,157 @@
+"""Liveness and readiness of the worker, for the probes of the
+orchestrator.
+
+Everything is computed from counters kept in memory, the update queue
+and the outcome of the requests made through `with_retry`, so answering
+a probe makes no request of its own. `/readyz` fails while the worker is
+shutting down, its backlog is too old or at its high-water mark, or
+Telegram has not been reachable for a while, so that traffic is routed
+to the other workers until it recovered.
+"""
+
+import time
+from collections import deque
+
+from src.config import settings
+from src.ptb.models import UpdateSource
+from src.ptb.update_queue import UpdateQueue
+
+
+class SendStats:
+    """Outcomes of the Telegram requests over the last `window` seconds.
+
+    A request fails when Telegram could not be reached or asked to slow
+    down, any other answer means it is reachable.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.started_at = time.monotonic()
+        self.last_success: float | None = None
+        self.last_failure: float | None = None
+        # 每秒一个桶: [秒, 成功数, 失败数]
+        self._buckets: deque[list[int]] = deque()
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        if ok:
+            self.last_success = now
+        else:
+            self.last_failure = now
+
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        self._buckets[-1][1 if ok else 2] += 1
+        self._expire(second)
+
+    def _expire(self, second: int) -> None:
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+
+    def counts(self) -> tuple[int, int]:
+        """The requests and the failures in the window."""
+
+        self._expire(int(time.monotonic()))
+        requests = failures = 0
+        for _, ok, failed in self._buckets:
+            requests += ok + failed
+            failures += failed
+        return requests, failures
+
+    def failing_for(self) -> float:
+        """For how many seconds all requests failed, 0 while the last one
+        succeeded."""
+
+        if self.last_failure is None:
+            return 0
+        last_success = self.last_success or self.started_at
+        if last_success > self.last_failure:
+            return 0
+        return time.monotonic() - last_success
+
+
+def _age(since: float | None, now: float) -> float | None:
+    return None if since is None else now - since
+
+
+class Readiness:
+    def __init__(
+        self,
+        stats: SendStats,
+        *,
+        max_queue_age: float,
+        max_failing_for: float,
+        max_error_rate: float,
+        min_requests: int,
+        ttl: float,
+    ) -> None:
+        self.stats = stats
+        self.max_queue_age = max_queue_age
+        self.max_failing_for = max_failing_for
+        self.max_error_rate = max_error_rate
+        self.min_requests = min_requests
+        self.ttl = ttl
+        self._cached: tuple[float, dict] | None = None
+
+    def report(self, queue: UpdateQueue) -> dict:
+        """The state of the worker, computed at most once per `ttl`
+        seconds. `failing` lists why it is not ready."""
+
+        now = time.monotonic()
+        if self._cached is not None and now - self._cached[0] < self.ttl:
+            return self._cached[1]
+
+        failing = []
+        if queue.closed:
+            failing.append('shutting_down')
+        if any(queue.is_full(i) for i in UpdateSource):
+            failing.append('queue_full')
+        oldest_age = queue.oldest_age()
+        if oldest_age > self.max_queue_age:
+            failing.append('queue_lag')
+
+        stats = self.stats
+        failing_for = stats.failing_for()
+        if failing_for > self.max_failing_for:
+            failing.append('telegram_unreachable')
+        requests, failures = stats.counts()
+        error_rate = failures / requests if requests else 0
+        if requests >= self.min_requests and error_rate > self.max_error_rate:
+            failing.append('error_rate')
+
+        report = {
+            'ready': not failing,
+            'failing': failing,
+            'queue': {
+                'depth': queue.qsize(),
+                'max_size': queue.max_size,
+                'oldest_age': oldest_age,
+                'lanes': {
+                    source: len(lane.items)
+                    for source, lane in queue.lanes.items()
+                },
+            },
+            'telegram': {
+                'since_last_success': _age(stats.last_success, now),
+                'since_last_failure': _age(stats.last_failure, now),
+                'failing_for': failing_for,
+                'window': stats.window,
+                'requests': requests,
+                'failures': failures,
+                'error_rate': error_rate,
+            },
+        }
+        self._cached = (now, report)
+        return report
+
+
+send_stats = SendStats(settings.HEALTH_WINDOW)
+readiness = Readiness(
+    send_stats,
+    max_queue_age=settings.READY_MAX_QUEUE_AGE,
+    max_failing_for=settings.READY_MAX_FAILING_FOR,
+    max_error_rate=settings.READY_MAX_ERROR_RATE,
+    min_requests=settings.READY_MIN_REQUESTS,
+    ttl=settings.HEALTH_CACHE_TTL,
+)
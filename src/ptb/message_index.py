@@ -0,0 +1,133 @@
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from src.config import settings
+from src.utils.sqlite import connect
+
+
+SentMessage = tuple[int, int]
+"""`(chat_id, message_id)` of a message the bot has sent."""
+
+
+class MessageIndex:
+    """Map a GitHub release id to the Telegram messages announcing it.
+
+    Lookups are served from an in-memory LRU cache, backed by a small
+    SQLite table so the index survives restarts. Rows older than
+    `retention` seconds are purged when the index is opened and then
+    after every `purge_every` additions, edits to such old releases
+    simply produce a new message.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        retention: float,
+        cache_size: int = 1024,
+        purge_every: int = 1000,
+    ) -> None:
+        self._path = path
+        self._retention = retention
+        self._cache_size = cache_size
+        self._purge_every = purge_every
+        self._added = 0
+        self._cache: OrderedDict[int, tuple[SentMessage, ...]] = OrderedDict()
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS release_message ('
+                ' release_id INTEGER NOT NULL,'
+                ' chat_id INTEGER NOT NULL,'
+                ' message_id INTEGER NOT NULL,'
+                ' sent_at REAL NOT NULL,'
+                ' PRIMARY KEY (release_id, chat_id)'
+                ') WITHOUT ROWID'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS release_message_sent_at '
+                'ON release_message (sent_at)'
+            )
+            self._connection = connection
+            self.purge()
+        return self._connection
+
+    def _remember(self, release_id: int, value: tuple[SentMessage, ...]):
+        self._cache[release_id] = value
+        self._cache.move_to_end(release_id)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, release_id: int) -> tuple[SentMessage, ...]:
+        """Return the messages sent for `release_id`, if any."""
+
+        if (value := self._cache.get(release_id)) is not None:
+            self._cache.move_to_end(release_id)
+            return value
+
+        rows = self.connection.execute(
+            'SELECT chat_id, message_id FROM release_message '
+            'WHERE release_id = ? AND sent_at >= ?',
+            (release_id, time.time() - self._retention),
+        ).fetchall()
+        value = tuple((chat_id, message_id) for chat_id, message_id in rows)
+        self._remember(release_id, value)
+        return value
+
+    def add(self, release_id: int, chat_id: int, message_id: int) -> None:
+        self.connection.execute(
+            'INSERT OR REPLACE INTO release_message '
+            '(release_id, chat_id, message_id, sent_at) VALUES (?, ?, ?, ?)',
+            (release_id, chat_id, message_id, time.time()),
+        )
+        value = tuple(i for i in self.get(release_id) if i[0] != chat_id)
+        self._remember(release_id, (*value, (chat_id, message_id)))
+
+        # 长时间运行的 worker 也要定期清理
+        self._added += 1
+        if self._added % self._purge_every == 0:
+            self.purge()
+
+    def discard(self, release_id: int, chat_id: int | None = None) -> None:
+        if chat_id is None:
+            self.connection.execute(
+                'DELETE FROM release_message WHERE release_id = ?',
+                (release_id,),
+            )
+            self._cache.pop(release_id, None)
+            return
+
+        self.connection.execute(
+            'DELETE FROM release_message WHERE release_id = ? AND chat_id = ?',
+            (release_id, chat_id),
+        )
+        value = tuple(i for i in self.get(release_id) if i[0] != chat_id)
+        self._remember(release_id, value)
+
+    def purge(self) -> int:
+        """Delete entries older than the retention period."""
+
+        cursor = self.connection.execute(
+            'DELETE FROM release_message WHERE sent_at < ?',
+            (time.time() - self._retention,),
+        )
+        if cursor.rowcount:
+            self._cache.clear()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+message_index = MessageIndex(
+    settings.DATA_DIR / 'messages.sqlite3',
+    retention=settings.MESSAGE_INDEX_RETENTION_DAYS * 86400,
+)
@@ -1,8 +1,151 @@
-from pydantic import BaseModel
+from dataclasses import dataclass
+from datetime import datetime
+from enum import StrEnum, auto
 
+import orjson
 
-class WebhookUpdate(BaseModel):
-    """Simple dataclass to wrap a custom update type"""
+from src.models import DBBigInt, DBBigintSerial, DBModel
 
-    text: str
-    assets: list[str] | None = None
+
+class UpdateSource(StrEnum):
+    TELEGRAM = auto()
+    GITHUB = auto()
+
+
+@dataclass(slots=True)
+class ReleaseAsset:
+    id: int
+    name: str
+    url: str
+    size: int
+    content_type: str = 'application/octet-stream'
+    updated_at: str | None = None
+
+
+class WebhookUpdate:
+    """A notification waiting in `update_queue`.
+
+    A plain `__slots__` record, thousands of them may be queued. The text
+    usually contains emoji, for which Python stores every character of
+    the string in 4 bytes, so it is kept UTF-8 encoded until it is sent.
+    """
+
+    __slots__ = (
+        '_text',
+        'assets',
+        'source',
+        'repository',
+        'release_id',
+        'action',
+    )
+
+    def __init__(
+        self,
+        text: str,
+        assets: list[ReleaseAsset] | None = None,
+        source: UpdateSource = UpdateSource.GITHUB,
+        # 同一个仓库的更新按顺序处理
+        repository: str | None = None,
+        # 用于编辑之前发送过的 release 消息
+        release_id: int | None = None,
+        action: str | None = None,
+    ) -> None:
+        self._text = text.encode()
+        self.assets = assets
+        self.source = source
+        self.repository = repository
+        self.release_id = release_id
+        self.action = action
+
+    @property
+    def text(self) -> str:
+        return self._text.decode()
+
+    def __repr__(self) -> str:
+        return (
+            f'WebhookUpdate(repository={self.repository!r}, '
+            f'release_id={self.release_id!r}, action={self.action!r})'
+        )
+
+    def to_json(self) -> bytes:
+        return orjson.dumps(
+            {
+                'text': self.text,
+                'assets': self.assets,
+                'source': self.source,
+                'repository': self.repository,
+                'release_id': self.release_id,
+                'action': self.action,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> 'WebhookUpdate':
+        fields = orjson.loads(data)
+        assets = fields.pop('assets', None)
+        return cls(
+            **fields,
+            assets=None
+            if assets is None
+            else [ReleaseAsset(**i) for i in assets],
+        )
+
+
+class StoredAsset(DBModel):
+    """A row of the `release_asset` table of the release store."""
+
+    release_id: DBBigintSerial
+    name: str
+    url: str
+    size: DBBigInt
+    content_type: str = 'application/octet-stream'
+    updated_at: str | None = None
+
+
+class StoredRelease(DBModel):
+    """A row of the `release` table of the release store, with its
+    assets."""
+
+    repository: str
+    tag: str
+    name: str | None = None
+    body: str | None = None
+    html_url: str
+    prerelease: bool = False
+    published_at: datetime | None = None
+    # 最后一次收到的 webhook 动作
+    action: str | None = None
+    deleted: bool = False
+    assets: list[StoredAsset] = []
+
+    @classmethod
+    def from_payload(cls, data: dict) -> 'StoredRelease':
+        """Build the record from the payload of a `release` event."""
+
+        release: dict = data['release']
+        action = data.get('action')
+        return cls(
+            id=release['id'],
+            repository=data['repository']['full_name'],
+            tag=release['tag_name'],
+            name=release.get('name'),
+            body=release.get('body'),
+            html_url=release['html_url'],
+            prerelease=release.get('prerelease') or False,
+            published_at=release.get('published_at'),
+            action=action,
+            deleted=action == 'deleted',
+            assets=[
+                StoredAsset(
+                    id=asset['id'],
+                    release_id=release['id'],
+                    name=asset['name'],
+                    url=asset['browser_download_url'],
+                    size=asset['size'],
+                    content_type=asset.get('content_type')
+                    or 'application/octet-stream',
+                    updated_at=asset.get('updated_at'),
+                )
+                for asset in release.get('assets') or []
+            ],
+        )
@@ -0,0 +1,136 @@
+"""Receive Telegram updates by long polling instead of a webhook.
+
+Only one `getUpdates` consumer may exist per bot, so with several
+gunicorn workers the poller runs in whichever worker holds an exclusive
+lock on a file in `DATA_DIR`; the others keep trying to take it over.
+The offset of the last enqueued update is persisted, so a restart
+resumes where the previous process stopped.
+"""
+
+import asyncio
+import fcntl
+import os
+from pathlib import Path
+
+from telegram import Bot, Update
+from telegram.error import RetryAfter, TelegramError
+
+from src.config import settings
+from src.logger import logger
+from src.ptb.models import UpdateSource
+from src.ptb.retry import backoff, retry_after_seconds
+from src.ptb.update_queue import UpdateQueue
+
+
+MIN_BATCH_SIZE = 1
+# getUpdates 的 limit 上限
+MAX_BATCH_SIZE = 100
+# 没有拿到锁时, 每隔多久重试一次
+LOCK_RETRY_INTERVAL = 30
+
+
+class Poller:
+    def __init__(
+        self,
+        bot: Bot,
+        update_queue: UpdateQueue,
+        *,
+        data_dir: Path,
+        timeout: int,
+    ) -> None:
+        self.bot = bot
+        self.update_queue = update_queue
+        self.timeout = timeout
+        self.batch_size = MIN_BATCH_SIZE
+        self._offset_path = data_dir / 'telegram_offset'
+        self._lock_path = data_dir / 'telegram_polling.lock'
+
+    def load_offset(self) -> int | None:
+        try:
+            return int(self._offset_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_offset(self, offset: int) -> None:
+        temp = self._offset_path.with_suffix('.tmp')
+        temp.write_text(str(offset))
+        temp.replace(self._offset_path)
+
+    def adapt_batch_size(self, received: int) -> None:
+        """Grow the batch while updates arrive in full batches, shrink it
+        again once the backlog is gone."""
+
+        if received >= self.batch_size:
+            self.batch_size = min(MAX_BATCH_SIZE, self.batch_size * 2)
+        elif received < self.batch_size // 4:
+            self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+
+    async def _acquire_lock(self) -> int:
+        self._lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                await asyncio.sleep(LOCK_RETRY_INTERVAL)
+            else:
+                return fd
+
+    async def run(self) -> None:
+        fd = await self._acquire_lock()
+        try:
+            logger.info('Start polling Telegram updates')
+            await self._poll()
+        finally:
+            os.close(fd)
+
+    async def _poll(self) -> None:
+        offset = self.load_offset()
+        errors = 0
+        webhook_deleted = False
+
+        while True:
+            # 队列积压时暂停拉取, 未确认的更新会留在 Telegram 那边
+            if self.update_queue.is_full(UpdateSource.TELEGRAM):
+                await asyncio.sleep(self.update_queue.retry_after)
+                continue
+
+            try:
+                # 与 getUpdates 一样重试, 临时的错误不会让轮询停止
+                if not webhook_deleted:
+                    await self.bot.delete_webhook()
+                    webhook_deleted = True
+                updates = await self.bot.get_updates(
+                    offset=offset,
+                    limit=self.batch_size,
+                    timeout=self.timeout,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            except RetryAfter as e:
+                await asyncio.sleep(retry_after_seconds(e))
+                continue
+            except TelegramError as e:
+                errors += 1
+                delay = backoff(errors)
+                logger.warning(
+                    f'Polling failed ({e!r}), retry in {delay:.1f}s'
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            errors = 0
+            for update in updates:
+                await self.update_queue.put(update)
+            if updates:
+                offset = updates[-1].update_id + 1
+                self.save_offset(offset)
+            self.adapt_batch_size(len(updates))
+
+
+def create_poller(bot: Bot, update_queue: UpdateQueue) -> Poller:
+    return Poller(
+        bot,
+        update_queue,
+        data_dir=settings.DATA_DIR,
+        timeout=settings.TELEGRAM_POLLING_TIMEOUT,
+    )
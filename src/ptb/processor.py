@@ -0,0 +1,105 @@
+import asyncio
+from collections.abc import Awaitable, Coroutine, Hashable
+from typing import Any, cast
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from src.ptb.models import WebhookUpdate
+
+
+def update_key(update: object) -> Hashable | None:
+    """Updates with the same key are processed in the order received."""
+
+    if isinstance(update, WebhookUpdate):
+        return update.repository or update.source
+    if isinstance(update, Update) and update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different keys concurrently, in order per key.
+
+    At most `workers` updates run at the same time. The application
+    only takes a new update from the `update_queue` when one of the
+    `buffer_size` slots is free, so the queue (and its priority lanes
+    and admission control) still sees the real backlog.
+
+    `abort` cancels the updates being processed at shutdown, they are
+    collected in `aborted` together with the ones that had not started.
+    """
+
+    def __init__(self, workers: int, buffer_size: int) -> None:
+        super().__init__(max_concurrent_updates=buffer_size)
+        self.slots = asyncio.Semaphore(buffer_size)
+        self._workers = asyncio.Semaphore(workers)
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}
+        self._in_flight: dict[asyncio.Task, object] = {}
+        self._aborting = False
+        self.aborted: list[object] = []
+
+    async def do_process_update(
+        self,
+        update: object,
+        coroutine: Awaitable[Any],
+    ) -> None:
+        if self._aborting:
+            cast(Coroutine, coroutine).close()
+            self.aborted.append(update)
+            self.slots.release()
+            return
+
+        task = asyncio.current_task()
+        assert task is not None
+        self._in_flight[task] = update
+        try:
+            await self._process(update, coroutine)
+        except asyncio.CancelledError:
+            # 可能在等待时就被取消了, 还没有开始执行
+            cast(Coroutine, coroutine).close()
+            if self._aborting:
+                self.aborted.append(update)
+            raise
+        finally:
+            del self._in_flight[task]
+            self.slots.release()
+
+    async def _process(
+        self,
+        update: object,
+        coroutine: Awaitable[Any],
+    ) -> None:
+        key = update_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+
+        lock, waiters = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, waiters + 1)
+        try:
+            async with lock, self._workers:
+                await coroutine
+        finally:
+            lock, waiters = self._locks[key]
+            if waiters == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, waiters - 1)
+
+    def abort(self) -> None:
+        """Cancel the updates being processed, and skip the ones
+        arriving afterwards."""
+
+        self._aborting = True
+        for task in self._in_flight:
+            task.cancel()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,62 @@
+"""Keep only the fields of a GitHub payload that the bot uses.
+
+A `release` event carries the full `repository`, `sender`,
+`organization` and `installation` objects, most of which is never read.
+Payloads are projected right after their signature was verified, so the
+rest does not stay alive while the event is handled.
+"""
+
+from collections.abc import Mapping
+from typing import Any
+
+
+Projection = Mapping[str, 'Projection | None']
+"""The keys to keep, mapped to the projection of their value, or to
+`None` to keep the value as it is. The projection of a list applies to
+each of its items."""
+
+ASSET_PROJECTION: Projection = dict.fromkeys(
+    (
+        'id',
+        'name',
+        'browser_download_url',
+        'size',
+        'content_type',
+        'updated_at',
+    )
+)
+
+RELEASE_PROJECTION: Projection = dict.fromkeys(
+    (
+        'id',
+        'tag_name',
+        'name',
+        'body',
+        'html_url',
+        'draft',
+        'prerelease',
+        'published_at',
+    )
+) | {'assets': ASSET_PROJECTION}
+
+EVENT_PROJECTIONS: dict[str, Projection] = {
+    'release': {
+        'action': None,
+        'release': RELEASE_PROJECTION,
+        'repository': dict.fromkeys(('name', 'full_name', 'html_url')),
+    },
+}
+
+
+def project(value: Any, projection: Projection | None) -> Any:
+    if projection is None:
+        return value
+    if isinstance(value, list):
+        return [project(i, projection) for i in value]
+    if not isinstance(value, dict):
+        return value
+    return {
+        key: project(value[key], sub)
+        for key, sub in projection.items()
+        if key in value
+    }
@@ -0,0 +1,120 @@
+"""Render the release history of a repository page by page for /releases.
+
+Rendered pages are cached for `RELEASE_PAGE_CACHE_TTL` seconds, so
+paging back and forth does not call GitHub again, and concurrent
+requests for the same page share one API call.
+"""
+
+import asyncio
+import html
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass
+
+import httpx
+import orjson
+
+from src.config import settings
+from src.ptb import github
+
+
+@dataclass(frozen=True, slots=True)
+class ReleasePage:
+    text: str
+    page: int
+    has_next: bool
+    rendered_at: float
+
+
+def render_page(
+    repo: str, page: int, releases: list[dict], has_next: bool
+) -> ReleasePage:
+    lines = [f'<b>{html.escape(repo)}</b> releases, page {page}\n']
+    if not releases:
+        lines.append('There are no releases.')
+    for release in releases:
+        tag = release.get('tag_name') or ''
+        name = release.get('name') or tag
+        published_at = (release.get('published_at') or '')[:10] or 'draft'
+        details = [published_at, f'{len(release.get("assets") or [])} files']
+        if release.get('prerelease'):
+            details.append('pre-release')
+        lines.append(
+            f'🏷️ <a href="{html.escape(release["html_url"])}">'
+            f'{html.escape(name)}</a> <code>{html.escape(tag)}</code>\n'
+            f'    {" · ".join(details)}'
+        )
+    return ReleasePage(
+        text='\n'.join(lines),
+        page=page,
+        has_next=has_next,
+        rendered_at=time.monotonic(),
+    )
+
+
+class RepositoryNotFoundError(Exception): ...
+
+
+class ReleasePages:
+    def __init__(self, *, page_size: int, max_size: int, ttl: float) -> None:
+        self.page_size = page_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self._pages: OrderedDict[tuple[str, int], ReleasePage] = OrderedDict()
+        self._pending: dict[tuple[str, int], asyncio.Task[ReleasePage]] = {}
+
+    async def get(self, repo: str, page: int) -> ReleasePage:
+        """Return page `page` (starting at 1) of the releases of `repo`.
+
+        Raise `RepositoryNotFoundError` if GitHub does not know `repo`,
+        and `httpx.HTTPError` if the API call failed.
+        """
+
+        key = (repo, page)
+        cached = self._pages.get(key)
+        if cached is not None and time.monotonic() - cached.rendered_at < (
+            self.ttl
+        ):
+            self._pages.move_to_end(key)
+            return cached
+
+        if (task := self._pending.get(key)) is None:
+            task = asyncio.create_task(self._fetch(repo, page))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, repo: str, page: int) -> ReleasePage:
+        response = await github.get_client().get(
+            f'/repos/{repo}/releases',
+            params={'per_page': self.page_size, 'page': page},
+        )
+        if response.status_code == httpx.codes.NOT_FOUND:
+            raise RepositoryNotFoundError(repo)
+        response.raise_for_status()
+
+        rendered = render_page(
+            repo,
+            page,
+            orjson.loads(response.content),
+            has_next='next' in response.links,
+        )
+        self._pages[(repo, page)] = rendered
+        self._pages.move_to_end((repo, page))
+        while len(self._pages) > self.max_size:
+            self._pages.popitem(last=False)
+        return rendered
+
+    async def prefetch(self, repo: str, page: int) -> None:
+        """Render `page` ahead of time, ignoring any error."""
+
+        with suppress(RepositoryNotFoundError, httpx.HTTPError):
+            await self.get(repo, page)
+
+
+release_pages = ReleasePages(
+    page_size=settings.RELEASE_PAGE_SIZE,
+    max_size=settings.RELEASE_PAGE_CACHE_SIZE,
+    ttl=settings.RELEASE_PAGE_CACHE_TTL,
+)
@@ -0,0 +1,369 @@
+"""Keep every release that passed through the GitHub webhook.
+
+Releases are written in batches: `add` only queues the record, the
+queue is flushed in a single transaction once `batch_size` records are
+waiting or every `flush_interval` seconds, whichever comes first. Reads
+flush first, so they always see what has been added.
+
+The titles, notes and asset names of releases that were not deleted are
+also kept in an FTS5 index, updated with each flush, for `search`. Each
+release also records the bots it was received by, searches only see the
+releases of one bot.
+"""
+
+import asyncio
+import re
+import sqlite3
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import NamedTuple
+
+from src.config import settings
+from src.ptb.constants import DEFAULT_BOT
+from src.ptb.models import StoredAsset, StoredRelease
+from src.utils.sqlite import connect
+
+
+SCHEMA = (
+    (
+        'CREATE TABLE IF NOT EXISTS release ('
+        ' id INTEGER PRIMARY KEY,'
+        ' repository TEXT NOT NULL,'
+        ' tag TEXT NOT NULL,'
+        ' name TEXT,'
+        ' body TEXT,'
+        ' html_url TEXT NOT NULL,'
+        ' prerelease INTEGER NOT NULL,'
+        ' published_at REAL,'
+        ' action TEXT,'
+        ' deleted INTEGER NOT NULL'
+        ')'
+    ),
+    (
+        'CREATE INDEX IF NOT EXISTS release_published_at '
+        'ON release (published_at)'
+    ),
+    (
+        'CREATE TABLE IF NOT EXISTS release_asset ('
+        ' id INTEGER PRIMARY KEY,'
+        ' release_id INTEGER NOT NULL,'
+        ' name TEXT NOT NULL,'
+        ' url TEXT NOT NULL,'
+        ' size INTEGER NOT NULL,'
+        ' content_type TEXT NOT NULL,'
+        ' updated_at TEXT'
+        ')'
+    ),
+    (
+        'CREATE INDEX IF NOT EXISTS release_asset_release_id '
+        'ON release_asset (release_id)'
+    ),
+)
+
+BOT_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS release_bot ('
+    ' bot TEXT NOT NULL,'
+    ' release_id INTEGER NOT NULL,'
+    ' PRIMARY KEY (bot, release_id)'
+    ') WITHOUT ROWID'
+)
+
+SEARCH_SCHEMA = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS release_search USING fts5('
+    ' repository, tag, name, body, assets'
+    ')'
+)
+# 各列在排序时的权重, 依次为 repository, tag, name, body, assets
+SEARCH_RANK = 'bm25(release_search, 2.0, 5.0, 5.0, 1.0, 2.0)'
+
+# snippet 中用来标记匹配内容的字符, 由调用方替换成需要的格式
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_WORD = re.compile(r'\w+')
+
+
+def search_query(text: str) -> str | None:
+    """Turn user input into an FTS5 query matching all of its words.
+
+    Every word is quoted, so the input cannot use (or break) the query
+    syntax, and the last one matches as a prefix, for search-as-you-type.
+    """
+
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    return ' '.join(f'"{i}"' for i in words) + '*'
+
+
+class SearchHit(NamedTuple):
+    release: StoredRelease
+    # 匹配的片段, 匹配的内容位于 HIGHLIGHT_START 和 HIGHLIGHT_END 之间
+    snippet: str
+
+
+RELEASE_COLUMNS = (
+    'id, repository, tag, name, body, html_url, prerelease, published_at, '
+    'action, deleted'
+)
+ASSET_COLUMNS = 'id, release_id, name, url, size, content_type, updated_at'
+
+
+def _timestamp(value: datetime | None) -> float | None:
+    return None if value is None else value.timestamp()
+
+
+def _release_row(release: StoredRelease) -> tuple:
+    return (
+        release.id,
+        release.repository,
+        release.tag,
+        release.name,
+        release.body,
+        release.html_url,
+        release.prerelease,
+        _timestamp(release.published_at),
+        release.action,
+        release.deleted,
+    )
+
+
+class ReleaseStore:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        batch_size: int,
+        flush_interval: float,
+    ) -> None:
+        self._path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # 同一个 release 只保留最后一次的记录
+        self._pending: dict[int, StoredRelease] = {}
+        self._pending_bots: set[tuple[str, int]] = set()
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            # 同时启动的 worker 依次建表
+            connection.execute('BEGIN IMMEDIATE')
+            for statement in (*SCHEMA, BOT_SCHEMA, SEARCH_SCHEMA):
+                connection.execute(statement)
+            connection.execute('COMMIT')
+            self._connection = connection
+        return self._connection
+
+    def add(self, release: StoredRelease, *, bot: str = DEFAULT_BOT) -> None:
+        """Record `release`, received by `bot`."""
+
+        self._pending[release.id] = release
+        self._pending_bots.add((bot, release.id))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write the queued records, return how many there were."""
+
+        if not self._pending:
+            return 0
+        releases = list(self._pending.values())
+        release_bots = list(self._pending_bots)
+        self._pending.clear()
+        self._pending_bots.clear()
+
+        connection = self.connection
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(
+                f'INSERT INTO release ({RELEASE_COLUMNS}) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET '
+                ' repository = excluded.repository,'
+                ' tag = excluded.tag,'
+                ' name = excluded.name,'
+                ' body = excluded.body,'
+                ' html_url = excluded.html_url,'
+                ' prerelease = excluded.prerelease,'
+                ' published_at = excluded.published_at,'
+                ' action = excluded.action,'
+                ' deleted = excluded.deleted',
+                [_release_row(i) for i in releases],
+            )
+            connection.executemany(
+                'INSERT OR IGNORE INTO release_bot (bot, release_id) '
+                'VALUES (?, ?)',
+                release_bots,
+            )
+            connection.executemany(
+                'DELETE FROM release_asset WHERE release_id = ?',
+                [(i.id,) for i in releases],
+            )
+            connection.executemany(
+                f'INSERT OR REPLACE INTO release_asset ({ASSET_COLUMNS}) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        asset.id,
+                        asset.release_id,
+                        asset.name,
+                        asset.url,
+                        asset.size,
+                        asset.content_type,
+                        asset.updated_at,
+                    )
+                    for release in releases
+                    for asset in release.assets
+                ],
+            )
+            connection.executemany(
+                'DELETE FROM release_search WHERE rowid = ?',
+                [(i.id,) for i in releases],
+            )
+            connection.executemany(
+                'INSERT INTO release_search '
+                '(rowid, repository, tag, name, body, assets) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        i.id,
+                        i.repository,
+                        i.tag,
+                        i.name,
+                        i.body,
+                        ' '.join(asset.name for asset in i.assets),
+                    )
+                    for i in releases
+                    if not i.deleted
+                ],
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return len(releases)
+
+    async def run(self) -> None:
+        """Flush the queued records periodically."""
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def _releases(self, where: str, params: Iterable) -> list[StoredRelease]:
+        self.flush()
+        rows = self.connection.execute(
+            f'SELECT {RELEASE_COLUMNS} FROM release {where}', tuple(params)
+        ).fetchall()
+        if not rows:
+            return []
+
+        assets: dict[int, list[StoredAsset]] = {row[0]: [] for row in rows}
+        placeholders = ', '.join('?' * len(assets))
+        for row in self.connection.execute(
+            f'SELECT {ASSET_COLUMNS} FROM release_asset '
+            f'WHERE release_id IN ({placeholders}) ORDER BY id',
+            tuple(assets),
+        ):
+            assets[row[1]].append(
+                StoredAsset.model_construct(
+                    id=row[0],
+                    release_id=row[1],
+                    name=row[2],
+                    url=row[3],
+                    size=row[4],
+                    content_type=row[5],
+                    updated_at=row[6],
+                )
+            )
+
+        # 数据库中的行写入前已经校验过, 直接构建以省去再次校验的开销
+        return [
+            StoredRelease.model_construct(
+                id=row[0],
+                repository=row[1],
+                tag=row[2],
+                name=row[3],
+                body=row[4],
+                html_url=row[5],
+                prerelease=bool(row[6]),
+                published_at=None
+                if row[7] is None
+                else datetime.fromtimestamp(row[7], UTC),
+                action=row[8],
+                deleted=bool(row[9]),
+                assets=assets[row[0]],
+            )
+            for row in rows
+        ]
+
+    def get(self, release_id: int) -> StoredRelease | None:
+        releases = self._releases('WHERE id = ?', (release_id,))
+        return releases[0] if releases else None
+
+    def published_between(
+        self, start: datetime, end: datetime, *, bot: str
+    ) -> list[StoredRelease]:
+        """Releases received by `bot` published in `[start, end)`, oldest
+        first."""
+
+        return self._releases(
+            'WHERE published_at >= ? AND published_at < ? AND NOT deleted '
+            'AND id IN (SELECT release_id FROM release_bot WHERE bot = ?) '
+            'ORDER BY published_at',
+            (start.timestamp(), end.timestamp(), bot),
+        )
+
+    def search(
+        self,
+        text: str,
+        *,
+        bot: str,
+        limit: int = 10,
+        offset: int = 0,
+    ) -> list[SearchHit]:
+        """Releases received by `bot` matching all words of `text`, best
+        matches first."""
+
+        if (query := search_query(text)) is None:
+            return []
+
+        self.flush()
+        rows = self.connection.execute(
+            "SELECT rowid, snippet(release_search, -1, ?, ?, '…', 16) "
+            'FROM release_search WHERE release_search MATCH ? '
+            'AND rowid IN (SELECT release_id FROM release_bot WHERE bot = ?) '
+            f'ORDER BY {SEARCH_RANK} LIMIT ? OFFSET ?',
+            (HIGHLIGHT_START, HIGHLIGHT_END, query, bot, limit, offset),
+        ).fetchall()
+        if not rows:
+            return []
+
+        placeholders = ', '.join('?' * len(rows))
+        releases = {
+            i.id: i
+            for i in self._releases(
+                f'WHERE id IN ({placeholders})', (row[0] for row in rows)
+            )
+        }
+        return [
+            SearchHit(releases[id_], snippet)
+            for id_, snippet in rows
+            if id_ in releases
+        ]
+
+    def close(self) -> None:
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+release_store = ReleaseStore(
+    settings.DATA_DIR / 'releases.sqlite3',
+    batch_size=settings.RELEASE_STORE_BATCH_SIZE,
+    flush_interval=settings.RELEASE_STORE_FLUSH_INTERVAL,
+)
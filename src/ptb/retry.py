@@ -0,0 +1,95 @@
+import asyncio
+import random
+from collections.abc import Awaitable, Callable
+from datetime import timedelta
+from enum import StrEnum, auto
+from typing import TypeVar
+
+from telegram.error import (
+    BadRequest,
+    NetworkError,
+    RetryAfter,
+    TelegramError,
+    TimedOut,
+)
+
+from src.config import settings
+from src.logger import logger
+from src.ptb.health import send_stats
+
+
+T = TypeVar('T')
+
+
+class ErrorKind(StrEnum):
+    # 限流或网络问题, 稍后重试
+    RETRYABLE = auto()
+    # 文本格式有误, 重试也不会成功
+    PARSE = auto()
+    # 其他请求错误, 例如没有权限或聊天不存在
+    FATAL = auto()
+
+
+def classify(error: TelegramError) -> ErrorKind:
+    # BadRequest 是 NetworkError 的子类, 需要先判断
+    if isinstance(error, BadRequest):
+        if "can't parse entities" in error.message.lower():
+            return ErrorKind.PARSE
+        return ErrorKind.FATAL
+    if isinstance(error, RetryAfter | TimedOut | NetworkError):
+        return ErrorKind.RETRYABLE
+    return ErrorKind.FATAL
+
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter for the `attempt`-th retry."""
+
+    delay = min(
+        settings.SEND_RETRY_MAX_DELAY,
+        settings.SEND_RETRY_BASE_DELAY * 2**attempt,
+    )
+    return random.uniform(0, delay)
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def with_retry(call: Callable[[], Awaitable[T]]) -> T:
+    """Await `call()`, retrying retryable Telegram errors.
+
+    Flood limits wait for the `retry_after` Telegram asks for, other
+    retryable errors back off exponentially. After
+    `SEND_RETRY_ATTEMPTS` attempts, or on any other error, the last
+    error is raised.
+    """
+
+    attempt = 0
+    while True:
+        try:
+            result = await call()
+        except TelegramError as e:
+            kind = classify(e)
+            send_stats.record(kind != ErrorKind.RETRYABLE)
+            attempt += 1
+            if (
+                kind != ErrorKind.RETRYABLE
+                or attempt >= settings.SEND_RETRY_ATTEMPTS
+            ):
+                raise
+
+            if isinstance(e, RetryAfter):
+                delay = retry_after_seconds(e) + random.uniform(0, 1)
+            else:
+                delay = backoff(attempt)
+            logger.warning(
+                f'Telegram request failed ({e!r}), '
+                f'retry {attempt} in {delay:.1f}s'
+            )
+            await asyncio.sleep(delay)
+        else:
+            send_stats.record(True)
+            return result
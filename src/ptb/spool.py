@@ -0,0 +1,121 @@
+"""Hand the updates left at shutdown over to the next boot.
+
+When gunicorn stops a worker, its queues are closed, so new deliveries
+are answered with `503` and retried by GitHub and Telegram later, and
+the backlog is handled as usual, flood limits included, until
+`SHUTDOWN_DRAIN_TIMEOUT`. Whatever is still queued or being processed by
+then is written to the spool and queued again by the next worker that
+starts. Updates interrupted halfway may be delivered twice, edits of an
+announced release are idempotent thanks to the message index.
+"""
+
+import asyncio
+import sqlite3
+from pathlib import Path
+from typing import NamedTuple, cast
+
+import orjson
+from telegram import Update
+from telegram.ext import Application
+
+from src.config import settings
+from src.logger import logger
+from src.ptb.models import WebhookUpdate
+from src.ptb.processor import KeyedUpdateProcessor
+from src.ptb.update_queue import UpdateQueue
+from src.utils.sqlite import connect
+
+
+class SpooledUpdate(NamedTuple):
+    bot: str
+    update: WebhookUpdate | dict
+
+
+async def drain(app: Application, timeout: float) -> list[object]:
+    """Stop `app` once its backlog was handled, or after `timeout`
+    seconds, return the updates that were not handled."""
+
+    queue = cast(UpdateQueue, app.update_queue)
+    processor = cast(KeyedUpdateProcessor, app.update_processor)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    queue.close()
+    try:
+        await asyncio.wait_for(queue.join(), timeout)
+    except TimeoutError:
+        processor.abort()
+    left = queue.take_all()
+    # stop 会等待 create_task 启动的任务, 例如上传附件, 超时后取消它们
+    try:
+        await asyncio.wait_for(app.stop(), max(deadline - loop.time(), 0))
+    except TimeoutError:
+        logger.warning('Cancelled the tasks still running at shutdown')
+    return [*processor.aborted, *left]
+
+
+class UpdateSpool:
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = connect(self._path)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS spooled_update ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' bot TEXT NOT NULL,'
+                ' kind TEXT NOT NULL,'
+                ' payload BLOB NOT NULL'
+                ')'
+            )
+            self._connection = connection
+        return self._connection
+
+    def add(self, bot: str, updates: list[object]) -> int:
+        """Spool the `updates` of `bot`, return how many were."""
+
+        rows = []
+        for update in updates:
+            if isinstance(update, WebhookUpdate):
+                rows.append((bot, 'webhook', update.to_json()))
+            elif isinstance(update, Update):
+                rows.append((bot, 'telegram', orjson.dumps(update.to_dict())))
+            else:
+                logger.warning(f'Dropped update {update!r} of bot {bot!r}')
+        self.connection.executemany(
+            'INSERT INTO spooled_update (bot, kind, payload) VALUES (?, ?, ?)',
+            rows,
+        )
+        return len(rows)
+
+    def take(self) -> list[SpooledUpdate]:
+        """Remove the spooled updates and return them, in the order they
+        were spooled.
+
+        Telegram updates are returned as their JSON object, they can only
+        be decoded with the bot they belong to.
+        """
+
+        rows = self.connection.execute(
+            'DELETE FROM spooled_update RETURNING id, bot, kind, payload'
+        ).fetchall()
+        rows.sort()
+        return [
+            SpooledUpdate(
+                bot,
+                WebhookUpdate.from_json(payload)
+                if kind == 'webhook'
+                else orjson.loads(payload),
+            )
+            for _, bot, kind, payload in rows
+        ]
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+spool = UpdateSpool(settings.DATA_DIR / 'spool.sqlite3')
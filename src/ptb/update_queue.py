@@ -0,0 +1,199 @@
+import asyncio
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from src.config import settings
+from src.exceptions import ServiceUnavailableError
+from src.ptb.models import UpdateSource, WebhookUpdate
+
+
+def update_source(update: object) -> UpdateSource:
+    if isinstance(update, WebhookUpdate):
+        return update.source
+    return UpdateSource.TELEGRAM
+
+
+@dataclass
+class Lane:
+    weight: int
+    limit: int
+    items: deque[tuple[float, object]] = field(default_factory=deque)
+    # 平滑加权轮询的当前权重
+    current: int = 0
+
+    dequeued: int = 0
+    total_wait: float = 0
+    max_wait: float = 0
+
+    def metrics(self, now: float) -> dict:
+        dequeued = self.dequeued or 1
+        return {
+            'depth': len(self.items),
+            'limit': self.limit,
+            'weight': self.weight,
+            'dequeued': self.dequeued,
+            'oldest_age': now - self.items[0][0] if self.items else 0,
+            'avg_wait': self.total_wait / dequeued,
+            'max_wait': self.max_wait,
+        }
+
+
+class UpdateQueue(asyncio.Queue):
+    """`update_queue` with per-source lanes and admission control.
+
+    Every source gets its own lane, `get` picks between the non-empty
+    lanes by smooth weighted round-robin, so interactive Telegram
+    updates are not stuck behind a burst of webhook notifications while
+    low priority lanes still make progress.
+
+    The queue itself never blocks producers, instead the webhook
+    endpoints call `admit` before doing any work and answer `503` with a
+    `Retry-After` header once the backlog of their source, or the whole
+    queue, reaches its high-water mark.
+
+    When `backpressure` is set, `get` first takes one of its slots, the
+    update processor gives it back once the update has been handled.
+
+    Once `close`d at shutdown every source is rejected, while the
+    backlog is drained, see `src.ptb.spool.drain`.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        lanes: dict[UpdateSource, Lane],
+        retry_after: int,
+    ) -> None:
+        self.lanes = lanes
+        self.max_size = max_size
+        self.retry_after = retry_after
+        self.rejected: Counter[UpdateSource] = Counter()
+        self.backpressure: asyncio.Semaphore | None = None
+        self.closed = False
+        super().__init__()
+
+    async def get(self):
+        if self.backpressure is None:
+            return await super().get()
+
+        await self.backpressure.acquire()
+        try:
+            return await super().get()
+        except BaseException:
+            self.backpressure.release()
+            raise
+
+    # asyncio.Queue 使用 _init/_put/_get 管理底层容器
+    def _init(self, maxsize: int) -> None:
+        self._size = 0
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def _put(self, item) -> None:
+        self.lanes[update_source(item)].items.append((time.monotonic(), item))
+        self._size += 1
+
+    def _get(self):
+        total = 0
+        selected: Lane | None = None
+        for lane in self.lanes.values():
+            if not lane.items:
+                continue
+            lane.current += lane.weight
+            total += lane.weight
+            if selected is None or lane.current > selected.current:
+                selected = lane
+
+        assert selected is not None
+        selected.current -= total
+        put_at, item = selected.items.popleft()
+        self._size -= 1
+
+        wait = time.monotonic() - put_at
+        selected.dequeued += 1
+        selected.total_wait += wait
+        selected.max_wait = max(selected.max_wait, wait)
+        return item
+
+    def is_full(self, source: UpdateSource) -> bool:
+        lane = self.lanes[source]
+        return self._size >= self.max_size or len(lane.items) >= lane.limit
+
+    def oldest_age(self) -> float:
+        """For how many seconds the oldest queued update has waited."""
+
+        oldest = min(
+            (lane.items[0][0] for lane in self.lanes.values() if lane.items),
+            default=None,
+        )
+        return 0 if oldest is None else time.monotonic() - oldest
+
+    def admit(self, source: UpdateSource) -> None:
+        """Raise `ServiceUnavailableError` if `source` has to back off."""
+
+        if self.closed:
+            self.rejected[source] += 1
+            raise ServiceUnavailableError(
+                message='The service is shutting down',
+                retry_after=self.retry_after,
+            )
+        if self.is_full(source):
+            self.rejected[source] += 1
+            raise ServiceUnavailableError(retry_after=self.retry_after)
+
+    def close(self) -> None:
+        """Reject all sources from now on."""
+
+        self.closed = True
+
+    def take_all(self) -> list[object]:
+        """Remove the queued updates and return them."""
+
+        items = [
+            item for lane in self.lanes.values() for _, item in lane.items
+        ]
+        for lane in self.lanes.values():
+            lane.items.clear()
+        self._size = 0
+        # 这些更新不会再被处理, 否则 join 会一直等待
+        for _ in items:
+            self.task_done()
+        return items
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        return {
+            'depth': self._size,
+            'max_size': self.max_size,
+            'closed': self.closed,
+            'lanes': {
+                source: {
+                    **lane.metrics(now),
+                    'rejected': self.rejected[source],
+                }
+                for source, lane in self.lanes.items()
+            },
+        }
+
+
+def create_update_queue() -> UpdateQueue:
+    return UpdateQueue(
+        max_size=settings.UPDATE_QUEUE_MAX_SIZE,
+        lanes={
+            UpdateSource.TELEGRAM: Lane(
+                weight=settings.UPDATE_QUEUE_TELEGRAM_WEIGHT,
+                limit=settings.UPDATE_QUEUE_TELEGRAM_LIMIT,
+            ),
+            UpdateSource.GITHUB: Lane(
+                weight=settings.UPDATE_QUEUE_GITHUB_WEIGHT,
+                limit=settings.UPDATE_QUEUE_GITHUB_LIMIT,
+            ),
+        },
+        retry_after=settings.UPDATE_QUEUE_RETRY_AFTER,
+    )
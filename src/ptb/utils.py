@@ -1,6 +1,5 @@
 from telegram.ext import Application, CallbackContext, ExtBot
 
-from src.config import settings
 from src.ptb.models import WebhookUpdate
 
 
@@ -19,6 +18,19 @@ class CustomContext(CallbackContext[ExtBot, dict, dict, dict]):
         if isinstance(update, WebhookUpdate):
             return cls(
                 application=telegram_bot,
-                user_id=settings.TELEGRAM_ADMIN_CHAT_ID,
+                user_id=telegram_bot.bot_data['admin_chat_id'],
             )
         return super().from_update(update, telegram_bot)
+
+    @property
+    def bot_name(self) -> str:
+        """The name of this bot in `TELEGRAM_BOTS`, `DEFAULT_BOT` for the
+        default one."""
+
+        return self.bot_data['bot']
+
+    @property
+    def admin_chat_id(self) -> int:
+        """The chat this bot sends its notifications to."""
+
+        return self.bot_data['admin_chat_id']
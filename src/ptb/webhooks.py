@@ -1,28 +1,96 @@
+from dataclasses import asdict
 from typing import cast
 
-from fastapi import APIRouter, Request
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
+from starlette.status import HTTP_200_OK, HTTP_503_SERVICE_UNAVAILABLE
 from telegram import Update
-
-from src.ptb import tgbot
-from src.ptb.models import WebhookUpdate
+from telegram.constants import MessageLimit
+from telegram.ext import Application
+
+from src.ptb import assets, tgbot, update_queue
+from src.ptb.bots import bots
+from src.ptb.constants import RETRACTED_ACTIONS
+from src.ptb.digests import digests
+from src.ptb.health import readiness
+from src.ptb.models import (
+    ReleaseAsset,
+    StoredRelease,
+    UpdateSource,
+    WebhookUpdate,
+)
+from src.ptb.release_store import release_store
 from src.utils.telegram import text as tg_text
+from src.utils.telegram.markdown import render_release_body
 
-from .dependencies import ReleaseData, RequestIP
+from .dependencies import (
+    ReleaseData,
+    admission,
+    bot_admission,
+    valid_bot_telegram_update,
+    valid_github_source,
+    valid_telegram_update,
+)
 
 
 router = APIRouter()
 
 
-@router.post('/telegram', response_model=None)
-async def telegram(request: Request):
+@router.post(
+    '/telegram',
+    response_model=None,
+    dependencies=[
+        Depends(valid_telegram_update),
+        admission(UpdateSource.TELEGRAM),
+    ],
+)
+async def telegram(request: Request, background_tasks: BackgroundTasks):
     """Handle incoming Telegram updates by putting them into the
-    `update_queue`"""
+    `update_queue`
+
+    Only the body is read here, decoding it into an `Update` happens
+    after the response has been sent.
+    """
 
-    await tgbot.update_queue.put(
-        Update.de_json(data=await request.json(), bot=tgbot.bot)
+    background_tasks.add_task(
+        enqueue_telegram_update, tgbot, await request.body()
     )
 
 
+async def enqueue_telegram_update(app: Application, body: bytes) -> None:
+    update = Update.de_json(data=orjson.loads(body), bot=app.bot)
+    await app.update_queue.put(update)
+
+
+@router.post(
+    '/{bot}/telegram',
+    response_model=None,
+    dependencies=[
+        Depends(valid_bot_telegram_update),
+        bot_admission(UpdateSource.TELEGRAM),
+    ],
+)
+async def bot_telegram(
+    bot: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+):
+    """Like `telegram`, for the bots of `TELEGRAM_BOTS`.
+
+    The bot is started, if it is not running yet, after the response has
+    been sent.
+    """
+
+    background_tasks.add_task(
+        enqueue_bot_telegram_update, bot, await request.body()
+    )
+
+
+async def enqueue_bot_telegram_update(bot: str, body: bytes) -> None:
+    await enqueue_telegram_update(await bots.get(bot), body)
+
+
 @router.get('/healthcheck', response_model=str)
 async def health() -> str:
     """For the health endpoint, reply with a simple plain text message."""
@@ -30,41 +98,134 @@ async def health() -> str:
     return 'The bot is still running fine :)'
 
 
+@router.get('/livez')
+async def livez() -> Response:
+    """Fail once the bot stopped, the worker has to be restarted."""
+
+    if not tgbot.running:
+        return Response('stopped', status_code=HTTP_503_SERVICE_UNAVAILABLE)
+    return Response('ok')
+
+
+@router.get('/readyz')
+async def readyz() -> Response:
+    """Fail while the worker should not receive updates, see
+    `src.ptb.health`."""
+
+    report = readiness.report(update_queue)
+    return ORJSONResponse(
+        report,
+        status_code=HTTP_200_OK
+        if report['ready']
+        else HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+@router.get('/metrics')
+async def metrics() -> dict:
+    return {
+        'update_queue': update_queue.metrics(),
+        'asset_mirror': asdict(assets.metrics),
+        'bots': bots.metrics(),
+    }
+
+
 @router.post('/check')
-async def check(req: Request, req_ip: RequestIP):
-    headers = tg_text.code(tg_text.escape(str(req.headers)))
-    await tgbot.update_queue.put(WebhookUpdate(text=headers))
+async def check(req: Request) -> dict:
+    """Capture the request, to be inspected with the bot's /show command.
+
+    The body is read so that the capture includes it.
+    """
+
+    await req.body()
+    return {'capture_id': req.state.capture_id}
+
+
+@router.post(
+    '/gh',
+    dependencies=[
+        Depends(valid_github_source),
+        admission(UpdateSource.GITHUB),
+    ],
+)
+async def github_webhook_release(data: ReleaseData):
+    if data is not None:
+        await publish_release(data)
+
 
-    request_ip = tg_text.code(tg_text.escape(str(req_ip)))
-    await tgbot.update_queue.put(WebhookUpdate(text=request_ip))
+async def publish_release(data: dict) -> None:
+    """Record a `release` event and queue its notification.
 
-    content = tg_text.code(tg_text.escape(str(await req.body())))
-    await tgbot.update_queue.put(WebhookUpdate(text=content))
+    Used for the events delivered to `/gh` and for those made up by the
+    poller, see `src.ptb.github_poller`.
+    """
 
+    release = StoredRelease.from_payload(data)
+    release_store.add(release)
+    digests.record(release)
+    await tgbot.update_queue.put(release_update(data))
 
-@router.post('/gh')
-async def github_webhook_release(req: Request, data: ReleaseData):
-    if data is None:
-        return
 
-    release: dict = data.pop('release')
+@router.post(
+    '/{bot}/gh',
+    dependencies=[
+        Depends(valid_github_source),
+        bot_admission(UpdateSource.GITHUB),
+    ],
+)
+async def bot_github_webhook_release(bot: str, data: ReleaseData):
+    if data is not None:
+        release_store.add(StoredRelease.from_payload(data), bot=bot)
+        app = await bots.get(bot)
+        await app.update_queue.put(release_update(data))
+
+
+def release_update(data: dict) -> WebhookUpdate:
+    """Build the notification for a `release` event."""
+
+    action = cast(str | None, data.get('action'))
+    release: dict = data['release']
+    release_id = cast(int, release.get('id'))
     release_url = cast(str, release.get('html_url'))
     release_version = release.get('name')
     release_published_at = release.get('published_at')
-    release_body = cast(str, release.get('body'))  # noqa: F841
+    release_body = cast(str | None, release.get('body'))
 
-    repository: dict = data.pop('repository')
+    repository: dict = data['repository']
     repo_name = repository.get('name')
+    repo_full_name = cast(str | None, repository.get('full_name'))
     repo_url = cast(str, repository.get('html_url'))
 
+    if action in RETRACTED_ACTIONS:
+        content = (
+            f'🗑️ Release {tg_text.escape(action)}{tg_text.escape(".")}\n'
+            f'💥 Version: {tg_text.delete(tg_text.escape(release_version))}\n'
+            f'📦 Repository: {tg_text.inline_code(tg_text.escape(repo_name))}\n'
+            f'🔗 Repository URL: {tg_text.link(tg_text.escape(repo_url), repo_url)}'
+        )
+        return WebhookUpdate(
+            text=content,
+            release_id=release_id,
+            action=action,
+            repository=repo_full_name,
+        )
+
     assets = []
     for asset in release.get('assets') or []:
-        asset_name = asset.get('name')
-        asset_url = asset.get('browser_download_url')
-        assets.append({'name': asset_name, 'url': asset_url})
+        assets.append(
+            ReleaseAsset(
+                id=asset['id'],
+                name=asset['name'],
+                url=asset['browser_download_url'],
+                size=asset['size'],
+                content_type=asset.get('content_type')
+                or 'application/octet-stream',
+                updated_at=asset.get('updated_at'),
+            )
+        )
 
     assets_text = '\n'.join(
-        tg_text.link(tg_text.escape(i['name']), i['url']) for i in assets
+        tg_text.link(tg_text.escape(i.name), i.url) for i in assets
     )
     content = (
         f'🎉 Release New Version{tg_text.escape("!")} 🤓☝️\n'
@@ -74,7 +235,17 @@ async def github_webhook_release(req: Request, data: ReleaseData):
         f'📦 Repository: {tg_text.inline_code(tg_text.escape(repo_name))}\n'
         f'🔗 Repository URL: {tg_text.link(tg_text.escape(repo_url), repo_url)}\n\n'
         f'📄 Files: \n{assets_text}\n\n'
-        # f'{tg_text.escape(release_body)}'
+    )
+    content += render_release_body(
+        release_id,
+        release_body,
+        limit=MessageLimit.MAX_TEXT_LENGTH - len(content),
     )
 
-    await tgbot.update_queue.put(WebhookUpdate(text=content))
+    return WebhookUpdate(
+        text=content,
+        assets=assets,
+        release_id=release_id,
+        action=action,
+        repository=repo_full_name,
+    )
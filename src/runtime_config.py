@@ -0,0 +1,179 @@
+"""Settings that can be changed without restarting the workers.
+
+`settings` is validated once at import, most of it sizes the pools,
+queues and databases created at startup. The values of `RELOADABLE` are
+read from `runtime_config.current` instead, a frozen snapshot holding
+them in the form the hot paths use, such as frozensets and keyed HMACs.
+
+The watcher validates the settings again on `SIGHUP`, or when one of the
+env files changes, and swaps the snapshot with a single assignment:
+readers take no lock and see either the old or the new snapshot, never a
+mix of both. Settings that do not validate leave the current snapshot in
+place.
+
+Environment variables take precedence over the env files, only values
+read from a file can be changed this way.
+"""
+
+import asyncio
+import signal
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from pydantic import ValidationError
+from starlette.middleware.cors import CORSMiddleware
+
+from src.config import Settings, settings
+from src.logger import logger
+from src.utils.signatures import WebhookKeys
+
+
+RELOADABLE = frozenset(
+    (
+        'ALLOW_ORIGINS',
+        'TRUSTED_PROXIES',
+        'GITHUB_WEBHOOK_SECRET',
+        'GITHUB_WEBHOOK_SECRETS',
+        'GITHUB_WEBHOOK_TARGET_SECRETS',
+        'GITHUB_WEBHOOK_EVENTS',
+        'GITHUB_POLL_REPOSITORIES',
+    )
+)
+
+
+@dataclass(frozen=True, slots=True)
+class RuntimeConfig:
+    settings: Settings
+    allow_origins: frozenset[str]
+    github_webhook_keys: WebhookKeys
+    # None 表示接受所有 action
+    github_webhook_events: frozenset[str] | None
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> 'RuntimeConfig':
+        events = settings.GITHUB_WEBHOOK_EVENTS
+        return cls(
+            settings=settings,
+            allow_origins=frozenset(settings.ALLOW_ORIGINS),
+            github_webhook_keys=WebhookKeys(
+                [
+                    settings.GITHUB_WEBHOOK_SECRET,
+                    *settings.GITHUB_WEBHOOK_SECRETS,
+                ],
+                settings.GITHUB_WEBHOOK_TARGET_SECRETS,
+            ),
+            github_webhook_events=None
+            if events is None
+            else frozenset(events),
+        )
+
+
+Listener = Callable[[RuntimeConfig], None]
+
+
+class ConfigWatcher:
+    def __init__(
+        self,
+        config: RuntimeConfig,
+        *,
+        files: Iterable[Path],
+        interval: float,
+    ) -> None:
+        self.current = config
+        self.files = list(files)
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self._listeners: list[Listener] = []
+        self._mtimes = self._stat()
+
+    def subscribe(self, listener: Listener) -> Listener:
+        """Call `listener` with every new snapshot, for values that have
+        to be rebuilt elsewhere."""
+
+        self._listeners.append(listener)
+        return listener
+
+    def _stat(self) -> list[float | None]:
+        mtimes = []
+        for path in self.files:
+            try:
+                mtimes.append(path.stat().st_mtime)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return mtimes
+
+    def reload(self) -> bool:
+        """Validate the settings again and swap the snapshot, return
+        whether they were valid."""
+
+        try:
+            new = Settings()  # type: ignore
+        except ValidationError as e:
+            self.failures += 1
+            logger.error(
+                f'Kept the current settings, new ones are invalid: {e}'
+            )
+            return False
+
+        # 其他配置在启动时就已经用掉了, 与启动时的值比较
+        if restart := [
+            name
+            for name in Settings.model_fields
+            if name not in RELOADABLE
+            and getattr(new, name) != getattr(settings, name)
+        ]:
+            logger.warning(
+                f'{", ".join(restart)} changed, '
+                f'restart the workers to apply the change'
+            )
+
+        old = self.current.settings
+        changed = [
+            name
+            for name in RELOADABLE
+            if getattr(new, name) != getattr(old, name)
+        ]
+        if not changed:
+            return True
+
+        self.current = RuntimeConfig.from_settings(new)
+        self.reloads += 1
+        for listener in self._listeners:
+            listener(self.current)
+        logger.info(f'Reloaded {", ".join(sorted(changed))}')
+        return True
+
+    async def run(self) -> None:
+        """Reload on `SIGHUP` and whenever an env file changed."""
+
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, self.reload)
+        except (ValueError, RuntimeError):
+            # 不在主线程中运行, 例如在测试中, 只能检查文件
+            logger.warning('Cannot reload the settings on SIGHUP')
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                if (mtimes := self._stat()) != self._mtimes:
+                    self._mtimes = mtimes
+                    self.reload()
+        finally:
+            loop.remove_signal_handler(signal.SIGHUP)
+
+
+class ReloadableCORSMiddleware(CORSMiddleware):
+    """`CORSMiddleware` allowing the origins of the current snapshot."""
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        origins = runtime_config.current.allow_origins
+        return '*' in origins or origin in origins
+
+
+runtime_config = ConfigWatcher(
+    RuntimeConfig.from_settings(settings),
+    files=[Path(i) for i in Settings.model_config.get('env_file') or ()],
+    interval=settings.CONFIG_WATCH_INTERVAL,
+)
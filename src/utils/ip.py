@@ -0,0 +1,107 @@
+from collections.abc import Iterable
+from ipaddress import (
+    IPv4Address,
+    IPv4Network,
+    IPv6Address,
+    IPv6Network,
+    ip_address,
+    ip_network,
+)
+
+from fastapi import Request
+
+from src.config import settings
+from src.runtime_config import RuntimeConfig, runtime_config
+
+
+class CidrTrie:
+    """A set of IP networks stored as a binary trie of their prefixes.
+
+    Looking up an address visits at most one node per bit of the longest
+    stored prefix, however many networks the set holds.
+    """
+
+    def __init__(
+        self, networks: Iterable[IPv4Network | IPv6Network | str] = ()
+    ) -> None:
+        # 每个节点为 [0 分支, 1 分支, 是否为某个网段的结尾]
+        self._roots: dict[int, list] = {
+            4: [None, None, False],
+            6: [None, None, False],
+        }
+        self._size = 0
+        for network in networks:
+            self.add(network)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, network: IPv4Network | IPv6Network | str) -> None:
+        network = ip_network(network, strict=False)
+        width = network.max_prefixlen
+        bits = int(network.network_address)
+
+        node = self._roots[network.version]
+        for i in range(network.prefixlen):
+            bit = (bits >> (width - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+        if not node[2]:
+            node[2] = True
+            self._size += 1
+
+    def __contains__(self, address: object) -> bool:
+        if not isinstance(address, IPv4Address | IPv6Address):
+            try:
+                address = ip_address(str(address))
+            except ValueError:
+                return False
+        if isinstance(address, IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        width = address.max_prefixlen
+        bits = int(address)
+        node = self._roots[address.version]
+        for i in range(width):
+            if node[2]:
+                return True
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return False
+        return node[2]
+
+
+trusted_proxies = CidrTrie(settings.TRUSTED_PROXIES)
+
+
+@runtime_config.subscribe
+def _reload_trusted_proxies(config: RuntimeConfig) -> None:
+    global trusted_proxies
+    trusted_proxies = CidrTrie(config.settings.TRUSTED_PROXIES)
+
+
+def client_ip(request: Request) -> str | None:
+    """The address of the client, as seen by the first trusted proxy.
+
+    `X-Forwarded-For` is only taken into account when the connection
+    comes from one of `TRUSTED_PROXIES`, and then only up to the first
+    hop, counted from the right, that is not a trusted proxy itself,
+    since everything before it may have been made up by the client.
+    """
+
+    if request.client is None:
+        return None
+
+    # 重新加载配置时会替换它, 同一个请求只使用其中一个
+    proxies = trusted_proxies
+    ip = request.client.host
+    if ip not in proxies:
+        return ip
+
+    if forwarded_for := request.headers.get('x-forwarded-for'):
+        for hop in reversed(forwarded_for.split(',')):
+            ip = hop.strip()
+            if ip not in proxies:
+                break
+    return ip
@@ -0,0 +1,67 @@
+"""Verify the `X-Hub-Signature-256` of GitHub webhooks against several
+secrets.
+
+Each secret is turned into a keyed HMAC-SHA256 state once, when the
+settings are loaded, verifying a request only `.copy()`s it, so neither
+the key padding nor the hash of the padded key is computed again per
+request. The candidates for a request are looked up by the hook target
+GitHub sends in the headers, so a delivery is checked against the one or
+two secrets of its repository or organization while they are rotated,
+not against every secret known.
+"""
+
+import hashlib
+import hmac
+from collections.abc import Iterable, Mapping
+
+
+SIGNATURE_PREFIX = 'sha256='
+
+
+def _prepare(secret: str) -> hmac.HMAC:
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+
+class WebhookKeys:
+    """The prepared secrets, `default` for targets not in `targets`.
+
+    A target is `<type>:<id>`, from the
+    `X-GitHub-Hook-Installation-Target-Type` and `-ID` headers, such as
+    `repository:123`. Secrets are tried in the order given, list the
+    newest first.
+    """
+
+    def __init__(
+        self,
+        default: Iterable[str],
+        targets: Mapping[str, Iterable[str]],
+    ) -> None:
+        self._default = tuple(_prepare(i) for i in dict.fromkeys(default))
+        self._targets = {
+            target: tuple(_prepare(i) for i in dict.fromkeys(secrets))
+            for target, secrets in targets.items()
+        }
+
+    def candidates(self, target: str | None) -> tuple[hmac.HMAC, ...]:
+        if target is None:
+            return self._default
+        return self._targets.get(target, self._default)
+
+    def verify(
+        self,
+        body: bytes,
+        signature: str,
+        target: str | None = None,
+    ) -> bool:
+        """Whether `signature` is the signature of `body` by one of the
+        secrets of `target`."""
+
+        if not signature.startswith(SIGNATURE_PREFIX):
+            return False
+        expected = signature[len(SIGNATURE_PREFIX) :]
+        for key in self.candidates(target):
+            hash_object = key.copy()
+            hash_object.update(body)
+            if hmac.compare_digest(hash_object.hexdigest(), expected):
+                return True
+        return False
@@ -13,11 +13,14 @@ async def edit_message(
     query: CallbackQuery,
     text: str,
     keyboard: InlineKeyboardMarkup | None = None,
+    **kwargs,
 ) -> Message | bool:
     # See https://core.telegram.org/bots/api#callbackquery
     await query.answer()
 
-    return await query.edit_message_text(text=text, reply_markup=keyboard)
+    return await query.edit_message_text(
+        text=text, reply_markup=keyboard, **kwargs
+    )
 
 
 def build_cb_query_data(
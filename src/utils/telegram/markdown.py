@@ -0,0 +1,375 @@
+"""GitHub-flavored Markdown to Telegram MarkdownV2 / HTML.
+
+The converter walks the source once, line by line, and only ever emits
+entities that are opened and closed on the same output line (code fences
+are the one exception and are always closed, even when truncated), so
+cutting the output at any line boundary keeps it valid for Telegram.
+"""
+
+import hashlib
+import html
+import re
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+
+from telegram.constants import MessageLimit
+
+from src.utils.telegram.text import IS_HTML
+
+
+_MDV2_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+_MDV2_CODE_SPECIAL = re.compile(r'([`\\])')
+_MDV2_URL_SPECIAL = re.compile(r'([)\\])')
+
+_FENCE = re.compile(r'^\s*(```+|~~~+)\s*([\w+#.-]*)')
+_HEADING = re.compile(r'^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$')
+_BULLET = re.compile(r'^(\s*)[-*+]\s+(?:\[([ xX])\]\s+)?(.*)$')
+_ORDERED = re.compile(r'^(\s*)(\d{1,9})[.)]\s+(.*)$')
+_QUOTE = re.compile(r'^\s{0,3}>\s?(.*)$')
+_RULE = re.compile(r'^\s{0,3}([-*_])(\s*\1){2,}\s*$')
+_TABLE_DELIMITER = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+_HTML_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_HTML_TAG = re.compile(r'</?[a-zA-Z][^>]*>')
+
+# 允许链接中出现一层成对的括号
+_URL = r'(?:[^()\s]|\([^()\s]*\))+'
+_INLINE = re.compile(
+    r'(?P<code>`+)(?P<code_text>.+?)(?P=code)'
+    rf'|!\[(?P<image_text>[^\]]*)\]\((?P<image_url>{_URL})[^)]*\)'
+    rf'|\[(?P<link_text>[^\]]+)\]\((?P<link_url>{_URL})[^)]*\)'
+    r'|<(?P<autolink>https?://[^>\s]+)>'
+    r'|(?P<bold>\*\*|__)(?P<bold_text>\S(?:.*?\S)?)(?P=bold)'
+    r'|~~(?P<strike_text>\S(?:.*?\S)?)~~'
+    r'|(?<![\w*])\*(?P<star_text>[^*\s](?:[^*]*[^*\s])?)\*(?![\w*])'
+    r'|(?<![\w_])_(?P<under_text>[^_\s](?:[^_]*[^_\s])?)_(?![\w_])'
+    r'|(?<![\w@/])@(?P<mention>[a-zA-Z\d](?:[a-zA-Z\d]|-(?=[a-zA-Z\d])){0,38})'
+    r'(?![\w/])'
+)
+
+GITHUB_URL = 'https://github.com'
+ELLIPSIS = '…'
+
+
+def _escape_mdv2(text: str) -> str:
+    return _MDV2_SPECIAL.sub(r'\\\1', text)
+
+
+def _escape_mdv2_code(text: str) -> str:
+    return _MDV2_CODE_SPECIAL.sub(r'\\\1', text)
+
+
+def _escape_mdv2_url(text: str) -> str:
+    return _MDV2_URL_SPECIAL.sub(r'\\\1', text)
+
+
+class _Renderer:
+    def __init__(self, as_html: bool) -> None:
+        self.as_html = as_html
+
+    def escape(self, text: str) -> str:
+        if self.as_html:
+            return html.escape(text, quote=False)
+        return _escape_mdv2(text)
+
+    def bold(self, text: str) -> str:
+        return f'<b>{text}</b>' if self.as_html else f'*{text}*'
+
+    def italic(self, text: str) -> str:
+        return f'<i>{text}</i>' if self.as_html else f'_{text}_'
+
+    def strike(self, text: str) -> str:
+        return f'<s>{text}</s>' if self.as_html else f'~{text}~'
+
+    def inline_code(self, text: str) -> str:
+        if self.as_html:
+            return f'<code>{html.escape(text, quote=False)}</code>'
+        return f'`{_escape_mdv2_code(text)}`'
+
+    def link(self, text: str, url: str) -> str:
+        if self.as_html:
+            return f'<a href="{html.escape(url)}">{text}</a>'
+        return f'[{text}]({_escape_mdv2_url(url)})'
+
+    def quote(self, text: str) -> str:
+        if self.as_html:
+            return f'<blockquote>{text}</blockquote>'
+        return f'>{text}'
+
+    def fence_open(self, language: str) -> str:
+        if not self.as_html:
+            return f'```{language}'
+        if language:
+            return f'<pre><code class="language-{html.escape(language)}">'
+        return '<pre><code>'
+
+    def fence_close(self) -> str:
+        return '</code></pre>' if self.as_html else '```'
+
+    def fence_line(self, text: str) -> str:
+        if self.as_html:
+            return html.escape(text, quote=False)
+        return _escape_mdv2_code(text)
+
+    def inline(self, text: str, *, in_italic: bool = False) -> str:
+        """Render inline GitHub Markdown, escaping everything else.
+
+        Italic nested in italic is rendered without its markers: in
+        MarkdownV2 the `__` where both end (or start) would be read as
+        underline.
+        """
+
+        result: list[str] = []
+        position = 0
+        for mo in _INLINE.finditer(text):
+            result.append(self.escape(text[position : mo.start()]))
+            position = mo.end()
+
+            if mo.group('code') is not None:
+                result.append(self.inline_code(mo.group('code_text').strip()))
+            elif mo.group('image_url') is not None:
+                label = mo.group('image_text') or mo.group('image_url')
+                result.append(
+                    self.link(self.escape(label), mo.group('image_url'))
+                )
+            elif mo.group('link_url') is not None:
+                label = self.escape(mo.group('link_text'))
+                result.append(self.link(label, mo.group('link_url')))
+            elif mo.group('autolink') is not None:
+                url = mo.group('autolink')
+                result.append(self.link(self.escape(url), url))
+            elif mo.group('bold_text') is not None:
+                inner = self.inline(mo.group('bold_text'), in_italic=in_italic)
+                result.append(self.bold(inner))
+            elif mo.group('strike_text') is not None:
+                inner = self.inline(
+                    mo.group('strike_text'), in_italic=in_italic
+                )
+                result.append(self.strike(inner))
+            elif (italic := mo.group('star_text')) is not None or (
+                italic := mo.group('under_text')
+            ) is not None:
+                inner = self.inline(italic, in_italic=True)
+                result.append(inner if in_italic else self.italic(inner))
+            else:
+                user = mo.group('mention')
+                result.append(
+                    self.link(self.escape(f'@{user}'), f'{GITHUB_URL}/{user}')
+                )
+
+        result.append(self.escape(text[position:]))
+        return ''.join(result)
+
+
+# 输出行的类型
+_TEXT, _BLANK, _OPEN, _CODE, _CLOSE = range(5)
+
+_Wrap = Callable[[str], str]
+
+
+def _plain(text: str) -> str:
+    return text
+
+
+def _blocks(
+    source: str,
+    renderer: _Renderer,
+) -> Iterator[tuple[int, str, str, _Wrap]]:
+    """Yield `(kind, rendered, plain, wrap)`, one per output line.
+
+    `plain` is the escaped raw text of the line and is only used when
+    the rendered form does not fit in the remaining budget: it is cut
+    first and then passed to `wrap`, which adds the entity of the line,
+    so a cut heading or quote is still closed.
+    """
+
+    source = _HTML_COMMENT.sub('', source.replace('\r\n', '\n'))
+    fence: str | None = None
+
+    for raw in source.split('\n'):
+        if fence is not None:
+            mo = _FENCE.match(raw)
+            if mo and mo.group(1).startswith(fence) and not mo.group(2):
+                fence = None
+                yield _CLOSE, renderer.fence_close(), '', _plain
+            else:
+                yield _CODE, renderer.fence_line(raw), '', _plain
+            continue
+
+        if mo := _FENCE.match(raw):
+            fence = mo.group(1)
+            yield _OPEN, renderer.fence_open(mo.group(2)), '', _plain
+            continue
+
+        line = _HTML_TAG.sub('', raw).rstrip()
+        if not line.strip():
+            yield _BLANK, '', '', _plain
+            continue
+
+        if _RULE.match(line):
+            yield _TEXT, renderer.escape('——————'), '', _plain
+        elif _TABLE_DELIMITER.match(line) and '-' in line:
+            continue
+        elif mo := _HEADING.match(line):
+            text = mo.group(2)
+            yield (
+                _TEXT,
+                renderer.bold(renderer.inline(text)),
+                renderer.escape(text),
+                renderer.bold,
+            )
+        elif mo := _BULLET.match(line):
+            indent = '  ' * (len(mo.group(1).expandtabs(4)) // 2)
+            marker = {None: '•', ' ': '☐'}.get(mo.group(2), '☑')
+            prefix = renderer.escape(f'{indent}{marker} ')
+            yield (
+                _TEXT,
+                prefix + renderer.inline(mo.group(3)),
+                prefix + renderer.escape(mo.group(3)),
+                _plain,
+            )
+        elif mo := _ORDERED.match(line):
+            indent = '  ' * (len(mo.group(1).expandtabs(4)) // 2)
+            prefix = renderer.escape(f'{indent}{mo.group(2)}. ')
+            yield (
+                _TEXT,
+                prefix + renderer.inline(mo.group(3)),
+                prefix + renderer.escape(mo.group(3)),
+                _plain,
+            )
+        elif mo := _QUOTE.match(line):
+            yield (
+                _TEXT,
+                renderer.quote(renderer.inline(mo.group(1))),
+                renderer.escape(mo.group(1)),
+                renderer.quote,
+            )
+        else:
+            line = line.strip()
+            yield (
+                _TEXT,
+                renderer.inline(line),
+                renderer.escape(line),
+                _plain,
+            )
+
+    if fence is not None:
+        yield _CLOSE, renderer.fence_close(), '', _plain
+
+
+def _cut(text: str, size: int, as_html: bool) -> str:
+    """Cut already escaped text without splitting an escape sequence."""
+
+    if size <= 0:
+        return ''
+    cut = text[:size]
+    if as_html:
+        if (amp := cut.rfind('&')) > cut.rfind(';'):
+            cut = cut[:amp]
+        return cut
+    # 去掉末尾落单的转义符
+    trailing = len(cut) - len(cut.rstrip('\\'))
+    return cut[:-1] if trailing % 2 else cut
+
+
+def github_markdown_to_telegram(
+    source: str,
+    *,
+    limit: int = MessageLimit.MAX_TEXT_LENGTH,
+    as_html: bool = IS_HTML,
+) -> str:
+    """Convert GitHub Markdown into Telegram MarkdownV2 or HTML.
+
+    The result is at most `limit` characters long, empty when `limit` is
+    not positive. When the source does not fit, it is cut at a line
+    boundary, an open code block is closed and an ellipsis is appended.
+    """
+
+    if limit <= 0:
+        return ''
+
+    renderer = _Renderer(as_html)
+    ellipsis = renderer.escape(ELLIPSIS)
+    closing = renderer.fence_close()
+
+    lines: list[tuple[int, str]] = []
+    size = 0
+    in_fence = False
+
+    for kind, rendered, plain, wrap in _blocks(source, renderer):
+        # 合并连续空行
+        if kind == _BLANK and (not lines or lines[-1][0] == _BLANK):
+            continue
+
+        # 预留出关闭代码块和省略号的位置
+        reserved = len(ellipsis) + 1
+        if in_fence or kind == _OPEN:
+            reserved += len(closing) + 1
+
+        needed = len(rendered) + 1
+        if kind != _CLOSE and size + needed + reserved > limit:
+            remaining = limit - size - reserved - 1
+            # 先截断文本再加上实体的标记, 保证标记成对
+            markup = len(wrap(''))
+            if kind == _TEXT and (
+                cut := _cut(plain, remaining - markup, as_html)
+            ):
+                lines.append((_TEXT, wrap(cut)))
+            elif kind == _CODE and (cut := _cut(rendered, remaining, as_html)):
+                lines.append((_CODE, cut))
+            if in_fence:
+                lines.append((_CLOSE, closing))
+            lines.append((_TEXT, ellipsis))
+            break
+
+        lines.append((kind, rendered))
+        size += needed
+        if kind == _OPEN:
+            in_fence = True
+        elif kind == _CLOSE:
+            in_fence = False
+
+    while lines and lines[-1][0] == _BLANK:
+        lines.pop()
+
+    result: list[str] = []
+    previous = None
+    for kind, rendered in lines:
+        # HTML 的 <pre> 标签和代码之间不需要换行
+        if result and not (as_html and (previous == _OPEN or kind == _CLOSE)):
+            result.append('\n')
+        result.append(rendered)
+        previous = kind
+    return ''.join(result)
+
+
+_cache: OrderedDict[tuple[int, bytes, int, bool], str] = OrderedDict()
+CACHE_SIZE = 256
+
+
+def render_release_body(
+    release_id: int,
+    body: str | None,
+    *,
+    limit: int = MessageLimit.MAX_TEXT_LENGTH,
+    as_html: bool = IS_HTML,
+) -> str:
+    """Convert a release body, memoized by release id and body digest.
+
+    `edited` deliveries that do not touch the body and repeated sends of
+    the same release reuse the previous conversion.
+    """
+
+    if not body:
+        return ''
+
+    digest = hashlib.blake2b(body.encode(), digest_size=16).digest()
+    key = (release_id, digest, limit, as_html)
+    if (result := _cache.get(key)) is not None:
+        _cache.move_to_end(key)
+        return result
+
+    result = github_markdown_to_telegram(body, limit=limit, as_html=as_html)
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
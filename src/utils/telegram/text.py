@@ -15,7 +15,7 @@ def link(text: Any, url: str):
 
 
 def delete(text: Any):
-    return f'<del>{text}</del>' if IS_HTML else f'~~{text}~~'
+    return f'<del>{text}</del>' if IS_HTML else f'~{text}~'
 
 
 def inline_code(text: Any):
@@ -29,11 +29,11 @@ def code(text: Any):
 
 
 def bold(text: Any):
-    return f'<b>{text}</b>' if IS_HTML else f'**{text}**'
+    return f'<b>{text}</b>' if IS_HTML else f'*{text}*'
 
 
 def italic(text: Any):
-    return f'<i>{text}</i>' if IS_HTML else f'*{text}*'
+    return f'<i>{text}</i>' if IS_HTML else f'_{text}_'
 
 
 def underline(text: Any):
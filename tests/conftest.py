@@ -0,0 +1,11 @@
+import os
+
+
+# 导入 src 前提供必填的配置
+for name, value in {
+    'FASTAPI_TELEGRAM_TOKEN': '1:token',
+    'FASTAPI_TELEGRAM_ADMIN_CHAT_ID': '1',
+    'FASTAPI_DOMAIN': 'https://example.com',
+    'FASTAPI_GITHUB_WEBHOOK_SECRET': 'secret',
+}.items():
+    os.environ.setdefault(name, value)
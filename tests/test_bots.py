@@ -0,0 +1,25 @@
+import pytest
+
+from src.config import BotSettings
+from src.exceptions import ServiceUnavailableError
+from src.ptb.bots import BotRegistry
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return 'asyncio'
+
+
+@pytest.mark.anyio
+async def test_closed_registry_starts_no_bot():
+    registry = BotRegistry(
+        {'other': BotSettings(token='2:token', admin_chat_id=2)},
+        max_active=1,
+        idle_timeout=60,
+        pool_size=1,
+    )
+
+    assert await registry.drain(0) == {}
+
+    with pytest.raises(ServiceUnavailableError):
+        await registry.get('other')
@@ -0,0 +1,50 @@
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from src.ptb.callback_data import CallbackDataStore
+from src.ptb.handlers import CALLBACK_DATA_LIMIT, _release_page_data
+
+
+def test_workers_share_keys(tmp_path: Path):
+    # 两个 worker 各自打开同一个数据库
+    first = CallbackDataStore(tmp_path / 'releases.sqlite3', max_size=2)
+    second = CallbackDataStore(tmp_path / 'releases.sqlite3', max_size=2)
+
+    key = first.put('owner/repo')
+
+    assert second.put('owner/repo') == key
+    assert second.get(key) == 'owner/repo'
+    assert second.get('missing') is None
+
+
+def test_least_recently_used_is_evicted(tmp_path: Path):
+    store = CallbackDataStore(tmp_path / 'releases.sqlite3', max_size=2)
+    a, b = store.put('a'), store.put('b')
+    store.get(a)
+
+    store.put('c')
+
+    assert store.get(a) == 'a'
+    assert store.get(b) is None
+
+
+def test_short_repository_is_carried_in_the_button():
+    data = _release_page_data('owner/repo', 2)
+
+    assert dict(parse_qsl(data, keep_blank_values=True)) == {
+        'releases': '',
+        'repo': 'owner/repo',
+        'page': '2',
+    }
+
+
+def test_long_repository_is_carried_by_key(tmp_path: Path, monkeypatch):
+    store = CallbackDataStore(tmp_path / 'releases.sqlite3', max_size=2)
+    monkeypatch.setattr('src.ptb.handlers.callback_data', store)
+    repo = 'owner/' + 'r' * 60
+
+    data = _release_page_data(repo, 2)
+
+    assert len(data.encode()) <= CALLBACK_DATA_LIMIT
+    params = dict(parse_qsl(data, keep_blank_values=True))
+    assert store.get(params['key']) == repo
@@ -0,0 +1,65 @@
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from src.captures import Capture, CaptureMiddleware, RequestCaptures
+
+
+def _capture(path: str) -> Capture:
+    return Capture(
+        id=None,
+        time=0,
+        method='GET',
+        path=path,
+        ip='127.0.0.1',
+        headers=[('host', 'example.com')],
+        status=200,
+        response_start=None,
+        duration=0,
+    )
+
+
+def test_workers_share_captures(tmp_path: Path):
+    # 两个 worker 各自打开同一个数据库
+    first = RequestCaptures(tmp_path / 'captures.sqlite3', size=3)
+    second = RequestCaptures(tmp_path / 'captures.sqlite3', size=3)
+
+    ids = [
+        (first if i % 2 else second).add(_capture(f'/{i}')) for i in range(5)
+    ]
+
+    assert len(set(ids)) == 5
+    assert [i.path for i in first.recent()] == ['/4', '/3', '/2']
+    assert [i.path for i in second.recent(before=ids[3])] == ['/2']
+    assert second.get(ids[1]) is None
+    assert first.get(ids[4]) == second.get(ids[4])
+    assert first.get(ids[4]).headers == [('host', 'example.com')]
+
+
+def test_reserved_id_is_shown_once_answered(tmp_path: Path):
+    captures = RequestCaptures(tmp_path / 'captures.sqlite3', size=10)
+    app = FastAPI()
+
+    @app.post('/check')
+    async def check(req: Request) -> dict:
+        await req.body()
+        # 响应之前不会出现在 /recent 中
+        assert captures.recent() == []
+        return {'capture_id': req.state.capture_id}
+
+    app.add_middleware(
+        CaptureMiddleware,
+        captures=captures,
+        sample_rate=0,
+        body_preview=4,
+        always=['/check'],
+    )
+
+    response = TestClient(app).post('/check', content=b'payload')
+
+    capture = captures.get(response.json()['capture_id'])
+    assert capture is not None
+    assert capture.path == '/check'
+    assert capture.body_size == 7
+    assert capture.body_preview == b'payl'
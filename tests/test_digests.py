@@ -0,0 +1,66 @@
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+import pytest
+
+from src.ptb.digests import PERIOD_LENGTH, DigestPeriod, DigestStore
+from src.ptb.models import StoredRelease
+from src.ptb.release_store import ReleaseStore
+
+
+def _release(id_: int) -> StoredRelease:
+    return StoredRelease(
+        id=id_,
+        repository='owner/repo',
+        tag=f'v{id_}',
+        html_url=f'https://github.com/owner/repo/releases/v{id_}',
+        published_at=datetime.now(UTC),
+    )
+
+
+@pytest.fixture
+def store(tmp_path: Path, monkeypatch) -> DigestStore:
+    monkeypatch.setattr(
+        'src.ptb.digests.release_store',
+        ReleaseStore(
+            tmp_path / 'releases.sqlite3', batch_size=1, flush_interval=1
+        ),
+    )
+    return DigestStore(tmp_path / 'digests.sqlite3')
+
+
+def _due() -> float:
+    return time.time() + PERIOD_LENGTH[DigestPeriod.DAILY].total_seconds()
+
+
+def test_released_digest_is_sent_again(store: DigestStore):
+    store.record(_release(1))
+    end = _due()
+
+    digest = store.claim(DigestPeriod.DAILY, end)
+    assert digest is not None
+    # 其他 worker 不会在发送期间再次领取
+    assert store.claim(DigestPeriod.DAILY, end) is None
+    store.release(digest)
+
+    again = store.claim(DigestPeriod.DAILY, end)
+    assert again is not None
+    assert [i.release_id for i in again.entries] == [1]
+
+
+def test_completed_digest_keeps_releases_recorded_meanwhile(
+    store: DigestStore,
+):
+    store.record(_release(1))
+    end = _due()
+    digest = store.claim(DigestPeriod.DAILY, end)
+    assert digest is not None
+
+    store.record(_release(2))
+    store.complete(digest)
+
+    assert store.claim(DigestPeriod.DAILY, end) is None
+    later = store.claim(DigestPeriod.DAILY, end + 86400)
+    assert later is not None
+    assert [i.release_id for i in later.entries] == [2]
@@ -0,0 +1,184 @@
+from collections.abc import Callable
+from pathlib import Path
+
+import httpx
+import orjson
+import pytest
+
+from src.ptb.github_poller import POLL_ERRORS, ReleasePoller
+from src.ptb.release_store import ReleaseStore
+
+
+REPOSITORY = 'owner/repo'
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return 'asyncio'
+
+
+def _release(id_: int, day: int) -> dict:
+    return {
+        'id': id_,
+        'tag_name': f'v{id_}',
+        'name': f'Release {id_}',
+        'html_url': f'https://github.com/{REPOSITORY}/releases/v{id_}',
+        'draft': False,
+        'prerelease': False,
+        'published_at': f'2026-10-{day:02}T00:00:00Z',
+        'assets': [],
+    }
+
+
+class GitHub:
+    """Answer the release list requests of the poller."""
+
+    def __init__(self) -> None:
+        self.respond: Callable[[httpx.Request], httpx.Response] = lambda _: (
+            httpx.Response(200, json=[])
+        )
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return self.respond(request)
+
+    def releases(self, *releases: dict, etag: str = '"v1"') -> None:
+        # GitHub 返回的列表中最新的在最前面
+        self.respond = lambda _: httpx.Response(
+            200, json=list(releases), headers={'ETag': etag}
+        )
+
+
+@pytest.fixture
+def github(monkeypatch) -> GitHub:
+    github = GitHub()
+    client = httpx.AsyncClient(
+        base_url='https://api.github.com',
+        transport=httpx.MockTransport(github),
+    )
+    monkeypatch.setattr(
+        'src.ptb.github_poller.github.get_client', lambda: client
+    )
+    return github
+
+
+@pytest.fixture
+def published(monkeypatch) -> list[dict]:
+    published = []
+
+    async def publish_release(data: dict) -> None:
+        published.append(data)
+
+    monkeypatch.setattr(
+        'src.ptb.github_poller.publish_release', publish_release
+    )
+    return published
+
+
+@pytest.fixture
+def poller(tmp_path: Path, monkeypatch) -> ReleasePoller:
+    monkeypatch.setattr(
+        'src.ptb.github_poller.release_store',
+        ReleaseStore(
+            tmp_path / 'releases.sqlite3', batch_size=1, flush_interval=1
+        ),
+    )
+    return ReleasePoller(
+        tmp_path / 'github_poller.sqlite3',
+        repositories=[REPOSITORY],
+        min_interval=60,
+        max_interval=3600,
+    )
+
+
+@pytest.mark.anyio
+async def test_first_poll_only_records(
+    poller: ReleasePoller, github: GitHub, published: list[dict]
+):
+    github.releases(_release(2, 2), _release(1, 1))
+
+    await poller.poll(REPOSITORY)
+
+    assert published == []
+    github.releases(_release(3, 3), _release(2, 2), _release(1, 1))
+    await poller.poll(REPOSITORY)
+    assert [i['release']['id'] for i in published] == [3]
+
+
+@pytest.mark.anyio
+async def test_new_releases_are_published_oldest_first(
+    poller: ReleasePoller, github: GitHub, published: list[dict]
+):
+    github.releases(_release(1, 1))
+    await poller.poll(REPOSITORY)
+
+    github.releases(_release(4, 4), _release(3, 3), _release(2, 2))
+    state = await poller.poll(REPOSITORY)
+
+    assert [i['release']['id'] for i in published] == [2, 3, 4]
+    assert published[0]['repository']['full_name'] == REPOSITORY
+    # 有新 release 时很快再次轮询
+    assert state.interval == poller.min_interval
+
+
+@pytest.mark.anyio
+async def test_not_modified_reuses_etag_and_backs_off(
+    poller: ReleasePoller, github: GitHub, published: list[dict]
+):
+    github.releases(_release(2, 2), _release(1, 1), etag='"v1"')
+    await poller.poll(REPOSITORY)
+    github.releases(_release(3, 3), _release(2, 2), _release(1, 1))
+    first = await poller.poll(REPOSITORY)
+    github.respond = lambda _: httpx.Response(304)
+
+    second = await poller.poll(REPOSITORY)
+    third = await poller.poll(REPOSITORY)
+
+    assert github.requests[-1].headers['If-None-Match'] == '"v1"'
+    assert second.etag == '"v1"'
+    assert first.interval < second.interval < third.interval
+    assert third.interval <= third.cadence
+    assert len(published) == 1
+
+
+@pytest.mark.anyio
+async def test_missing_repository_is_polled_rarely(
+    poller: ReleasePoller, github: GitHub, published: list[dict]
+):
+    github.respond = lambda _: httpx.Response(404)
+
+    state = await poller.poll(REPOSITORY)
+
+    assert state.etag is None
+    assert state.interval == poller.max_interval
+    assert poller.state(REPOSITORY) == state
+    assert published == []
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    'content',
+    [
+        b'<html>',
+        orjson.dumps([{'id': 3}, _release(2, 2)]),
+        orjson.dumps({'message': 'x'}),
+    ],
+    ids=['not-json', 'incomplete-release', 'not-a-list'],
+)
+async def test_malformed_payload_is_retried(
+    poller: ReleasePoller,
+    github: GitHub,
+    published: list[dict],
+    content: bytes,
+):
+    github.releases(_release(1, 1))
+    await poller.poll(REPOSITORY)
+    before = poller.state(REPOSITORY)
+    github.respond = lambda _: httpx.Response(200, content=content)
+
+    with pytest.raises(POLL_ERRORS):
+        await poller.poll(REPOSITORY)
+
+    assert poller.state(REPOSITORY) == before
+    assert published == []
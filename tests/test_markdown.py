@@ -0,0 +1,172 @@
+from html.parser import HTMLParser
+
+import pytest
+
+from src.utils.telegram.markdown import github_markdown_to_telegram
+
+
+@pytest.mark.parametrize(
+    ('source', 'as_html', 'opening', 'closing'),
+    [
+        ('intro\n\n# ' + 'word ' * 200, False, '*', '*'),
+        ('intro\n\n# ' + 'word ' * 200, True, '<b>', '</b>'),
+        ('intro\n\n> ' + 'a.b ' * 200, False, '>', ''),
+        ('intro\n\n> ' + 'a&b ' * 200, True, '<blockquote>', '</blockquote>'),
+    ],
+    ids=['heading', 'heading-html', 'quote', 'quote-html'],
+)
+def test_truncated_line_keeps_its_entity_closed(
+    source: str, as_html: bool, opening: str, closing: str
+):
+    result = github_markdown_to_telegram(source, limit=60, as_html=as_html)
+
+    assert len(result) <= 60
+    *_, cut, ellipsis = result.split('\n')
+    assert ellipsis == '…'
+    assert cut.startswith(opening)
+    assert cut.endswith(closing)
+    assert len(cut) > len(opening) + len(closing)
+    if as_html:
+        # 不截断 HTML 实体
+        assert cut.count('&') == cut.count('&amp;')
+    else:
+        # 不留下落单的转义符
+        assert not cut.removesuffix(closing).endswith('\\')
+
+
+# MarkdownV2 中需要转义的字符, 实体的标记除外
+_RESERVED = set('[]()>#+-=|{}.!')
+
+
+def _mdv2_entities_closed(text: str) -> bool:
+    """Whether Telegram can parse the entities of `text`: every entity
+    is closed, in the order it was opened."""
+
+    stack: list[str] = []
+
+    def toggle(marker: str) -> bool:
+        if stack and stack[-1] == marker:
+            stack.pop()
+        elif marker in stack:
+            return False
+        else:
+            stack.append(marker)
+        return True
+
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\':
+            i += 2
+        elif char == '`':
+            fence = '```' if text.startswith('```', i) else '`'
+            i += len(fence)
+            while not text.startswith(fence, i):
+                if i >= len(text):
+                    return False
+                i += 2 if text[i] == '\\' else 1
+            i += len(fence)
+        elif text.startswith('__', i):
+            if not toggle('__'):
+                return False
+            i += 2
+        elif char in '_*~':
+            if not toggle(char):
+                return False
+            i += 1
+        elif char == '[':
+            stack.append('[')
+            i += 1
+        elif char == ']':
+            if not stack or stack.pop() != '[' or text[i + 1 : i + 2] != '(':
+                return False
+            i += 2
+            while text[i] != ')':
+                i += 2 if text[i] == '\\' else 1
+            i += 1
+        elif char == '>' and (i == 0 or text[i - 1] == '\n'):
+            i += 1
+        elif char in _RESERVED:
+            return False
+        else:
+            i += 1
+    return not stack
+
+
+class _TagChecker(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.stack: list[str] = []
+        self.valid = True
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack.pop() != tag:
+            self.valid = False
+
+
+def _html_tags_closed(text: str) -> bool:
+    checker = _TagChecker()
+    checker.feed(text)
+    checker.close()
+    return checker.valid and not checker.stack
+
+
+EMPHASIS = [
+    # 嵌套
+    '_see *this*_',
+    '*a _b_*',
+    '*_a_ b*',
+    '_a *b*_',
+    '_**b _c_**_',
+    '**a *b* c**',
+    '*a **b** c*',
+    '__a _b_ c__',
+    '_a __b__ c_',
+    '~~a *b*~~',
+    '*a ~~b~~*',
+    '~~_a_~~',
+    '_~~a~~_',
+    '**~~_a_~~**',
+    '_a ~~b *c*~~_',
+    # 相邻
+    '*a*_b_',
+    '_a_*b*',
+    '_a__b_',
+    '*a**b*',
+    '**a**_b_',
+    '_a_**b**',
+    '~~a~~_b_',
+    '_a_~~b~~',
+    '__a___b_',
+    '_a___b__',
+    '*a* _b_',
+    '_a_ *b*',
+]
+
+
+@pytest.mark.parametrize('source', EMPHASIS)
+def test_emphasis_entities_are_closed(source: str):
+    assert _mdv2_entities_closed(
+        github_markdown_to_telegram(source, as_html=False)
+    )
+    assert _html_tags_closed(github_markdown_to_telegram(source, as_html=True))
+
+
+@pytest.mark.parametrize(
+    ('source', 'expected'),
+    [
+        ('_see *this*_', '_see this_'),
+        ('*a _b_*', '_a b_'),
+        ('**a _b_**', '*a _b_*'),
+    ],
+)
+def test_nested_italic_is_flattened(source: str, expected: str):
+    assert github_markdown_to_telegram(source, as_html=False) == expected
+
+
+@pytest.mark.parametrize('limit', [0, -1])
+def test_no_room_gives_empty_text(limit: int):
+    assert github_markdown_to_telegram('# title', limit=limit) == ''
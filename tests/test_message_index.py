@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from src.ptb.message_index import MessageIndex
+
+
+def test_old_entries_are_purged_while_running(tmp_path: Path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr('src.ptb.message_index.time.time', lambda: now)
+    index = MessageIndex(
+        tmp_path / 'messages.sqlite3', retention=60, purge_every=2
+    )
+    index.add(1, chat_id=10, message_id=100)
+
+    now += 120
+    index.add(2, chat_id=10, message_id=200)
+
+    (count,) = index.connection.execute(
+        'SELECT count(*) FROM release_message'
+    ).fetchone()
+    assert count == 1
+    assert index.get(1) == ()
+    assert index.get(2) == ((10, 200),)
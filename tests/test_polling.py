@@ -0,0 +1,72 @@
+from pathlib import Path
+
+import pytest
+from telegram.error import NetworkError
+
+from src.ptb.polling import MAX_BATCH_SIZE, MIN_BATCH_SIZE, Poller
+from src.ptb.update_queue import create_update_queue
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return 'asyncio'
+
+
+class BacklogDrainedError(Exception):
+    pass
+
+
+class Update:
+    effective_chat = None
+
+    def __init__(self, update_id: int) -> None:
+        self.update_id = update_id
+
+
+class Bot:
+    """Fail `deleteWebhook` a few times, then hand out `backlog` updates
+    and stop the poller once they are all taken."""
+
+    def __init__(self, *, backlog: int, failures: int) -> None:
+        self.backlog = backlog
+        self.failures = failures
+        self.deleted = 0
+        self.limits: list[int] = []
+
+    async def delete_webhook(self) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise NetworkError('connection reset')
+        self.deleted += 1
+
+    async def get_updates(self, *, offset, limit, **_) -> list[Update]:
+        offset = offset or 0
+        if offset >= self.backlog:
+            raise BacklogDrainedError
+        self.limits.append(limit)
+        return [
+            Update(i) for i in range(offset, min(offset + limit, self.backlog))
+        ]
+
+
+@pytest.mark.anyio
+async def test_delete_webhook_is_retried_and_batches_grow(
+    tmp_path: Path, monkeypatch
+):
+    async def sleep(_):
+        pass
+
+    monkeypatch.setattr('src.ptb.polling.asyncio.sleep', sleep)
+    bot = Bot(backlog=300, failures=2)
+    queue = create_update_queue()
+    poller = Poller(bot, queue, data_dir=tmp_path, timeout=0)  # type: ignore
+
+    with pytest.raises(BacklogDrainedError):
+        await poller._poll()
+
+    assert bot.deleted == 1
+    assert queue.qsize() == 300
+    assert poller.load_offset() == 300
+    assert bot.limits[0] == MIN_BATCH_SIZE
+    assert max(bot.limits) == MAX_BATCH_SIZE
+    assert bot.limits == sorted(bot.limits)
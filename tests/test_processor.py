@@ -0,0 +1,67 @@
+import asyncio
+from collections import Counter, defaultdict
+
+import pytest
+
+from src.ptb.models import WebhookUpdate
+from src.ptb.processor import KeyedUpdateProcessor
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return 'asyncio'
+
+
+class Tracker:
+    """Record how many updates run at the same time, per key and overall."""
+
+    def __init__(self) -> None:
+        self.running: Counter[str] = Counter()
+        self.max_per_key: Counter[str] = Counter()
+        self.max_total = 0
+        self.order: defaultdict[str, list[int]] = defaultdict(list)
+
+    async def handle(self, key: str, index: int) -> None:
+        self.running[key] += 1
+        self.max_per_key[key] = max(self.max_per_key[key], self.running[key])
+        self.max_total = max(self.max_total, self.running.total())
+        await asyncio.sleep(0.01)
+        self.order[key].append(index)
+        self.running[key] -= 1
+
+
+async def _process(
+    processor: KeyedUpdateProcessor, tracker: Tracker, keys: list[str]
+) -> None:
+    await asyncio.gather(
+        *(
+            processor.do_process_update(
+                WebhookUpdate('release', repository=key),
+                tracker.handle(key, index),
+            )
+            for index, key in enumerate(keys)
+        )
+    )
+
+
+@pytest.mark.anyio
+async def test_same_key_runs_in_order_different_keys_concurrently():
+    processor = KeyedUpdateProcessor(workers=4, buffer_size=8)
+    tracker = Tracker()
+    keys = ['a', 'b', 'a', 'b', 'a', 'c']
+
+    await _process(processor, tracker, keys)
+
+    assert tracker.max_per_key == {'a': 1, 'b': 1, 'c': 1}
+    assert tracker.max_total == 3
+    assert tracker.order == {'a': [0, 2, 4], 'b': [1, 3], 'c': [5]}
+
+
+@pytest.mark.anyio
+async def test_workers_limit_concurrency():
+    processor = KeyedUpdateProcessor(workers=2, buffer_size=8)
+    tracker = Tracker()
+
+    await _process(processor, tracker, ['a', 'b', 'c', 'd'])
+
+    assert tracker.max_total == 2
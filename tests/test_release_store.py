@@ -0,0 +1,33 @@
+from datetime import UTC, datetime
+from pathlib import Path
+
+from src.ptb.models import StoredRelease
+from src.ptb.release_store import ReleaseStore
+
+
+def _release(id_: int, name: str) -> StoredRelease:
+    return StoredRelease(
+        id=id_,
+        repository='owner/repo',
+        tag=f'v{id_}',
+        name=name,
+        html_url=f'https://github.com/owner/repo/releases/v{id_}',
+        published_at=datetime.now(UTC),
+    )
+
+
+def test_workers_share_the_search_index(tmp_path: Path):
+    # 两个 worker 各自打开同一个数据库, 都会执行建表语句
+    first = ReleaseStore(
+        tmp_path / 'releases.sqlite3', batch_size=10, flush_interval=1
+    )
+    second = ReleaseStore(
+        tmp_path / 'releases.sqlite3', batch_size=10, flush_interval=1
+    )
+
+    first.add(_release(1, 'Faster search'), bot='a')
+    first.add(_release(2, 'Faster digests'), bot='b')
+    first.flush()
+
+    hits = second.search('fast', bot='a')
+    assert [i.release.id for i in hits] == [1]
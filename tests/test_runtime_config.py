@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from src.config import settings
+from src.runtime_config import ConfigWatcher, RuntimeConfig
+
+
+@pytest.fixture
+def watcher(tmp_path: Path, monkeypatch) -> ConfigWatcher:
+    # compose 把 .env.prod 挂载为工作目录中的 .env
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('FASTAPI_ALLOW_ORIGINS', raising=False)
+    return ConfigWatcher(
+        RuntimeConfig.from_settings(settings),
+        files=[tmp_path / '.env'],
+        interval=1,
+    )
+
+
+def test_reloads_the_mounted_env_file(watcher: ConfigWatcher):
+    Path('.env').write_text('FASTAPI_ALLOW_ORIGINS=["https://a.example"]\n')
+
+    assert watcher.reload()
+
+    assert watcher.current.allow_origins == {'https://a.example'}
+    assert watcher.reloads == 1
+
+
+def test_environment_takes_precedence(watcher: ConfigWatcher, monkeypatch):
+    monkeypatch.setenv('FASTAPI_ALLOW_ORIGINS', '["https://b.example"]')
+    Path('.env').write_text('FASTAPI_ALLOW_ORIGINS=["https://a.example"]\n')
+
+    assert watcher.reload()
+
+    assert watcher.current.allow_origins == {'https://b.example'}
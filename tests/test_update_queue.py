@@ -0,0 +1,90 @@
+from collections import Counter
+
+import pytest
+
+from src.exceptions import ServiceUnavailableError
+from src.ptb.models import UpdateSource, WebhookUpdate
+from src.ptb.update_queue import Lane, UpdateQueue, update_source
+
+
+def _queue(*, max_size: int = 100, limit: int = 100) -> UpdateQueue:
+    return UpdateQueue(
+        max_size=max_size,
+        lanes={
+            UpdateSource.TELEGRAM: Lane(weight=3, limit=limit),
+            UpdateSource.GITHUB: Lane(weight=1, limit=limit),
+        },
+        retry_after=30,
+    )
+
+
+def _github() -> WebhookUpdate:
+    return WebhookUpdate('release')
+
+
+def test_lanes_are_served_by_weight():
+    queue = _queue()
+    # GitHub 的更新先到, 也不会挡住 Telegram 的更新
+    for _ in range(8):
+        queue.put_nowait(_github())
+    for _ in range(8):
+        queue.put_nowait(object())
+
+    sources = [update_source(queue.get_nowait()) for _ in range(8)]
+
+    for start in range(0, 8, 4):
+        assert Counter(sources[start : start + 4]) == {
+            UpdateSource.TELEGRAM: 3,
+            UpdateSource.GITHUB: 1,
+        }
+    assert queue.qsize() == 8
+
+
+def test_low_weight_lane_is_drained_alone():
+    queue = _queue()
+    for _ in range(3):
+        queue.put_nowait(_github())
+
+    assert [update_source(queue.get_nowait()) for _ in range(3)] == [
+        UpdateSource.GITHUB
+    ] * 3
+    assert queue.empty()
+
+
+def test_full_lane_only_rejects_its_source():
+    queue = _queue(limit=2)
+    queue.put_nowait(_github())
+    queue.admit(UpdateSource.GITHUB)
+    queue.put_nowait(_github())
+
+    assert queue.is_full(UpdateSource.GITHUB)
+    with pytest.raises(ServiceUnavailableError):
+        queue.admit(UpdateSource.GITHUB)
+    queue.admit(UpdateSource.TELEGRAM)
+    assert queue.rejected == {UpdateSource.GITHUB: 1}
+
+    queue.get_nowait()
+    queue.admit(UpdateSource.GITHUB)
+
+
+def test_full_queue_rejects_every_source():
+    queue = _queue(max_size=2)
+    queue.put_nowait(_github())
+    queue.put_nowait(object())
+
+    for source in UpdateSource:
+        assert queue.is_full(source)
+        with pytest.raises(ServiceUnavailableError):
+            queue.admit(source)
+
+
+def test_closed_queue_rejects_and_hands_over_the_backlog():
+    queue = _queue()
+    update = _github()
+    queue.put_nowait(update)
+    queue.close()
+
+    with pytest.raises(ServiceUnavailableError):
+        queue.admit(UpdateSource.TELEGRAM)
+    assert queue.take_all() == [update]
+    assert queue.empty()